@@ -0,0 +1,238 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+from .__init__ import __version__
+
+_logger = logging.getLogger(__name__)
+
+# PGExecute methods whose results are used to populate a PGCompleter. Their
+# results are recorded during a refresh so they can be replayed later without
+# querying the database again. The search path is per session, so it is
+# always read from the live connection.
+CATALOG_METHODS = (
+    "schemata",
+    "tables",
+    "table_columns",
+    "foreignkeys",
+    "views",
+    "view_columns",
+    "datatypes",
+    "databases",
+    "functions",
+)
+
+
+def dsn_key(executor):
+    """Returns a file-name safe key identifying the database `executor` is
+    connected to."""
+    dsn = "{}@{}:{}/{}".format(executor.user, executor.host, executor.port, executor.dbname)
+    return hashlib.sha256(dsn.encode("utf-8")).hexdigest()
+
+
+class RecordingExecutor:
+    """Wraps a PGExecute object and records the results of the catalog
+    queries run through it."""
+
+    def __init__(self, executor):
+        self.executor = executor
+        self.results = {}
+
+    def __getattr__(self, name):
+        attr = getattr(self.executor, name)
+        if name not in CATALOG_METHODS:
+            return attr
+
+        def record(*args, **kwargs):
+            result = self.results[name] = list(attr(*args, **kwargs))
+            return result
+
+        return record
+
+
+class ReplayExecutor:
+    """Stands in for a PGExecute object, answering catalog queries from
+    previously recorded results.
+
+    Anything that wasn't recorded is delegated to the wrapped executor.
+    """
+
+    def __init__(self, results, executor):
+        self.results = results
+        self.executor = executor
+
+    def __getattr__(self, name):
+        if name in self.results:
+            return lambda *args, **kwargs: list(self.results[name])
+        return getattr(self.executor, name)
+
+
+class StreamingExecutor(ReplayExecutor):
+    """Stands in for a PGExecute object, answering catalog queries from a
+    stream of (name, results) tuples, like `PGExecute.pipeline_catalog`.
+
+    The stream is read as results are asked for, so earlier results can be
+    used while later ones are still arriving.
+    """
+
+    def __init__(self, stream, executor):
+        super().__init__({}, executor)
+        self.stream = stream
+
+    def __getattr__(self, name):
+        if name in CATALOG_METHODS:
+            while name not in self.results:
+                key, results = next(self.stream)
+                self.results[key] = results
+        return super().__getattr__(name)
+
+    def close(self):
+        """Reads the rest of the stream."""
+        for name, results in self.stream:
+            self.results[name] = results
+
+
+class CompletionCache:
+    """On-disk cache of the catalog metadata used for auto-completion.
+
+    There is one cache file per database. Each file holds the recorded results
+    of the catalog queries, tagged with the catalog fingerprint taken before
+    they were run (see `PGExecute.catalog_fingerprint`).
+    """
+
+    def __init__(self, cache_dir, executor):
+        self.path = os.path.join(os.path.expanduser(cache_dir), dsn_key(executor) + ".pickle")
+
+    def load(self):
+        """Returns a (fingerprint, results) tuple, or None if there is no
+        usable cache file."""
+        try:
+            with open(self.path, "rb") as f:
+                data = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            _logger.error("Could not read completion cache %r: %r", self.path, e)
+            return None
+
+        if data.get("version") != __version__:
+            # Metadata classes may differ between releases.
+            return None
+        return data["fingerprint"], data["results"]
+
+    def save(self, fingerprint, results):
+        data = {"version": __version__, "fingerprint": fingerprint, "results": results}
+        cache_dir = os.path.dirname(self.path)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            # Write to a temporary file first, so a concurrent pgcli never
+            # reads a partially written cache.
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            _logger.error("Could not write completion cache %r: %r", self.path, e)
+
+
+class CompletionStats:
+    """On-disk keyword and name counts of a PrevalenceCounter, used to rank
+    completions.
+
+    There is one JSON file per database. Counts are halved every
+    `half_life` days, so that recent usage weighs more, and dropped once
+    they get below `min_count`. Several pgcli sessions can add their counts
+    to the same file.
+    """
+
+    min_count = 0.01
+
+    def __init__(self, stats_dir, executor, half_life=30):
+        self.path = os.path.join(os.path.expanduser(stats_dir), dsn_key(executor) + ".json")
+        self.half_life = half_life * 24 * 3600
+
+    def load(self):
+        """Returns (keyword_counts, name_counts) dicts, decayed to now, or None
+        if there is no usable stats file."""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            decay = self._decay(data["updated"])
+            return tuple({k: v * decay for k, v in data[kind].items()} for kind in ("keywords", "names"))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            _logger.error("Could not read completion stats %r: %r", self.path, e)
+            return None
+
+    def save(self, keyword_counts, name_counts):
+        """Adds the given counts to those in the stats file.
+
+        The file is locked from reading to replacing it, so that sessions
+        saving at the same time don't lose each other's counts.
+        """
+        stats_dir = os.path.dirname(self.path)
+        try:
+            os.makedirs(stats_dir, exist_ok=True)
+            with _locked(self.path + ".lock"):
+                counts = self.load() or ({}, {})
+                for saved, new in zip(counts, (keyword_counts, name_counts)):
+                    for key, count in new.items():
+                        saved[key] = saved.get(key, 0) + count
+                data = {"updated": time.time()}
+                for kind, saved in zip(("keywords", "names"), counts):
+                    data[kind] = {k: v for k, v in saved.items() if v >= self.min_count}
+                # Write to a temporary file first, so a concurrent pgcli never
+                # reads partially written stats.
+                fd, tmp_path = tempfile.mkstemp(dir=stats_dir)
+                try:
+                    with os.fdopen(fd, "w", encoding="utf-8") as f:
+                        json.dump(data, f)
+                    os.replace(tmp_path, self.path)
+                except BaseException:
+                    os.unlink(tmp_path)
+                    raise
+        except OSError as e:
+            _logger.error("Could not write completion stats %r: %r", self.path, e)
+
+    def _decay(self, updated):
+        if not self.half_life:
+            return 1
+        return 0.5 ** (max(time.time() - updated, 0) / self.half_life)
+
+
+@contextmanager
+def _locked(path):
+    """Holds an exclusive lock on the file at `path`, created if needed. The
+    lock is released by the system if pgcli dies while holding it."""
+    with open(path, "a") as f:
+        f.seek(0)
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            # Retries for 10 seconds, then raises OSError.
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
@@ -1,8 +1,24 @@
+import logging
 import threading
 import os
+import queue
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg
 
 from .pgcompleter import PGCompleter
+from .completion_cache import (
+    CATALOG_METHODS,
+    CompletionCache,
+    CompletionStats,
+    RecordingExecutor,
+    ReplayExecutor,
+    StreamingExecutor,
+)
+
+
+_logger = logging.getLogger(__name__)
 
 
 class CompletionRefresher:
@@ -11,8 +27,9 @@ class CompletionRefresher:
     def __init__(self):
         self._completer_thread = None
         self._restart_refresh = threading.Event()
+        self._column_loader = None
 
-    def refresh(self, executor, special, callbacks, history=None, settings=None):
+    def refresh(self, executor, special, callbacks, history=None, settings=None, use_cache=False):
         """
         Creates a PGCompleter object and populates it with the relevant
         completion suggestions in a background thread.
@@ -24,6 +41,11 @@ class CompletionRefresher:
         callbacks - A function or a list of functions to call after the thread
                     has completed the refresh. The newly created completion
                     object will be passed in as an argument to each callback.
+        use_cache - If the completion cache is enabled, hand out the cached
+                    completions first, and only run the catalog queries if the
+                    catalog fingerprint changed. Not for refreshes following a
+                    change of the catalog, which the fingerprint may not show
+                    yet: these always run the queries and update the cache.
         """
         if executor.is_virtual_database():
             # do nothing
@@ -35,7 +57,40 @@ class CompletionRefresher:
         else:
             self._completer_thread = threading.Thread(
                 target=self._bg_refresh,
-                args=(executor, special, callbacks, history, settings),
+                args=(executor, special, callbacks, history, settings, use_cache),
+                name="completion_refresh",
+            )
+            self._completer_thread.daemon = True
+            self._completer_thread.start()
+            return [(None, None, None, "Auto-completion refresh started in the background.")]
+
+    def refresh_incremental(self, executor, completer, callbacks, settings=None):
+        """
+        Creates a copy of `completer` in a background thread, updating only
+        the relations and functions that changed since it was populated.
+
+        If `completer` has no catalog snapshot, or the schemas changed, falls
+        back to a full refresh.
+
+        executor - PGExecute object, used to extract the credentials to connect
+                   to the database.
+        completer - PGCompleter object to update.
+        settings - dict of settings for completer object
+        callbacks - A function or a list of functions to call after the thread
+                    has completed the refresh. The updated completion object
+                    will be passed in as an argument to each callback.
+        """
+        if executor.is_virtual_database():
+            # do nothing
+            return [(None, None, None, "Auto-completion refresh can't be started.")]
+
+        if self.is_refreshing():
+            self._restart_refresh.set()
+            return [(None, None, None, "Auto-completion refresh restarted.")]
+        else:
+            self._completer_thread = threading.Thread(
+                target=self._bg_refresh_incremental,
+                args=(executor, completer, callbacks, settings),
                 name="completion_refresh",
             )
             self._completer_thread.daemon = True
@@ -45,9 +100,103 @@ class CompletionRefresher:
     def is_refreshing(self):
         return self._completer_thread and self._completer_thread.is_alive()
 
-    def _bg_refresh(self, pgexecute, special, callbacks, history=None, settings=None):
+    def _bg_refresh(self, pgexecute, special, callbacks, history=None, settings=None, use_cache=False):
+        settings = settings or {}
+
+        if settings.get("single_connection"):
+            executor = pgexecute
+        else:
+            # Create a new pgexecute method to populate the completions.
+            executor = pgexecute.copy()
+        # If callbacks is a single function then push it into a list.
+        if callable(callbacks):
+            callbacks = [callbacks]
+
+        column_loader = self._get_column_loader(pgexecute, settings)
+        cache_dir = settings.get("completion_cache_dir")
+        cache = CompletionCache(cache_dir, executor) if cache_dir else None
+        cached = use_cache and cache and cache.load()
+        if cached:
+            # Hand out completions from the cache right away, then check
+            # whether they're still accurate.
+            cached_fingerprint, results = cached
+            completer, _ = self._populate(lambda: ReplayExecutor(results, executor), special, settings, history)
+            completer.column_loader = column_loader
+            for callback in callbacks:
+                callback(completer)
+        snapshot = executor.catalog_snapshot() if settings.get("incremental_completion_refresh") else None
+        fingerprint = cache and executor.catalog_fingerprint()
+
+        if not cached or fingerprint != cached_fingerprint:
+            completer, catalog = self._populate(
+                lambda: self._catalog(executor, cache, settings),
+                special,
+                settings,
+                history,
+            )
+            if fingerprint:
+                cache.save(fingerprint, catalog.results)
+            completer.catalog_snapshot = snapshot
+            completer.column_loader = column_loader
+            for callback in callbacks:
+                callback(completer)
+        else:
+            completer.catalog_snapshot = snapshot
+
+        if not settings.get("single_connection") and executor.conn:
+            # close connection established with pgexecute.copy()
+            executor.conn.close()
+
+    def _get_column_loader(self, pgexecute, settings):
+        """Returns the ColumnLoader for completers in lazy mode, or None."""
+        if not settings.get("lazy_column_loading"):
+            return None
+        if self._column_loader is None or self._column_loader.executor is not pgexecute:
+            if self._column_loader:
+                self._column_loader.close()
+            self._column_loader = ColumnLoader(pgexecute, settings.get("single_connection"))
+        return self._column_loader
+
+    def _catalog(self, executor, cache, settings):
+        """Returns the executor the refreshers should get their data from."""
+        if not settings.get("single_connection"):
+            names = _catalog_methods(settings)
+            workers = settings.get("completion_refresh_workers", 1)
+            if workers > 1:
+                return ReplayExecutor(self._prefetch(executor, workers, names), executor)
+            if settings.get("pipeline_completion_refresh") and executor.can_pipeline():
+                return StreamingExecutor(executor.pipeline_catalog(names), executor)
+        return RecordingExecutor(executor) if cache else executor
+
+    def _prefetch(self, executor, workers, names=CATALOG_METHODS):
+        """Runs the catalog queries in `names` on up to `workers` connections
+        at once, and returns their results by method name."""
+        idle = queue.SimpleQueue()
+        idle.put(executor)
+        copies = []
+
+        def fetch(name):
+            try:
+                worker_executor = idle.get_nowait()
+            except queue.Empty:
+                worker_executor = executor.copy()
+                copies.append(worker_executor)
+            try:
+                return list(getattr(worker_executor, name)())
+            finally:
+                idle.put(worker_executor)
+
+        try:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="completion_refresh") as pool:
+                futures = {name: pool.submit(fetch, name) for name in names}
+            return {name: future.result() for name, future in futures.items()}
+        finally:
+            for worker_executor in copies:
+                if worker_executor.conn:
+                    worker_executor.conn.close()
+
+    def _bg_refresh_incremental(self, pgexecute, completer, callbacks, settings=None):
         settings = settings or {}
-        completer = PGCompleter(smart_completion=True, pgspecial=special, settings=settings)
 
         if settings.get("single_connection"):
             executor = pgexecute
@@ -58,33 +207,197 @@ class CompletionRefresher:
         if callable(callbacks):
             callbacks = [callbacks]
 
+        special = completer.pgspecial
+        try:
+            while 1:
+                snapshot = executor.catalog_snapshot(completer.catalog_snapshot)
+                if not (completer.catalog_snapshot and snapshot) or completer.catalog_snapshot.namespaces != snapshot.namespaces:
+                    completer = None
+                    break
+                completer = self._apply_catalog_changes(completer, executor, snapshot, settings)
+                if not self._restart_refresh.is_set():
+                    break
+                # Catch up with the changes made while we were busy.
+                self._restart_refresh.clear()
+        finally:
+            if not settings.get("single_connection") and executor.conn:
+                # close connection established with pgexecute.copy()
+                executor.conn.close()
+
+        if completer is None:
+            self._bg_refresh(pgexecute, special, callbacks, settings=settings)
+            return
+
+        for callback in callbacks:
+            callback(completer)
+
+    def _apply_catalog_changes(self, completer, executor, snapshot, settings):
+        """Returns a copy of `completer`, updated with the objects that
+        changed between its catalog snapshot and `snapshot`."""
+        old = completer.catalog_snapshot
+        new_completer = PGCompleter(smart_completion=True, pgspecial=completer.pgspecial, settings=settings)
+        new_completer.copy_metadata(completer)
+        new_completer.catalog_snapshot = snapshot
+        new_completer.set_search_path(executor.search_path())
+        new_completer.extend_database_names(executor.databases())
+
+        # Relations that were created, dropped or altered, including their
+        # columns.
+        changed = {oid for oid in old.relations.keys() | snapshot.relations.keys() if old.relations.get(oid) != snapshot.relations.get(oid)}
+        # The foreign keys stored in a table's columns name the columns of the
+        # other table, so both ends of a changed foreign key, or of a foreign
+        # key to a changed table, need to be reloaded.
+        stale = set(changed)
+        for foreignkeys in (old.foreignkeys, snapshot.foreignkeys):
+            for oid, (version, child, parent) in foreignkeys.items():
+                if child in changed or parent in changed or old.foreignkeys.get(oid) != snapshot.foreignkeys.get(oid):
+                    stale.update((child, parent))
+
+        dropped = {"tables": [], "views": []}
+        for oid in stale & old.relations.keys():
+            version, relkind, schema, relname = old.relations[oid]
+            dropped[_relation_kind(relkind)].append((schema, relname))
+        for kind, relations in dropped.items():
+            new_completer.drop_relations(relations, kind=kind)
+        oids = sorted(stale & snapshot.relations.keys())
+        if oids:
+            new_completer.extend_relations(executor.tables(oids), kind="tables")
+            new_completer.extend_relations(executor.views(oids), kind="views")
+            if not new_completer.lazy_columns:
+                new_completer.extend_columns(executor.table_columns(oids), kind="tables")
+                new_completer.extend_columns(executor.view_columns(oids), kind="views")
+            relations = {snapshot.relations[oid][2:] for oid in oids}
+            new_completer.extend_foreignkeys(executor.foreignkeys(oids), relations=relations)
+
+        # Overloaded functions are stored together, so reload all functions
+        # with the same name as a changed one.
+        changed = {oid for oid in old.functions.keys() | snapshot.functions.keys() if old.functions.get(oid) != snapshot.functions.get(oid)}
+        names = {functions[oid][1:] for functions in (old.functions, snapshot.functions) for oid in changed & functions.keys()}
+        if names:
+            new_completer.drop_functions(names)
+            oids = sorted(oid for oid, (version, schema, func) in snapshot.functions.items() if (schema, func) in names)
+            new_completer.extend_functions(executor.functions(oids))
+
+        if old.datatypes != snapshot.datatypes:
+            new_completer.drop_datatypes()
+            new_completer.extend_datatypes(executor.datatypes())
+
+        new_completer.prioritizer = completer.prioritizer
+        return new_completer
+
+    def _populate(self, new_catalog, special, settings, history=None):
+        """Returns a new PGCompleter populated by running all refreshers,
+        and the executor they got their data from.
+
+        new_catalog is called to get that executor, again each time the
+        refresh is restarted.
+        """
         while 1:
-            for refresher in self.refreshers.values():
-                refresher(completer, executor)
-                if self._restart_refresh.is_set():
-                    self._restart_refresh.clear()
+            completer = PGCompleter(smart_completion=True, pgspecial=special, settings=settings)
+            executor = new_catalog()
+            try:
+                for refresher in self.refreshers.values():
+                    refresher(completer, executor)
+                    if self._restart_refresh.is_set():
+                        self._restart_refresh.clear()
+                        break
+                else:
+                    # Break out of while loop if the for loop finishes natually
+                    # without hitting the break statement.
                     break
-            else:
-                # Break out of while loop if the for loop finishes natually
-                # without hitting the break statement.
-                break
+            finally:
+                if isinstance(executor, StreamingExecutor):
+                    # Leave the pipeline before the connection is used again.
+                    executor.close()
 
             # Start over the refresh from the beginning if the for loop hit the
             # break statement.
             continue
 
+        # Load the preferences saved for this database, or learn them from
+        # the history the first time.
+        stats_dir = settings.get("completion_stats_dir")
+        counts = stats_dir and CompletionStats(stats_dir, executor, settings.get("completion_stats_half_life", 30)).load()
+        if counts:
+            completer.prioritizer.load(*counts)
+            return completer, executor
+
         # Load history into pgcompleter so it can learn user preferences
         n_recent = 100
         if history:
             for recent in history.get_strings()[-n_recent:]:
                 completer.extend_query_history(recent, is_init=True)
 
-        for callback in callbacks:
-            callback(completer)
+        return completer, executor
 
-        if not settings.get("single_connection") and executor.conn:
-            # close connection established with pgexecute.copy()
-            executor.conn.close()
+
+class ColumnLoader:
+    """Loads the columns of single relations for completers in lazy mode.
+
+    Unless single_connection is set, the columns are queried on a copy of the
+    executor's connection, opened on first use, so loading them doesn't wait
+    for the user's queries. Completions don't wait for the loader either:
+    a load is skipped while another one runs, and cancelled after `timeout`
+    milliseconds.
+    """
+
+    timeout = 2000
+
+    def __init__(self, executor, single_connection=False):
+        self.executor = executor
+        self.single_connection = single_connection
+        self._loader = None
+        self._loader_dsn = None
+        self._lock = threading.Lock()
+
+    def __call__(self, schema, relname):
+        """Returns the column metadata tuples of a relation, or None if they
+        couldn't be loaded now."""
+        if not self._lock.acquire(blocking=False):
+            _logger.debug("Skipped loading columns of %r.%r, another load is running.", schema, relname)
+            return None
+        try:
+            executor = self._get_executor()
+            if self.single_connection and executor.conn.info.transaction_status != psycopg.pq.TransactionStatus.IDLE:
+                # Don't run catalog queries inside the user's transaction.
+                return None
+            return executor.relation_columns(schema, relname, timeout=self.timeout)
+        except psycopg.errors.QueryCanceled as e:
+            _logger.error("Loading columns of %r.%r timed out: %r", schema, relname, e)
+            return None
+        except psycopg.Error as e:
+            _logger.error("Could not load columns of %r.%r: %r", schema, relname, e)
+            self.close()
+            return None
+        finally:
+            self._lock.release()
+
+    def _get_executor(self):
+        if self.single_connection:
+            return self.executor
+        # Follow the main connection to other databases.
+        dsn = (self.executor.user, self.executor.host, self.executor.port, self.executor.dbname)
+        if self._loader is None or self._loader_dsn != dsn:
+            self.close()
+            self._loader = self.executor.copy()
+            self._loader_dsn = dsn
+        return self._loader
+
+    def close(self):
+        if self._loader is not None and self._loader.conn:
+            self._loader.conn.close()
+        self._loader = None
+
+
+def _catalog_methods(settings):
+    """Returns the catalog methods whose results the refreshers use."""
+    if settings.get("lazy_column_loading"):
+        return tuple(name for name in CATALOG_METHODS if name not in ("table_columns", "view_columns"))
+    return CATALOG_METHODS
+
+
+def _relation_kind(relkind):
+    return "views" if relkind in ("v", "m") else "tables"
 
 
 def refresher(name, refreshers=CompletionRefresher.refreshers):
@@ -108,14 +421,16 @@ def refresh_schemata(completer, executor):
 @refresher("tables")
 def refresh_tables(completer, executor):
     completer.extend_relations(executor.tables(), kind="tables")
-    completer.extend_columns(executor.table_columns(), kind="tables")
+    if not completer.lazy_columns:
+        completer.extend_columns(executor.table_columns(), kind="tables")
     completer.extend_foreignkeys(executor.foreignkeys())
 
 
 @refresher("views")
 def refresh_views(completer, executor):
     completer.extend_relations(executor.views(), kind="views")
-    completer.extend_columns(executor.view_columns(), kind="views")
+    if not completer.lazy_columns:
+        completer.extend_columns(executor.view_columns(), kind="views")
 
 
 @refresher("types")
@@ -73,6 +73,18 @@ def get_casing_file(config):
     return casing_file
 
 
+def get_completion_cache_dir(config):
+    if not config["main"].as_bool("completion_cache"):
+        return None
+    return config_location() + "completion_cache"
+
+
+def get_completion_stats_dir(config):
+    if not config["main"].as_bool("completion_stats"):
+        return None
+    return config_location() + "completion_stats"
+
+
 def skip_initial_comment(f_stream: TextIO) -> int:
     """
     Initial comment in ~/.pg_service.conf is not always marked with '#'
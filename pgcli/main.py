@@ -3,7 +3,9 @@ from configobj import ConfigObj, ParseError
 from pgspecial.namedqueries import NamedQueries
 from .config import skip_initial_comment
 
+import asyncio
 import atexit
+import contextlib
 import os
 import re
 import sys
@@ -33,6 +35,7 @@ try:
     import setproctitle
 except ImportError:
     setproctitle = None
+from prompt_toolkit.application import Application, run_in_terminal
 from prompt_toolkit.completion import DynamicCompleter, ThreadedCompleter
 from prompt_toolkit.enums import DEFAULT_BUFFER, EditingMode
 from prompt_toolkit.shortcuts import PromptSession, CompleteStyle
@@ -40,6 +43,8 @@ from prompt_toolkit.document import Document
 from prompt_toolkit.filters import HasFocus, IsDone
 from prompt_toolkit.formatted_text import ANSI
 from prompt_toolkit.lexers import PygmentsLexer
+from prompt_toolkit.key_binding import KeyBindings
+from prompt_toolkit.layout import FormattedTextControl, Layout, Window
 from prompt_toolkit.layout.processors import (
     ConditionalProcessor,
     HighlightMatchingBracketProcessor,
@@ -57,10 +62,14 @@ from . import auth
 from .pgcompleter import PGCompleter
 from .pgtoolbar import create_toolbar_tokens_func
 from .pgstyle import style_factory, style_factory_output
-from .pgexecute import PGExecute
+from .pgexecute import PGExecute, StreamedRows
 from .completion_refresher import CompletionRefresher
+from .completion_cache import CompletionStats
+from .script_progress import ScriptProgress, format_size
 from .config import (
     get_casing_file,
+    get_completion_cache_dir,
+    get_completion_stats_dir,
     load_config,
     config_location,
     ensure_dir_exists,
@@ -69,9 +78,10 @@ from .config import (
 )
 from .key_bindings import pgcli_bindings
 from .packages.formatter.sqlformatter import register_new_formatter
-from .packages.prompt_utils import confirm, confirm_destructive_query
-from .packages.parseutils import is_destructive
+from .packages.prompt_utils import confirm, confirm_destructive
+from .packages.parseutils import find_destructive, is_destructive
 from .packages.parseutils import parse_destructive_warning
+from .packages.parseutils.splitter import ScriptReader, split_script
 from .__init__ import __version__
 
 click.disable_unicode_literals_warning = True
@@ -80,7 +90,7 @@ from urllib.parse import urlparse
 
 from getpass import getuser
 
-from psycopg import OperationalError, InterfaceError, Notify
+from psycopg import DatabaseError, OperationalError, InterfaceError, Notify
 from psycopg.conninfo import make_conninfo, conninfo_to_dict
 from psycopg.errors import Diagnostic
 
@@ -97,6 +107,12 @@ except ImportError:
 # Ref: https://stackoverflow.com/questions/30425105/filter-special-chars-such-as-color-codes-from-shell-output
 COLOR_CODE_REGEX = re.compile(r"\x1b(\[.*?[@-~]|\].*?(\x07|\x1b\\))")
 DEFAULT_MAX_FIELD_WIDTH = 500
+# The batch size \stream turns streaming on with, unless fetch_count sets one
+DEFAULT_FETCH_COUNT = 1000
+
+# The formats of the rows of a streamed result after the first batch, for
+# those that would repeat the header of the first one
+HEADERLESS_FORMATS = {"csv": "csv-noheader", "csv-tab": "csv-tab-noheader", "tsv": "tsv_noheader"}
 
 # Query tuples are used for maintaining history
 MetaQuery = namedtuple(
@@ -111,9 +127,21 @@ MetaQuery = namedtuple(
         "path_changed",  # True if any subquery changed the search path
         "mutated",  # True if any subquery executed insert/update/delete
         "is_special",  # True if the query is a special command
+        "streamed",  # True if results were written as their rows were fetched
+    ],
+)
+MetaQuery.__new__.__defaults__ = ("", False, 0, 0, False, False, False, False, False)
+
+# Where a script run with \i stopped, to resume it with \i --resume
+ScriptPosition = namedtuple(
+    "ScriptPosition",
+    [
+        "path",  # The absolute path of the script
+        "offset",  # The byte offset of the line the statement starts on
+        "column",  # The column the statement starts at in that line
+        "statement",  # The number of the statement in the script, from 1
     ],
 )
-MetaQuery.__new__.__defaults__ = ("", False, 0, 0, False, False, False, False)
 
 OutputSettings = namedtuple(
     "OutputSettings",
@@ -133,6 +161,18 @@ OutputSettings.__new__.__defaults__ = (
 )
 
 
+class RecordTitle:
+    """The title of the records of a batch of rows in vertical format,
+    numbered after the `offset` records of the batches before it."""
+
+    def __init__(self, title, offset):
+        self.title = title
+        self.offset = offset
+
+    def format(self, n):
+        return self.title.format(n=n + self.offset)
+
+
 class PgCliQuitError(Exception):
     pass
 
@@ -221,6 +261,8 @@ class PGCli:
             self.row_limit = row_limit
         else:
             self.row_limit = c["main"].as_int("row_limit")
+        self.fetch_count = c["main"].as_int("fetch_count")
+        self.stream_batch_size = self.fetch_count or DEFAULT_FETCH_COUNT
 
         self.application_name = application_name
 
@@ -243,6 +285,7 @@ class PGCli:
         self.destructive_warning = parse_destructive_warning(warn or c["main"].as_list("destructive_warning"))
         self.destructive_warning_restarts_connection = c["main"].as_bool("destructive_warning_restarts_connection")
         self.destructive_statements_require_transaction = c["main"].as_bool("destructive_statements_require_transaction")
+        self.failed_script = None
 
         self.less_chatty = bool(less_chatty) or c["main"].as_bool("less_chatty")
         self.verbose_errors = "verbose_errors" in c["main"] and c["main"].as_bool("verbose_errors")
@@ -284,6 +327,15 @@ class PGCli:
             "less_chatty": less_chatty,
             "keyword_casing": keyword_casing,
             "alias_map_file": c["main"]["alias_map_file"] or None,
+            "completion_cache_dir": get_completion_cache_dir(c),
+            "completion_stats_dir": get_completion_stats_dir(c),
+            "completion_stats_half_life": c["main"].as_float("completion_stats_half_life"),
+            "incremental_completion_refresh": c["main"].as_bool("incremental_completion_refresh"),
+            "completion_refresh_workers": c["main"].as_int("completion_refresh_workers"),
+            "pipeline_completion_refresh": c["main"].as_bool("pipeline_completion_refresh"),
+            "lazy_column_loading": c["main"].as_bool("lazy_column_loading"),
+            "lazy_column_cache_size": c["main"].as_int("lazy_column_cache_size"),
+            "max_completions": c["main"].as_int("max_completions"),
         }
 
         completer = PGCompleter(smart_completion, pgspecial=self.pgspecial, settings=self.settings)
@@ -292,6 +344,8 @@ class PGCli:
         self.register_special_commands()
 
         self.prompt_app = None
+        # When the running command started, while its progress is shown
+        self.query_started = None
 
         self.dsn_ssh_tunnel_config = c.get("dsn ssh tunnels")
         self.ssh_tunnel_config = c.get("ssh tunnels")
@@ -375,7 +429,12 @@ class PGCli:
             "Refresh auto-completions.",
             arg_type=NO_QUERY,
         )
-        self.pgspecial.register(self.execute_from_file, "\\i", "\\i filename", "Execute commands from file.")
+        self.pgspecial.register(
+            self.execute_from_file,
+            "\\i",
+            "\\i filename | \\i --resume",
+            "Execute commands from file, or resume the last one that stopped on an error.",
+        )
         self.pgspecial.register(
             self.write_to_file,
             "\\o",
@@ -417,6 +476,13 @@ class PGCli:
             "Toggle verbose errors.",
         )
 
+        self.pgspecial.register(
+            self.toggle_stream,
+            "\\stream",
+            "\\stream [on|off|rows]",
+            "Toggle fetching the rows of queries in batches through a server-side cursor.",
+        )
+
     def toggle_verbose_errors(self, pattern, **_):
         flag = pattern.strip()
 
@@ -430,6 +496,27 @@ class PGCli:
         message = "Verbose errors " + "on." if self.verbose_errors else "off."
         return [(None, None, None, message)]
 
+    def toggle_stream(self, pattern, **_):
+        arg = pattern.strip().lower()
+
+        if arg.isdigit():
+            self.fetch_count = int(arg)
+            self.stream_batch_size = self.fetch_count or self.stream_batch_size
+        elif arg == "on":
+            self.fetch_count = self.stream_batch_size
+        elif arg == "off":
+            self.fetch_count = 0
+        elif not arg:
+            self.fetch_count = 0 if self.fetch_count else self.stream_batch_size
+        else:
+            return [(None, None, None, "Usage: \\stream [on|off|rows]")]
+
+        if self.fetch_count:
+            message = f"Streaming rows in batches of {self.fetch_count}."
+        else:
+            message = "Streaming off."
+        return [(None, None, None, message)]
+
     def echo(self, pattern, **_):
         return [(None, None, None, pattern)]
 
@@ -494,32 +581,82 @@ class PGCli:
         if not pattern:
             message = "\\i: missing required argument"
             return [(None, None, None, message, "", False, True)]
+        if pattern == "--resume" and self.failed_script is None:
+            message = "\\i: no script to resume"
+            return [(None, None, None, message, "", False, True)]
         try:
-            with open(os.path.expanduser(pattern), encoding="utf-8") as f:
-                query = f.read()
+            if pattern == "--resume":
+                position = self.failed_script
+            else:
+                position = ScriptPosition(os.path.abspath(os.path.expanduser(pattern)), 0, 0, 1)
+            f = open(position.path, "rb")
         except OSError as e:
             return [(None, None, None, str(e), "", False, True)]
 
+        # Look for a destructive statement, without reading the whole file
+        # in memory
         if self.destructive_warning:
-            if (
-                self.destructive_statements_require_transaction
-                and not self.pgexecute.valid_transaction()
-                and is_destructive(query, self.destructive_warning)
-            ):
+            f.seek(position.offset)
+            destructive = find_destructive(split_script(ScriptReader(f, column=position.column)), self.destructive_warning)
+        else:
+            destructive = None
+        if destructive:
+            if self.destructive_statements_require_transaction and not self.pgexecute.valid_transaction():
+                f.close()
                 message = "Destructive statements must be run within a transaction. Command execution stopped."
                 return [(None, None, None, message)]
-            destroy = confirm_destructive_query(query, self.destructive_warning, self.dsn_alias)
+            destroy = confirm_destructive(self.dsn_alias)
             if destroy is False:
+                f.close()
                 message = "Wise choice. Command execution stopped."
                 return [(None, None, None, message)]
 
-        on_error_resume = self.on_error == "RESUME"
-        return self.pgexecute.run(
-            query,
-            self.pgspecial,
-            on_error_resume=on_error_resume,
-            explain_mode=self.explain_mode,
-        )
+        return self._run_script(f, position)
+
+    def _run_script(self, f, position):
+        """Runs the statements of the binary file object `f` from `position`
+        as they are read, showing the progress, and closes it.
+
+        If the script stops before its end, the position of the statement it
+        stopped at is kept in self.failed_script for \\i --resume."""
+        with f:
+            f.seek(position.offset)
+            reader = ScriptReader(f, column=position.column)
+            progress = ScriptProgress(os.path.basename(position.path), os.fstat(f.fileno()).st_size)
+            current = position
+
+            def statements():
+                nonlocal current
+                for number, statement in enumerate(split_script(reader, reader.tell), position.statement):
+                    current = ScriptPosition(position.path, *statement.start, number)
+                    progress.update(number - 1, reader.offset)
+                    yield statement
+
+            try:
+                yield from self.pgexecute.run_script(
+                    statements(),
+                    self.pgspecial,
+                    on_error_resume=self.on_error == "RESUME",
+                    explain_mode=self.explain_mode,
+                    fetch_count=self.fetch_count,
+                    row_limit=self._row_limit,
+                )
+            except GeneratorExit:
+                raise
+            except BaseException:
+                progress.clear()
+                self.failed_script = current
+                click.secho(
+                    "\\i stopped at statement {:,} of {}, {} into it. Run \\i --resume to continue from there.".format(
+                        current.statement, current.path, format_size(current.offset)
+                    ),
+                    err=True,
+                    fg="red",
+                )
+                raise
+            progress.clear()
+            if self.failed_script and self.failed_script.path == position.path:
+                self.failed_script = None
 
     def write_to_logfile(self, pattern, **_):
         if not pattern:
@@ -812,26 +949,30 @@ class PGCli:
         logger = self.logger
 
         query = MetaQuery(query=text, successful=False)
+        declined = False
 
         try:
-            if self.destructive_warning:
-                if (
-                    self.destructive_statements_require_transaction
-                    and not self.pgexecute.valid_transaction()
-                    and is_destructive(text, self.destructive_warning)
-                ):
+            if self.destructive_warning and is_destructive(text, self.destructive_warning):
+                if self.destructive_statements_require_transaction and not self.pgexecute.valid_transaction():
                     click.secho("Destructive statements must be run within a transaction.")
+                    declined = True
                     raise KeyboardInterrupt
-                destroy = confirm_destructive_query(text, self.destructive_warning, self.dsn_alias)
+                destroy = confirm_destructive(self.dsn_alias)
                 if destroy is False:
                     click.secho("Wise choice!")
+                    declined = True
                     raise KeyboardInterrupt
                 elif destroy:
                     click.secho("Your call!")
 
-            output, query = self._evaluate_command(text)
+            # Ctrl-C cancels the running query, keeping the connection
+            with self.pgexecute.cancel_on_interrupt():
+                if self._show_query_progress(text):
+                    output, query = self._evaluate_command_with_progress(text)
+                else:
+                    output, query = self._evaluate_command(text)
         except KeyboardInterrupt:
-            if self.destructive_warning_restarts_connection:
+            if declined and self.destructive_warning_restarts_connection:
                 # Restart connection to the database
                 self.pgexecute.connect()
                 logger.debug("cancelled query and restarted connection, sql: %r", text)
@@ -854,8 +995,12 @@ class PGCli:
             logger.error("traceback: %r", traceback.format_exc())
             click.secho(str(e), err=True, fg="red")
         else:
+            # Streamed results are written as their rows are fetched
+            all_written = query.streamed and not output
             try:
-                if self.output_file and not text.startswith(("\\o ", "\\log-file", "\\? ", "\\echo ")):
+                if all_written:
+                    pass
+                elif self.output_file and not text.startswith(("\\o ", "\\log-file", "\\? ", "\\echo ")):
                     try:
                         with open(self.output_file, "a", encoding="utf-8") as f:
                             should_hide = (
@@ -875,7 +1020,12 @@ class PGCli:
                         self.echo_via_pager("\n".join(output))
 
                 # Log to file in addition to normal output
-                if self.log_file and not text.startswith(("\\o ", "\\log-file", "\\? ", "\\echo ")) and not text.strip() == "":
+                if (
+                    self.log_file
+                    and not all_written
+                    and not text.startswith(("\\o ", "\\log-file", "\\? ", "\\echo "))
+                    and not text.strip() == ""
+                ):
                     try:
                         with open(self.log_file, "a", encoding="utf-8") as f:
                             click.echo(dt.datetime.now().isoformat(), file=f)  # timestamp log
@@ -914,9 +1064,13 @@ class PGCli:
             if query.db_changed:
                 with self._completer_lock:
                     self.completer.reset_completions()
-                self.refresh_completions(persist_priorities="keywords")
+                if self.settings["completion_stats_dir"]:
+                    # Use the preferences saved for the new database
+                    self.refresh_completions(persist_priorities="none", use_cache=True)
+                else:
+                    self.refresh_completions(persist_priorities="keywords", use_cache=True)
             elif query.meta_changed:
-                self.refresh_completions(persist_priorities="all")
+                self.refresh_completions(persist_priorities="all", incremental=self.settings["incremental_completion_refresh"])
             elif query.path_changed:
                 logger.debug("Refreshing search path")
                 with self._completer_lock:
@@ -954,6 +1108,97 @@ class PGCli:
                 query = self.execute_command("rollback")
                 return query.successful  # quit only if query is successful
 
+    def run_batch(self, commands=(), files=()):
+        """Runs `commands`, then the scripts in `files` ("-" for the standard
+        input), without the prompt, auto-completion or pager. A command or
+        script with destructive statements is confirmed first, as at the
+        prompt.
+
+        The results are written to stdout as each statement returns, and
+        errors to stderr. Returns the exit status: 0 if all the statements
+        succeeded, 1 if one failed and 2 if the connection was lost."""
+        on_error_resume = self.on_error == "RESUME"
+        options = {
+            "pgspecial": self.pgspecial,
+            "exception_formatter": lambda e: exception_formatter(e, self.verbose_errors),
+            "on_error_resume": on_error_resume,
+            "explain_mode": self.explain_mode,
+            "fetch_count": self.fetch_count,
+        }
+
+        def declined(destructive):
+            """Returns why not to run a command, if `destructive` and the
+            user doesn't confirm it, like execute_command() does."""
+            if not destructive:
+                return None
+            if self.destructive_statements_require_transaction and not self.pgexecute.valid_transaction():
+                return "Destructive statements must be run within a transaction. Command execution stopped."
+            # Not asked if the standard input isn't a terminal
+            if confirm_destructive(self.dsn_alias) is False:
+                return "Wise choice. Command execution stopped."
+            return None
+
+        def results():
+            for command in commands:
+                message = declined(self.destructive_warning and is_destructive(command, self.destructive_warning))
+                if message:
+                    yield None, None, None, message, command, False, True
+                    continue
+                yield from self.pgexecute.run(command, **options)
+            for path in files:
+                if path == "-":
+                    # The script is read from the standard input, which can't
+                    # be asked for a confirmation then
+                    yield from self.pgexecute.run_file(sys.stdin, **options)
+                    continue
+                try:
+                    f = open(os.path.expanduser(path), encoding="utf-8")
+                except OSError as e:
+                    yield None, None, None, str(e), "", False, True
+                    continue
+                with f:
+                    message = declined(self.destructive_warning and find_destructive(split_script(f), self.destructive_warning))
+                    if message:
+                        yield None, None, None, message, "", False, True
+                        continue
+                    f.seek(0)
+                    yield from self.pgexecute.run_file(f, **options)
+
+        exit_status = 0
+        try:
+            for title, cur, headers, status, sql, success, is_special in results():
+                if not success:
+                    click.secho(status, err=True)
+                    exit_status = 1
+                    if on_error_resume:
+                        continue
+                    break
+                settings = OutputSettings(
+                    table_format=self.table_format,
+                    dcmlfmt=self.decimal_format,
+                    floatfmt=self.float_format,
+                    column_date_formats=self.column_date_formats,
+                    missingval=self.null_string,
+                    expanded=self.pgspecial.expanded_output or self.expanded_output,
+                    max_field_width=self.max_field_width,
+                )
+                try:
+                    for line in format_output(title, cur, headers, status, settings, self.explain_mode):
+                        click.echo(line)
+                except (OperationalError, InterfaceError):
+                    raise
+                except DatabaseError as e:
+                    # Streamed rows are fetched while they are written
+                    click.secho(exception_formatter(e, self.verbose_errors), err=True)
+                    exit_status = 1
+                    if on_error_resume:
+                        continue
+                    break
+        except (OperationalError, InterfaceError) as e:
+            click.secho(str(e), err=True, fg="red")
+            return 2
+        return exit_status
+
     def run_cli(self):
         logger = self.logger
 
@@ -961,7 +1206,7 @@ class PGCli:
         if history_file == "default":
             history_file = config_location() + "history"
         history = FileHistory(os.path.expanduser(history_file))
-        self.refresh_completions(history=history, persist_priorities="none")
+        self.refresh_completions(history=history, persist_priorities="none", use_cache=True)
 
         self.prompt_app = self._build_cli(history)
 
@@ -1001,6 +1246,7 @@ class PGCli:
                 # Allow PGCompleter to learn user's preferred keywords, etc.
                 with self._completer_lock:
                     self.completer.extend_query_history(text)
+                self.save_completion_stats()
 
         except (PgCliQuitError, EOFError):
             if not self.less_chatty:
@@ -1102,34 +1348,92 @@ class PGCli:
 
             return prompt_app
 
-    def _should_limit_output(self, sql, cur):
-        """returns True if the output should be truncated, False otherwise."""
+    def _should_limit_output(self, sql):
+        """returns True if the rows of the query should be limited to
+        row_limit, False otherwise."""
         if self.explain_mode:
             return False
         if not is_select(sql):
             return False
 
-        return not self._has_limit(sql) and self.row_limit != 0 and cur and cur.rowcount > self.row_limit
+        return not self._has_limit(sql) and self.row_limit != 0
+
+    def _row_limit(self, sql):
+        """Returns how many rows of the query `sql` to fetch at most, or 0 to
+        fetch all of them."""
+        return self.row_limit if self._should_limit_output(sql) else 0
 
     def _has_limit(self, sql):
         if not sql:
             return False
         return "limit " in sql.lower()
 
-    def _limit_output(self, cur):
-        limit = min(self.row_limit, cur.rowcount)
-        new_cur = itertools.islice(cur, limit)
-        new_status = "SELECT " + str(limit)
-        click.secho("The result was limited to %s rows" % limit, fg="red")
+    def _show_query_progress(self, text):
+        """Returns True if the progress of the command `text` should be
+        shown in the bottom toolbar while it runs."""
+        if self.prompt_app is None or not self.show_bottom_toolbar:
+            return False
+        # Special commands may write to the terminal or prompt
+        return not any(statement.sql.startswith("\\") for statement in split_script(text.splitlines(keepends=True)))
+
+    def _evaluate_command_with_progress(self, text):
+        """Same as _evaluate_command(text), showing how long the command has
+        run and the rows received so far in the bottom toolbar.
+
+        The command runs in a thread of the prompt_toolkit event loop, which
+        redraws the toolbar, and where Ctrl-C cancels the running query. The
+        toolbar is hidden while the output is written to the terminal."""
+        bindings = KeyBindings()
+
+        # SIGINTs, e.g. Ctrl-C in the pager, are sent as keys too
+        @bindings.add("c-c")
+        @bindings.add("<sigint>")
+        def _(event):
+            self.pgexecute.cancel()
+
+        app = Application(
+            layout=Layout(Window(FormattedTextControl(create_toolbar_tokens_func(self)), height=1, style="class:bottom-toolbar")),
+            key_bindings=bindings,
+            style=self.prompt_app.style,
+            include_default_pygments_style=False,
+            refresh_interval=0.1,
+            erase_when_done=True,
+        )
+
+        def start():
+            loop = asyncio.get_running_loop()
+
+            async def write(func):
+                return await run_in_terminal(func, in_executor=True)
 
-        return new_cur, new_status
+            def in_terminal(func):
+                return asyncio.run_coroutine_threadsafe(write(func), loop).result()
+
+            future = loop.run_in_executor(None, self._evaluate_command, text, in_terminal)
+            future.add_done_callback(lambda future: app.exit(result=future))
+
+        # Not counting the rows of the previous command
+        self.pgexecute.statement_rows = None
+        self.query_started = time()
+        try:
+            return app.run(pre_run=start).result()
+        finally:
+            self.query_started = None
 
-    def _evaluate_command(self, text):
+    def _evaluate_command(self, text, in_terminal=None):
         """Used to run a command entered by the user during CLI operation
         (Puts the E in REPL)
 
+        `in_terminal`, if given, is called with the functions writing to the
+        terminal while the command runs, and returns what they return.
+
         returns (results, MetaQuery)
         """
+        if in_terminal is None:
+
+            def in_terminal(func):
+                return func()
+
         logger = self.logger
         logger.debug("sql: %r", text)
 
@@ -1153,18 +1457,19 @@ class PGCli:
             lambda x: exception_formatter(x, self.verbose_errors),
             on_error_resume,
             explain_mode=self.explain_mode,
+            fetch_count=self.fetch_count,
+            row_limit=self._row_limit,
         )
 
         is_special = None
+        streamed = False
+        statement_start = start
 
         for title, cur, headers, status, sql, success, is_special in res:
             logger.debug("headers: %r", headers)
             logger.debug("rows: %r", cur)
             logger.debug("status: %r", status)
 
-            if self._should_limit_output(sql, cur):
-                cur, status = self._limit_output(cur)
-
             if self.pgspecial.auto_expand or self.auto_expand:
                 max_width = self.prompt_app.output.get_size().columns
             else:
@@ -1197,8 +1502,40 @@ class PGCli:
 
             execution = time() - start
             formatted = format_output(title, cur, headers, status, settings, self.explain_mode)
+            # Whether not to run the next statements
+            stop = False
 
-            output.extend(formatted)
+            try:
+                if isinstance(cur, StreamedRows) and cur.is_batched:
+                    # Write the output so far and the rows as they are
+                    # fetched, rather than keeping them all.
+                    # Wait for the first rows before the toolbar is hidden
+                    first = list(itertools.islice(formatted, 1))
+                    lines, output = itertools.chain(output, first, formatted), []
+                    streamed = True
+                    in_terminal(functools.partial(self._write_streamed_output, text, lines))
+                else:
+                    # Without the first lines of the output on errors
+                    output.extend(list(formatted))
+            except DatabaseError as e:
+                # The rows of StreamedRows are fetched as they are formatted:
+                # handle errors like pgexecute does those of the query.
+                if self.pgexecute.conn.closed:
+                    raise
+                output.append(exception_formatter(e, self.verbose_errors))
+                success = False
+                stop = not on_error_resume
+            finally:
+                if isinstance(cur, StreamedRows):
+                    cur.close()
+            if isinstance(cur, StreamedRows) and cur.more_rows:
+                message = "The result was limited to %s rows, more rows are available" % cur.rowcount
+                in_terminal(functools.partial(click.secho, message, fg="red"))
+            if self.pgexecute.cancelled_at is not None:
+                # Ctrl-C stops the whole command, even if the query ended
+                # before it was cancelled
+                output.append("Query cancelled after %0.03fs" % (self.pgexecute.cancelled_at - statement_start))
+                stop = True
             total = time() - start
 
             # Keep track of whether any of the queries are mutating or changing
@@ -1210,6 +1547,9 @@ class PGCli:
                 path_changed = path_changed or has_change_path_cmd(sql)
             else:
                 all_success = False
+            if stop:
+                break
+            statement_start = time()
 
         meta_query = MetaQuery(
             text,
@@ -1221,10 +1561,46 @@ class PGCli:
             path_changed,
             mutated,
             is_special,
+            streamed,
         )
 
         return output, meta_query
 
+    def _write_streamed_output(self, text, lines):
+        """Writes the output `lines` of the command `text` as they come, to
+        the output file or through the pager, and to the log file, like
+        execute_command() writes the output it gets."""
+        with contextlib.ExitStack() as stack:
+            if self.log_file:
+                try:
+                    log = stack.enter_context(open(self.log_file, "a", encoding="utf-8"))
+                except OSError as e:
+                    click.secho(str(e), err=True, fg="red")
+                else:
+                    click.echo(dt.datetime.now().isoformat(), file=log)  # timestamp log
+                    click.echo(text, file=log)
+                    stack.callback(click.echo, "", file=log)  # extra newline
+                    lines = self._tee_lines(lines, log)
+            if self.output_file:
+                try:
+                    f = stack.enter_context(open(self.output_file, "a", encoding="utf-8"))
+                except OSError as e:
+                    click.secho(str(e), err=True, fg="red")
+                    f = None
+                if f:
+                    click.echo(text, file=f)
+                    for line in lines:
+                        click.echo(line, file=f)
+                    click.echo("", file=f)  # extra newline
+                    return
+            self.echo_lines_via_pager(lines)
+
+    @staticmethod
+    def _tee_lines(lines, f):
+        for line in lines:
+            click.echo(line, file=f)
+            yield line
+
     def _handle_server_closed_connection(self, text):
         """Used during CLI execution."""
         try:
@@ -1241,22 +1617,48 @@ class PGCli:
                 # Don't get stuck in a retry loop
                 self.execute_command(text, handle_closed_connection=False)
 
-    def refresh_completions(self, history=None, persist_priorities="all"):
+    def save_completion_stats(self):
+        """Adds the keywords and names counted since the last call to the
+        completion stats of the database."""
+        stats_dir = self.settings["completion_stats_dir"]
+        if not stats_dir:
+            return
+        with self._completer_lock:
+            updates = self.completer.prioritizer.take_updates()
+        if any(updates):
+            CompletionStats(stats_dir, self.pgexecute, self.settings["completion_stats_half_life"]).save(*updates)
+
+    def refresh_completions(self, history=None, persist_priorities="all", incremental=False, use_cache=False):
         """Refresh outdated completions
 
         :param history: A prompt_toolkit.history.FileHistory object. Used to
                         load keyword and identifier preferences
 
         :param persist_priorities: 'all' or 'keywords'
+
+        :param incremental: Only reload the objects that changed since the
+                            current completer was populated
+
+        :param use_cache: Start with the completions cached on disk, if any.
+                          Only when nothing changed the catalog meanwhile in
+                          this session
         """
 
         callback = functools.partial(self._on_completions_refreshed, persist_priorities=persist_priorities)
+        if incremental:
+            return self.completion_refresher.refresh_incremental(
+                self.pgexecute,
+                self.completer,
+                callback,
+                settings=self.settings,
+            )
         return self.completion_refresher.refresh(
             self.pgexecute,
             self.pgspecial,
             callback,
             history=history,
             settings=self.settings,
+            use_cache=use_cache,
         )
 
     def _on_completions_refreshed(self, new_completer, persist_priorities):
@@ -1284,7 +1686,6 @@ class PGCli:
         """
         with self._completer_lock:
             old_completer = self.completer
-            self.completer = new_completer
 
             if persist_priorities == "all":
                 # Just swap over the entire prioritizer
@@ -1297,11 +1698,16 @@ class PGCli:
             elif persist_priorities == "none":
                 # Leave the new prioritizer as is
                 pass
+            # The statements of the buffer haven't changed
+            new_completer.statement_index = old_completer.statement_index
+            # Completions are computed without the lock, so only publish the
+            # new completer once it is ready.
             self.completer = new_completer
 
     def get_completions(self, text, cursor_positition):
-        with self._completer_lock:
-            return self.completer.get_completions(Document(text=text, cursor_position=cursor_positition), None)
+        # Refreshes swap in a new completer, and resets replace the
+        # completer's metadata instead of changing it, so no lock is needed.
+        return self.completer.get_completions(Document(text=text, cursor_position=cursor_positition), None)
 
     def get_prompt(self, string):
         # should be before replacing \\d
@@ -1351,6 +1757,28 @@ class PGCli:
         else:
             click.echo_via_pager(text, color)
 
+    def echo_lines_via_pager(self, lines):
+        """Like echo_via_pager(), for lines written as they come, e.g. those
+        of a streamed result. Only the first screen of lines is kept, to find
+        out if the pager is needed."""
+        lines = iter(lines)
+        if (
+            self.pgspecial.pager_config == PAGER_OFF
+            or self.watch_command
+            or (self.pgspecial.pager_config == PAGER_LONG_OUTPUT and not self.prompt_app)
+        ):
+            for line in lines:
+                click.echo(line)
+            return
+        if self.pgspecial.pager_config == PAGER_LONG_OUTPUT and self.table_format != "csv":
+            first = list(itertools.islice(lines, max(self.prompt_app.output.get_size().rows - 4, 0)))
+            if not self.is_too_tall(first) and not any(self.is_too_wide(l) for l in first):
+                for line in first:
+                    click.echo(line)
+                return
+            lines = itertools.chain(first, lines)
+        click.echo_via_pager(line + "\n" for line in lines)
+
 
 @click.command()
 # Default host is '' so psycopg can default to either localhost or unix socket
@@ -1486,6 +1914,21 @@ class PGCli:
     type=str,
     help="SQL statement to execute after connecting.",
 )
+@click.option(
+    "-c",
+    "--command",
+    "commands",
+    multiple=True,
+    help="Run the command, print its results and exit, without the prompt. Can be given several times.",
+)
+@click.option(
+    "-f",
+    "--file",
+    "files",
+    multiple=True,
+    help='Run the commands of the file, "-" for the standard input, print their results and exit, without the prompt. '
+    "Can be given several times. The commands given with -c run first.",
+)
 @click.argument("dbname", default=lambda: None, envvar="PGDATABASE", nargs=1)
 @click.argument("username", default=lambda: None, envvar="PGUSER", nargs=1)
 def cli(
@@ -1514,6 +1957,8 @@ def cli(
     ssh_tunnel: str,
     init_command: str,
     log_file: str,
+    commands,
+    files,
 ):
     if version:
         print("Version:", __version__)
@@ -1558,9 +2003,13 @@ def cli(
         )
         sys.exit(1)
 
+    # Run the commands without the prompt if they are given
+    batch = bool(commands or files) and not (list_databases or ping_database)
+
     pgcli = PGCli(
         prompt_passwd,
-        never_prompt,
+        # The password can't be read from a script on the standard input
+        never_prompt or (batch and not sys.stdin.isatty()),
         pgclirc_file=pgclirc,
         row_limit=row_limit,
         application_name=application_name,
@@ -1652,10 +2101,12 @@ def cli(
             elif local_tz != server_tz:
                 click.secho(
                     f"Using local time zone {local_tz} (server uses {server_tz})",
+                    err=batch,
                     fg="green",
                 )
                 click.secho(
                     "Use `set time zone <TZ>` to override, or set `use_local_timezone = False` in the config",
+                    err=batch,
                     dim=True,
                 )
 
@@ -1687,7 +2138,7 @@ def cli(
     if init_command:
         init_cmds.append(init_command)
     if init_cmds:
-        click.echo("Running init commands: %s" % "; ".join(init_cmds))
+        click.echo("Running init commands: %s" % "; ".join(init_cmds), err=batch)
         for cmd in init_cmds:
             # Execute each init command
             list(pgcli.pgexecute.run(cmd))
@@ -1727,6 +2178,9 @@ def cli(
     if setproctitle:
         obfuscate_process_password()
 
+    if batch:
+        sys.exit(pgcli.run_batch(commands, files))
+
     pgcli.run_cli()
 
 
@@ -1918,9 +2372,39 @@ def format_output(title, cur, headers, status, settings, explain_mode=False):
     if title:  # Only print the title if it's not None.
         output.append(title)
 
+    def format_batches(batches, column_types):
+        # Streamed rows are formatted a batch at a time, so that they don't
+        # all need to be in memory. Like with psql's FETCH_COUNT, columns may
+        # not line up from one batch to the next.
+        rows = next(batches, [])
+        format_name = table_format
+        formatted = formatter.format_output(rows, headers, **output_kwargs)
+        first_line = next(formatted, "")
+        if not explain_mode and not expanded and max_width and len(strip_ansi(first_line)) > max_width and headers:
+            format_name = "vertical"
+            formatted = formatter.format_output(rows, headers, format_name=format_name, column_types=column_types, **output_kwargs)
+        else:
+            formatted = itertools.chain([first_line], formatted)
+        yield from formatted
+        count = len(rows)
+        for rows in batches:
+            kwargs = dict(output_kwargs)
+            if format_name == "vertical":
+                kwargs["sep_title"] = RecordTitle(kwargs["sep_title"], count)
+            formatted = formatter.format_output(
+                rows,
+                headers,
+                format_name=HEADERLESS_FORMATS.get(format_name, format_name),
+                column_types=column_types,
+                **kwargs,
+            )
+            yield from formatted
+            count += len(rows)
+
     if cur:
         headers = [case_function(x) for x in headers]
-        if max_width is not None:
+        batches = cur.batches() if isinstance(cur, StreamedRows) else None
+        if max_width is not None and batches is None:
             cur = list(cur)
         column_types = None
         if hasattr(cur, "description"):
@@ -1935,27 +2419,34 @@ def format_output(title, cur, headers, status, settings, explain_mode=False):
                 else:
                     column_types.append(str)
 
-        formatted = formatter.format_output(cur, headers, **output_kwargs)
-        if isinstance(formatted, str):
-            formatted = iter(formatted.splitlines())
-        first_line = next(formatted)
-        formatted = itertools.chain([first_line], formatted)
-        if not explain_mode and not expanded and max_width and len(strip_ansi(first_line)) > max_width and headers:
-            formatted = formatter.format_output(
-                cur,
-                headers,
-                format_name="vertical",
-                column_types=column_types,
-                **output_kwargs,
-            )
+        if batches is not None:
+            output = itertools.chain(output, format_batches(batches, column_types))
+        else:
+            formatted = formatter.format_output(cur, headers, **output_kwargs)
             if isinstance(formatted, str):
                 formatted = iter(formatted.splitlines())
+            first_line = next(formatted)
+            formatted = itertools.chain([first_line], formatted)
+            if not explain_mode and not expanded and max_width and len(strip_ansi(first_line)) > max_width and headers:
+                formatted = formatter.format_output(
+                    cur,
+                    headers,
+                    format_name="vertical",
+                    column_types=column_types,
+                    **output_kwargs,
+                )
+                if isinstance(formatted, str):
+                    formatted = iter(formatted.splitlines())
+
+            output = itertools.chain(output, formatted)
 
-        output = itertools.chain(output, formatted)
+    def status_line():
+        # Formatted once the rows are read, for the row count of streamed rows
+        yield format_status(cur, status)
 
     # Only print the status if it's not None
     if status:
-        output = itertools.chain(output, [format_status(cur, status)])
+        output = itertools.chain(output, status_line())
 
     return output
 
@@ -0,0 +1,73 @@
+from collections import defaultdict
+from functools import lru_cache
+
+
+@lru_cache(maxsize=65536)
+def fold(name):
+    """Returns the lowercased and unquoted form of `name`, which is what the
+    text typed by the user is matched against."""
+    name = name.lower()
+    if name and name[0] == '"' and name[-1] == '"':
+        name = name[1:-1]
+    return name
+
+
+@lru_cache(maxsize=65536)
+def lexical_priority(item):
+    """Returns the key used to order completions with the same match.
+
+    Since *higher* priority means "more important", -ord(c) prioritizes "aa"
+    over "ab", and the 1 prioritizes shorter strings ("user" over "users").
+    The folded form is compared first, so that quoted names sort with the
+    unquoted ones, and the item itself breaks the remaining ties.
+    """
+    return tuple(0 if c in " _" else -ord(c) for c in fold(item)) + (1,) + tuple(item)
+
+
+class NameIndex:
+    """Index of the names of schema objects, used to avoid fuzzy matching
+    every object in the catalog on each key press.
+
+    Each character maps to the names containing it. A name can only fuzzy
+    match a text if it contains all of its characters, so intersecting the
+    names of each character, smallest first, gives a small superset of the
+    matches.
+
+    Names are never removed, so the index may still hold dropped objects:
+    the candidates must be looked up in the completer's metadata.
+    """
+
+    def __init__(self):
+        self._names = set()
+        self._postings = defaultdict(set)
+
+    def add(self, name):
+        if name not in self._names:
+            self._names.add(name)
+            for c in set(name.lower()):
+                self._postings[c].add(name)
+
+    def copy(self):
+        index = NameIndex()
+        index._names = set(self._names)
+        index._postings.update((c, set(names)) for c, names in self._postings.items())
+        return index
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def __len__(self):
+        return len(self._names)
+
+    def candidates(self, text):
+        """Returns the indexed names containing every character of `text`,
+        ignoring case."""
+        postings = sorted((self._postings.get(c, ()) for c in set(text.lower())), key=len)
+        if not postings:
+            return set(self._names)
+        names = set(postings[0])
+        for other in postings[1:]:
+            if not names:
+                break
+            names &= other
+        return names
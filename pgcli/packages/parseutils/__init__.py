@@ -3,6 +3,8 @@ import sqlparse
 sqlparse.engine.grouping.MAX_GROUPING_DEPTH = None
 sqlparse.engine.grouping.MAX_GROUPING_TOKENS = None
 
+from .splitter import split_script
+
 BASE_KEYWORDS = [
     "drop",
     "shutdown",
@@ -26,16 +28,27 @@ def query_is_unconditional_update(formatted_sql):
     return bool(tokens) and tokens[0] == "update" and "where" not in tokens
 
 
+def find_destructive(statements, keywords):
+    """Returns the first destructive statement of *statements*, the
+    ScriptStatements split_script() yields, or None.
+
+    A statement is destructive if it starts with one of *keywords*, or if it
+    is an UPDATE without WHERE and "unconditional_update" is one of them."""
+    keywords = {keyword.lower() for keyword in keywords}
+    unconditional_update = "unconditional_update" in keywords
+    for statement in statements:
+        if statement.verb in keywords or (unconditional_update and statement.verb == "update" and not statement.has_where):
+            return statement
+    return None
+
+
 def is_destructive(queries, keywords):
-    """Returns if any of the queries in *queries* is destructive."""
-    for query in sqlparse.split(queries):
-        if query:
-            formatted_sql = sqlparse.format(query.lower(), strip_comments=True).strip()
-            if "unconditional_update" in keywords and query_is_unconditional_update(formatted_sql):
-                return True
-            if query_starts_with(formatted_sql, keywords):
-                return True
-    return False
+    """Returns if any of the queries in *queries*, entered at the prompt, is
+    destructive."""
+    # Split like PGExecute.run() runs them, where a semicolon ends a
+    # backslash command
+    statements = split_script(queries.splitlines(keepends=True), semicolon_ends_backslash=True)
+    return find_destructive(statements, keywords) is not None
 
 
 def parse_destructive_warning(warning_level):
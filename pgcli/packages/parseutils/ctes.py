@@ -1,9 +1,10 @@
+import re
 import sqlparse
-from sqlparse import parse
 from sqlparse.tokens import Keyword, CTE, DML
 from sqlparse.sql import Identifier, IdentifierList, Parenthesis
 from collections import namedtuple
 from .meta import TableMetadata, ColumnMetadata
+from .utils import parse
 
 sqlparse.engine.grouping.MAX_GROUPING_DEPTH = None
 sqlparse.engine.grouping.MAX_GROUPING_TOKENS = None
@@ -15,6 +16,9 @@ sqlparse.engine.grouping.MAX_GROUPING_TOKENS = None
 # stop: index into the original string of the right parens ending the CTE
 TableExpression = namedtuple("TableExpression", "name columns start stop")
 
+# A query can only have CTEs if it contains this word
+with_regex = re.compile(r"\bwith\b", re.IGNORECASE)
+
 
 def isolate_query_ctes(full_text, text_before_cursor):
     """Simplify a query by converting CTEs into table metadata objects"""
@@ -57,6 +61,9 @@ def extract_ctes(sql):
     been stripped.
     """
 
+    if not with_regex.search(sql):
+        return [], sql
+
     p = parse(sql)[0]
 
     # Make sure the first meaningful token is "WITH" which is necessary to
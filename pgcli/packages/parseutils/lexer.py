@@ -0,0 +1,326 @@
+"""A fast path through sqlparse for simple statements.
+
+Completion needs little from the statement being edited: its last tokens,
+the keyword they follow and the tables in its FROM clause. Getting them from
+sqlparse.parse means grouping the whole statement on every key press, which
+is by far the slowest part of suggest_type.
+
+tokenize() splits a statement into the same tokens as sqlparse's lexer, using
+a single regular expression built from sqlparse's rules, and the functions
+below answer the completion questions for simple SELECT statements from the
+tokens alone. They return None whenever sqlparse's grouping could give a
+different answer, in which case callers go through sqlparse.
+"""
+
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+from sqlparse import keywords, tokens as T
+from sqlparse.lexer import Lexer, tokenize as sqlparse_tokenize
+from sqlparse.sql import Where
+
+from .tables import TableReference
+
+Token = namedtuple("Token", "ttype value start end")
+Token.is_keyword = property(lambda self: self.ttype in T.Keyword)
+Token.normalized = property(lambda self: self.value.upper() if self.ttype in T.Keyword else self.value)
+
+# Keywords ending a WHERE clause, as grouped by sqlparse
+WHERE_CLOSE = frozenset(Where.M_CLOSE[1])
+# Keywords that find_prev_keyword() skips
+LOGICAL_OPERATORS = ("AND", "OR", "NOT", "BETWEEN")
+# Keywords after which extract_tables() looks for tables in other statements
+TABLE_PREFIXES = ("COPY", "INTO", "UPDATE", "TABLE")
+
+
+# A statement with most kinds of tokens, that the combined regular expression
+# must split as sqlparse does.
+PROBE = "SELECT a.b, 'it''s', 1.5e3, $$x$$, \"T\".* FROM s.t -- c\nWHERE x::int >= $1 /* d */ ORDER BY 1;"
+
+
+@lru_cache(maxsize=1)
+def _lexer():
+    """Returns sqlparse's default lexer and a regular expression trying each
+    of its rules in order, or None if this version of sqlparse doesn't have
+    a default lexer (sqlparse < 0.4.4), or its rules aren't made of compiled
+    patterns as expected: then get_tokens() uses sqlparse's lexer and the
+    fast path is disabled."""
+    try:
+        lexer = Lexer.get_default_instance()
+        patterns, actions = [], {}
+        groups = 0
+        for match, action in lexer._SQL_REGEX:
+            regex = match.__self__
+            if not isinstance(regex, re.Pattern) or match != regex.match:
+                return None
+            # Each rule becomes a group, so its own groups and back references
+            # are shifted by the groups of the previous rules. Since the group
+            # of a rule closes last, it's the match's lastindex.
+            patterns.append("(" + _shift_backreferences(regex.pattern, groups + 1) + ")")
+            actions[groups + 1] = action
+            groups += regex.groups + 1
+        result = lexer, re.compile("|".join(patterns), re.IGNORECASE | re.UNICODE), actions
+        tokens = [(tok.ttype, tok.value) for tok in _get_tokens(result, PROBE, 0)]
+    except (AttributeError, TypeError, ValueError, re.error):
+        return None
+    if tokens != list(sqlparse_tokenize(PROBE)):
+        return None
+    return result
+
+
+def _shift_backreferences(pattern, offset):
+    shifted = []
+    chars = iter(pattern)
+    for c in chars:
+        if c == "\\":
+            escaped = next(chars, "")
+            if escaped.isdigit() and escaped != "0":
+                escaped = str(int(escaped) + offset)
+            shifted.append(c + escaped)
+        else:
+            shifted.append(c)
+    return "".join(shifted)
+
+
+def get_tokens(sql, pos=0):
+    """Yields the Tokens of `sql` from `pos`, exactly as sqlparse's lexer
+    splits them, including whitespace."""
+    lexer = _lexer()
+    if lexer is None:
+        for ttype, value in sqlparse_tokenize(sql[pos:]):
+            yield Token(ttype, value, pos, pos + len(value))
+            pos += len(value)
+        return
+    yield from _get_tokens(lexer, sql, pos)
+
+
+def _get_tokens(lexer, sql, pos):
+    lexer, regex, actions = lexer
+    end = len(sql)
+    while pos < end:
+        m = regex.match(sql, pos)
+        if m is None:
+            yield Token(T.Error, sql[pos], pos, pos + 1)
+            pos += 1
+            continue
+        value = m.group()
+        action = actions[m.lastindex]
+        if action is keywords.PROCESS_AS_KEYWORD:
+            ttype = lexer.is_keyword(value)[0]
+        else:
+            ttype = action
+        yield Token(ttype, value, pos, m.end())
+        pos = m.end()
+
+
+@lru_cache(maxsize=16)
+def tokenize(sql):
+    """Returns the tokens of `sql` other than whitespace, or None if `sql` has
+    tokens the fast path doesn't handle: comments, placeholders, dollar
+    quotes, backslash commands and square brackets, or a semicolon."""
+    if _lexer() is None:
+        return None
+    result = []
+    for tok in get_tokens(sql):
+        ttype, value = tok.ttype, tok.value
+        if ttype in T.Whitespace:
+            pass
+        elif ttype in T.Comment or ttype in T.Name.Placeholder or ttype in T.Generic or ttype is T.Literal or ttype is T.Error:
+            return None
+        elif ttype is T.Name and value[0] in "`´[@#" or value in (";", "[", "]") or ttype in T.Keyword.CTE:
+            return None
+        else:
+            result.append(tok)
+    return tuple(result)
+
+
+def is_simple(tokens):
+    """Returns True if the parentheses in `tokens` are balanced, and AS and
+    casts are followed by a name, and commas and casts aren't next to a
+    keyword:
+    sqlparse would group e.g. `a AS FROM` or `a, FROM` together."""
+    depth = 0
+    for i, tok in enumerate(tokens):
+        if i + 1 < len(tokens):
+            following = tokens[i + 1]
+            if (tok.value == "," and following.is_keyword) or (tok.is_keyword and following.value in (",", "::")):
+                return False
+            if (tok.normalized == "AS" or tok.value == "::") and not (_is_name(following) or following.ttype is T.Name.Builtin):
+                return False
+        if tok.value == "(":
+            depth += 1
+        elif tok.value == ")":
+            depth -= 1
+            if depth < 0:
+                return False
+    return depth == 0
+
+
+def in_where(tokens):
+    """Returns True if the last of `tokens` is in a WHERE clause, which
+    sqlparse groups into a single token. The parentheses must be balanced."""
+    where = False
+    depth = 0
+    for tok in tokens:
+        if tok.value == "(":
+            depth += 1
+        elif tok.value == ")":
+            depth -= 1
+        elif depth == 0 and tok.ttype is T.Keyword:
+            if tok.normalized == "WHERE":
+                where = True
+            elif tok.normalized in WHERE_CLOSE:
+                where = False
+    return where
+
+
+def find_prev_keyword(sql, tokens, n_skip=0):
+    """Same as utils.find_prev_keyword(sql, n_skip), where `tokens` are the
+    tokens of `sql`. Returns the keyword token, the text of `sql` up to it
+    and the tokens up to it."""
+    tokens = tokens[: len(tokens) - n_skip]
+    for idx in range(len(tokens) - 1, -1, -1):
+        t = tokens[idx]
+        if t.value == "(" or (t.is_keyword and t.value.upper() not in LOGICAL_OPERATORS):
+            return t, sql[: t.end], tokens[: idx + 1]
+    return None, "", ()
+
+
+def _remove_quotes(value):
+    if value and value[0] in "\"'`" and value[0] == value[-1]:
+        return value[1:-1]
+    return value
+
+
+def _is_name(tok):
+    return tok.ttype is T.Name or tok.ttype is T.String.Symbol
+
+
+def _table_reference(sql, tokens, in_list):
+    """Returns the TableReference extract_tables() makes of an identifier like
+    `schema.name AS alias`, or None."""
+    names = [tok for tok in tokens if tok.value != "." and tok.normalized != "AS"]
+    if len(tokens) > 1 and tokens[1].value == ".":
+        schema_name, name = (_remove_quotes(tok.value) for tok in names[:2])
+        alias = names[2:]
+    else:
+        schema_name, name = None, _remove_quotes(names[0].value)
+        alias = names[1:]
+    alias = _remove_quotes(alias[0].value) if alias else None
+    value = sql[tokens[0].start : tokens[-1].end]
+    if in_list:
+        # sqlparse groups a comma separated list into an IdentifierList, whose
+        # names extract_tables() keeps as they are. They're the same as those
+        # of a single identifier when unquoted and lowercase.
+        if '"' in value or not value.islower():
+            return None
+        return TableReference(schema_name, name, alias, False)
+
+    # Same as parse_identifier() in extract_table_identifiers()
+    schema_quoted = schema_name and value[0] == '"'
+    if schema_name and not schema_quoted:
+        schema_name = schema_name.lower()
+    quote_count = value.count('"')
+    name_quoted = quote_count > 2 or (quote_count and not schema_quoted)
+    alias_quoted = alias and value[-1] == '"'
+    if alias_quoted or name_quoted and not alias and name.islower():
+        alias = '"' + (alias or name) + '"'
+    if name and not name_quoted and not name.islower():
+        if not alias:
+            alias = name
+        name = name.lower()
+    return TableReference(schema_name, name, alias, False)
+
+
+def _table_item(tokens, i):
+    """Returns the index after the identifier `name`, `schema.name`, with an
+    optional alias, starting at tokens[i], or None."""
+    n = len(tokens)
+
+    def adjacent(j):
+        return j < n and tokens[j].start == tokens[j - 1].end
+
+    if not _is_name(tokens[i]):
+        return None
+    i += 1
+    if i < n and tokens[i].value == ".":
+        if not (adjacent(i) and adjacent(i + 1) and _is_name(tokens[i + 1])):
+            return None
+        i += 2
+    if i < n and tokens[i].normalized == "AS":
+        i += 1
+        if i == n or not _is_name(tokens[i]):
+            return None
+        return i + 1
+    if i < n and _is_name(tokens[i]):
+        # sqlparse only takes a name after whitespace as an alias
+        return None if adjacent(i) else i + 1
+    return i
+
+
+def extract_tables(sql, tokens):
+    """Same as tables.extract_tables(sql) for a SELECT statement, where
+    `tokens` are the tokens of `sql`, or None."""
+    if not is_simple(tokens):
+        return None
+    tables = []
+    prefix_seen = where = False
+    depth = 0
+    i, n = 0, len(tokens)
+    while i < n:
+        tok = tokens[i]
+        if tok.value == "(":
+            if prefix_seen and not where:
+                # A sub-select or a function
+                return None
+            depth += 1
+        elif tok.value == ")":
+            depth -= 1
+        elif depth:
+            pass
+        elif where:
+            if tok.ttype is T.Keyword and tok.normalized in WHERE_CLOSE:
+                where = False
+                continue
+            if tok.ttype in T.DML or tok.normalized in ("FROM", "WHERE") or tok.normalized.endswith("JOIN"):
+                return None
+        elif tok.is_keyword:
+            keyword = tok.normalized
+            if keyword in TABLE_PREFIXES:
+                return None
+            if keyword == "WHERE":
+                where = True
+            elif keyword == "FROM" or keyword.endswith("JOIN"):
+                prefix_seen = True
+            elif prefix_seen:
+                if tok.ttype is not T.Keyword:
+                    return None
+                prefix_seen = False
+        elif prefix_seen:
+            items = []
+            while True:
+                end = _table_item(tokens, i)
+                if end is None:
+                    return None
+                items.append(tokens[i:end])
+                i = end
+                if i < n and tokens[i].value == ",":
+                    i += 1
+                    if i == n:
+                        items.append(None)
+                        break
+                    continue
+                break
+            if i < n and not tokens[i].is_keyword:
+                return None
+            in_list = len(items) > 1
+            for item in items:
+                if item is not None:
+                    table = _table_reference(sql, item, in_list)
+                    if table is None:
+                        return None
+                    tables.append(table)
+            continue
+        i += 1
+    return tuple(tables)
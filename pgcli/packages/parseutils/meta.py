@@ -1,10 +1,12 @@
+import sys
 from collections import namedtuple
+from collections.abc import Mapping
 
 _ColumnMetadata = namedtuple("ColumnMetadata", ["name", "datatype", "foreignkeys", "default", "has_default"])
 
 
 def ColumnMetadata(name, datatype, foreignkeys=None, default=None, has_default=False):
-    return _ColumnMetadata(name, datatype, foreignkeys or [], default, has_default)
+    return _ColumnMetadata(name, datatype, tuple(foreignkeys or ()), default, has_default)
 
 
 ForeignKey = namedtuple(
@@ -21,6 +23,86 @@ ForeignKey = namedtuple(
 TableMetadata = namedtuple("TableMetadata", "name columns")
 
 
+class ColumnTable(Mapping):
+    """The columns of a table or view: an ordered mapping of column names to
+    ColumnMetadata.
+
+    The column attributes are kept in parallel arrays, with interned names
+    and data types, and the ColumnMetadata tuples are only created when
+    looked up. Defaults and foreign keys, which most columns don't have, are
+    stored sparsely.
+
+    The foreignkeys of a ColumnMetadata are a tuple, shared with the table
+    rather than copied on each lookup: add_foreignkey() replaces it.
+    """
+
+    __slots__ = ("_names", "_datatypes", "_has_defaults", "_defaults", "_foreignkeys", "_positions")
+
+    def __init__(self):
+        self._names = []
+        self._datatypes = []
+        self._has_defaults = bytearray()
+        self._defaults = {}
+        self._foreignkeys = {}
+        # {name: position}, only built when a column is looked up by name.
+        self._positions = None
+
+    def add_column(self, name, datatype, has_default=False, default=None):
+        """Appends a column. Column names are expected to be unique."""
+        position = len(self._names)
+        self._names.append(sys.intern(name))
+        self._datatypes.append(sys.intern(datatype) if isinstance(datatype, str) else datatype)
+        self._has_defaults.append(bool(has_default))
+        if default is not None:
+            self._defaults[position] = default
+        if self._positions is not None:
+            self._positions[name] = position
+
+    def add_foreignkey(self, name, fk):
+        """Adds a ForeignKey to the foreign keys of column `name`."""
+        position = self._position(name)
+        self._foreignkeys[position] = self._foreignkeys.get(position, ()) + (fk,)
+
+    def _position(self, name):
+        if self._positions is None:
+            self._positions = {name: position for position, name in enumerate(self._names)}
+        return self._positions[name]
+
+    def _column(self, position):
+        return _ColumnMetadata(
+            self._names[position],
+            self._datatypes[position],
+            self._foreignkeys.get(position, ()),
+            self._defaults.get(position),
+            bool(self._has_defaults[position]),
+        )
+
+    def __getitem__(self, name):
+        return self._column(self._position(name))
+
+    def __contains__(self, name):
+        try:
+            self._position(name)
+        except (KeyError, TypeError):
+            return False
+        return True
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+    def values(self):
+        return [self._column(position) for position in range(len(self._names))]
+
+    def items(self):
+        return [(name, self._column(position)) for position, name in enumerate(self._names)]
+
+    def __repr__(self):
+        return "ColumnTable(%r)" % dict(self.items())
+
+
 def parse_defaults(defaults_string):
     """Yields default values for a function, given the string provided by
     pg_get_expr(pg_catalog.pg_proc.proargdefaults, 0)"""
@@ -0,0 +1,264 @@
+"""Splits SQL scripts into statements as they are read.
+
+sqlparse.split() needs the whole script in memory and builds tokens for all
+of it before the first statement can run. split_script() reads a script line
+by line instead, and yields each statement as soon as it ends. It follows
+psql's rules rather than sqlparse's:
+
+* a semicolon ends a statement, unless it is inside parentheses, a string,
+  a quoted identifier, a dollar quote or a comment;
+* block comments nest, and backslashes escape quotes in E'' strings only;
+* semicolons in the BEGIN ... END body of CREATE FUNCTION and CREATE
+  PROCEDURE don't end the statement;
+* a backslash command ends at the end of its line;
+* the data of COPY ... FROM STDIN follows the statement, up to a line
+  containing only \\.
+"""
+
+import re
+from collections import namedtuple
+
+ScriptStatement = namedtuple("ScriptStatement", "sql copy_data start verb has_where")
+ScriptStatement.__doc__ = """A statement of a script. copy_data iterates
+over the data lines of a COPY ... FROM STDIN statement, and is None for
+other statements. start is where the statement starts, right after the one
+before it: the position of its first line, as returned by the tell()
+function given to split_script(), and the column in that line.
+
+verb is the first word of the statement in lower case, if it starts with
+one, else None. For UPDATE statements, has_where tells if the WHERE keyword
+is anywhere in the statement, outside strings and comments."""
+
+# What changes the state of the splitter outside strings and comments,
+# besides parentheses, which are counted between these
+_TOKEN_REGEX = re.compile(r"--|/\*|['\"$;\\]")
+# Same, with words. Only the first words of a statement, and those of
+# functions and UPDATE statements, need to be looked at.
+_WORD_TOKEN_REGEX = re.compile(_TOKEN_REGEX.pattern + r"|(?<![\w$])[^\W\d][\w$]*")
+_ESTRING_PREFIX_REGEX = re.compile(r"(?<![\w$])[eE]'")
+_DOLLAR_QUOTE_REGEX = re.compile(r"(?<![\w$])\$(?:[^\W\d]\w*)?\$")
+_ESTRING_END_REGEX = re.compile(r"(?:[^'\\]|\\.)*'", re.DOTALL)
+_BLOCK_COMMENT_REGEX = re.compile(r"/\*|\*/")
+_COPY_FROM_STDIN_REGEX = re.compile(r"\bFROM\s+STDIN\b", re.IGNORECASE)
+
+# The first words of statements whose BEGIN ... END blocks are tracked, as in
+# psql: CREATE [OR REPLACE] {FUNCTION | PROCEDURE}
+_FUNCTION_WORDS = ("create", "or", "replace", "function", "procedure")
+
+
+def _is_function(words):
+    return words[:2] in (["create", "function"], ["create", "procedure"]) or words[:4] in (
+        ["create", "or", "replace", "function"],
+        ["create", "or", "replace", "procedure"],
+    )
+
+
+def _paren_depth(depth, line, start, end):
+    """Returns the depth of parentheses after line[start:end]."""
+    closes = line.count(")", start, end)
+    if closes <= depth:
+        return depth + line.count("(", start, end) - closes
+    # Like psql, ignore closing parentheses without opening ones
+    for c in line[start:end]:
+        if c == "(":
+            depth += 1
+        elif c == ")" and depth:
+            depth -= 1
+    return depth
+
+
+def _copy_data(lines):
+    for line in lines:
+        if line.rstrip("\r\n") == "\\.":
+            return
+        yield line
+
+
+def split_script(lines, tell=None, semicolon_ends_backslash=False):
+    """Yields the ScriptStatements of the script made of `lines`, e.g. a file
+    object, reading the lines as the statements are consumed.
+
+    Statements are stripped. Those with only whitespace and comments are
+    skipped. `tell`, if given, returns the position of the last line read,
+    used for the starts of the statements. Otherwise they are None.
+
+    If `semicolon_ends_backslash` is True, a semicolon also ends a backslash
+    command, as when sqlparse splits the commands entered at the prompt."""
+    lines = iter(lines)
+    statement_start = None
+    parts = []
+    # Whether the statement has anything else than whitespace and comments
+    has_code = False
+    paren_depth = begin_depth = 0
+    # The first words of the statement, and how many words it has
+    words = []
+    word_count = 0
+    verb = None
+    is_function = is_copy = has_where = False
+    # In a backslash command ended by a semicolon or the end of the line
+    backslash = False
+    # Inside a string, quoted identifier, dollar quote or block comment: the
+    # regular expression or string ending it, or the depth of comments
+    quote = None
+    comment_depth = 0
+
+    for line in lines:
+        if statement_start is None and tell is not None:
+            statement_start = (tell(), 0)
+        pos = seg_start = 0
+        end = len(line)
+        while pos < end:
+            if comment_depth:
+                m = _BLOCK_COMMENT_REGEX.search(line, pos)
+                if m is None:
+                    break
+                comment_depth += 1 if m.group() == "/*" else -1
+                pos = m.end()
+                continue
+            if quote is not None:
+                if quote is _ESTRING_END_REGEX:
+                    m = quote.match(line, pos)
+                    found = m and m.end() - 1
+                else:
+                    found = line.find(quote, pos)
+                    if found < 0:
+                        found = None
+                if found is None:
+                    break
+                pos = found + (1 if quote is _ESTRING_END_REGEX else len(quote))
+                quote = None
+                continue
+
+            m = (_WORD_TOKEN_REGEX if word_count < 4 or is_function or verb == "update" else _TOKEN_REGEX).search(line, pos)
+            start = m.start() if m else end
+            if start > pos:
+                if not has_code and not line[pos:start].isspace():
+                    has_code = True
+                paren_depth = _paren_depth(paren_depth, line, pos, start)
+            if m is None:
+                break
+            token = m.group()
+            pos = m.end()
+            if token == "--":
+                break
+            elif token == "/*":
+                comment_depth = 1
+                continue
+            code_before, has_code = has_code, True
+            if token == "'":
+                quote = _ESTRING_END_REGEX if start and _ESTRING_PREFIX_REGEX.match(line, start - 1) else token
+            elif token == '"':
+                quote = token
+            elif token == "$":
+                m = _DOLLAR_QUOTE_REGEX.match(line, start)
+                if m:
+                    quote = m.group()
+                    pos = m.end()
+            elif token not in (";", "\\"):
+                word = token.lower()
+                if word_count < 4:
+                    if word_count == 0:
+                        verb = None if code_before else word
+                        is_copy = word == "copy"
+                    words.append(word if word in _FUNCTION_WORDS else None)
+                    word_count += 1
+                    is_function = _is_function(words)
+                elif is_function and paren_depth == 0:
+                    if word == "begin":
+                        begin_depth += 1
+                    elif word == "case" and begin_depth:
+                        begin_depth += 1
+                    elif word == "end" and begin_depth:
+                        begin_depth -= 1
+                if word == "where":
+                    has_where = True
+            elif token == "\\":
+                # A backslash command, or one ending the query like \G, runs
+                # to the end of the line, or to a semicolon with
+                # semicolon_ends_backslash. Comments before it are dropped.
+                if not code_before:
+                    parts = []
+                    seg_start = m.start()
+                if semicolon_ends_backslash:
+                    # Like sqlparse, not in parentheses
+                    if paren_depth == 0 and begin_depth == 0:
+                        backslash = True
+                    continue
+                parts.append(line[seg_start:].rstrip("\r\n"))
+                yield ScriptStatement("".join(parts).strip(), None, statement_start, verb, has_where)
+                parts = []
+                seg_start = pos = end
+                statement_start = tell and (tell(), end)
+                has_code = is_function = is_copy = has_where = False
+                paren_depth = begin_depth = word_count = 0
+                words = []
+                verb = None
+            elif paren_depth == 0 and begin_depth == 0:
+                parts.append(line[seg_start:pos])
+                sql = "".join(parts).strip()
+                data = None
+                if is_copy and _COPY_FROM_STDIN_REGEX.search(sql):
+                    data = _copy_data(lines)
+                yield ScriptStatement(sql, data, statement_start, verb, has_where)
+                parts = []
+                seg_start = pos
+                statement_start = tell and (tell(), pos)
+                if data is not None:
+                    # Skip the data that wasn't read. The next statement
+                    # starts on the line after it.
+                    for _ in data:
+                        pass
+                    statement_start = None
+                has_code = is_function = is_copy = has_where = backslash = False
+                paren_depth = begin_depth = word_count = 0
+                words = []
+                verb = None
+        if backslash:
+            parts.append(line[seg_start:].rstrip("\r\n"))
+            yield ScriptStatement("".join(parts).strip(), None, statement_start, verb, has_where)
+            parts = []
+            seg_start = end
+            statement_start = None
+            has_code = is_function = is_copy = has_where = backslash = False
+            paren_depth = begin_depth = word_count = comment_depth = 0
+            words = []
+            verb = quote = None
+        if seg_start < end:
+            parts.append(line[seg_start:])
+
+    if has_code:
+        yield ScriptStatement("".join(parts).strip(), None, statement_start, verb, has_where)
+
+
+class ScriptReader:
+    """Iterates over the lines of the binary file `f`, from its current
+    position, decoded like a file opened in text mode. Keeps track of the
+    number of bytes read, so that a script can be run again from where it
+    stopped.
+
+    The first `column` characters of the first line are replaced with
+    spaces, to start from a statement that doesn't start at the beginning of
+    a line without changing the columns of the others."""
+
+    def __init__(self, f, encoding="utf-8", column=0):
+        self.f = f
+        self.encoding = encoding
+        self.column = column
+        self.offset = self.line_offset = f.tell()
+
+    def tell(self):
+        """Returns the position of the last line read."""
+        return self.line_offset
+
+    def __iter__(self):
+        column = self.column
+        for line in self.f:
+            self.line_offset = self.offset
+            self.offset += len(line)
+            if line.endswith(b"\r\n"):
+                line = line[:-2] + b"\n"
+            line = line.decode(self.encoding)
+            if column:
+                line = " " * column + line[column:]
+                column = 0
+            yield line
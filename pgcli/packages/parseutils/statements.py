@@ -0,0 +1,133 @@
+import threading
+from bisect import bisect_left, bisect_right
+
+from sqlparse import tokens as T
+from sqlparse.engine.statement_splitter import StatementSplitter
+
+from .lexer import get_tokens
+
+
+def common_prefix_length(a, b):
+    """Returns the length of the longest common prefix of `a` and `b`."""
+    lo, hi = 0, min(len(a), len(b))
+    # Comparing slices is much faster than comparing characters in Python
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[lo:mid] == b[lo:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def common_suffix_length(a, b, limit):
+    """Returns the length of the longest common suffix of `a` and `b`, up to
+    `limit`."""
+    lo, hi = 0, limit
+    len_a, len_b = len(a), len(b)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[len_a - mid : len_a - lo] == b[len_b - mid : len_b - lo]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+class StatementIndex:
+    """Start offsets of the statements in a buffer, as sqlparse splits them.
+
+    Splitting a long buffer, such as a migration opened with \\e, on every key
+    press is slow. Instead, update() finds the part of the buffer that changed
+    since the last call and splits it again, from the statement before the
+    change until a statement starts where one started before. Strings, dollar
+    quotes and comments are handled by sqlparse's lexer and splitter, run
+    from that statement only.
+
+    An unclosed quote or comment is lexed as if it was a single character,
+    but closing it changes the tokens after it: the index also keeps where
+    they are, and splits again from the first one before the change.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._text = ""
+        self._starts = [0]
+        self._unclosed = []
+
+    def update(self, text):
+        """Updates the index for the new contents of the buffer, and returns
+        the statement start offsets."""
+        with self._lock:
+            self._update(text)
+            return list(self._starts)
+
+    def statement_start(self, text, position):
+        """Returns the offset of the start of the statement that `position`
+        is in, like _split_multiple_statements() picks it: a statement ending
+        at `position` contains it, and so does the statement before trailing
+        whitespace."""
+        with self._lock:
+            self._update(text)
+            starts = self._starts
+            i = bisect_left(starts, position) - 1
+            while i > 0 and text[starts[i] : position].isspace():
+                i -= 1
+            return starts[max(i, 0)]
+
+    def is_open_quote(self, text):
+        """Same as utils.is_open_quote(text), found from the tokens of the
+        changed part of `text` only."""
+        with self._lock:
+            self._update(text)
+            # Unclosed quotes are Error tokens, unlike the other openings
+            return any(text[position] in "'$" for position in self._unclosed)
+
+    def _update(self, text):
+        old = self._text
+        if text is old or text == old:
+            return
+        prefix = common_prefix_length(old, text)
+        suffix = common_suffix_length(old, text, min(len(old), len(text)) - prefix)
+        delta = len(text) - len(old)
+        changed_end = len(text) - suffix
+        starts, unclosed = self._starts, self._unclosed
+
+        if unclosed and unclosed[0] < prefix:
+            prefix = unclosed[0]
+        # The statement containing the change may not start where it did,
+        # e.g. if its first token changed into a comment, but the previous
+        # one does.
+        i = max(bisect_left(starts, prefix) - 2, 0)
+        pos = starts[i]
+        new_starts = starts[: i + 1]
+        new_unclosed = unclosed[: bisect_left(unclosed, pos)]
+        # Past the change, a statement starting where one did before is
+        # followed by the same statements.
+        old_starts = starts[bisect_right(starts, changed_end - delta) :]
+
+        def stream():
+            previous = None
+            for tok in get_tokens(text, pos):
+                if tok.ttype is T.Error or tok.value == "[" or (previous and previous.value[-1] == "/" and tok.value == "*"):
+                    new_unclosed.append(tok.start)
+                previous = tok
+                yield tok.ttype, tok.value
+
+        for statement in StatementSplitter().process(stream()):
+            pos += len(str(statement))
+            if pos >= len(text):
+                break
+            if pos > changed_end:
+                j = bisect_left(old_starts, pos - delta)
+                if j < len(old_starts) and old_starts[j] == pos - delta:
+                    new_starts.extend(start + delta for start in old_starts[j:])
+                    # The splitter has read the first token of the statement
+                    del new_unclosed[bisect_left(new_unclosed, pos) :]
+                    new_unclosed.extend(u + delta for u in unclosed[bisect_left(unclosed, pos - delta) :])
+                    break
+            new_starts.append(pos)
+
+        self._text = text
+        self._starts = new_starts
+        self._unclosed = new_unclosed
@@ -2,6 +2,7 @@ import sqlparse
 from collections import namedtuple
 from sqlparse.sql import IdentifierList, Identifier, Function
 from sqlparse.tokens import Keyword, DML, Punctuation
+from .utils import parse
 
 sqlparse.engine.grouping.MAX_GROUPING_DEPTH = None
 sqlparse.engine.grouping.MAX_GROUPING_TOKENS = None
@@ -132,7 +133,7 @@ def extract_tables(sql):
     Returns a list of TableReference namedtuples
 
     """
-    parsed = sqlparse.parse(sql)
+    parsed = parse(sql)
     if not parsed:
         return ()
 
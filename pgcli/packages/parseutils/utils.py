@@ -1,4 +1,6 @@
 import re
+from functools import lru_cache
+
 import sqlparse
 from sqlparse.sql import Identifier
 from sqlparse.tokens import Token, Error
@@ -66,6 +68,17 @@ def last_word(text, include="alphanum_underscore"):
             return ""
 
 
+@lru_cache(maxsize=16)
+def parse(sql):
+    """Returns sqlparse.parse(sql).
+
+    Completing a statement parses the same text several times, so the last
+    results are kept. They are shared: callers must not modify the parsed
+    statements.
+    """
+    return sqlparse.parse(sql)
+
+
 def find_prev_keyword(sql, n_skip=0):
     """Find the last sql keyword in an SQL statement
 
@@ -75,7 +88,7 @@ def find_prev_keyword(sql, n_skip=0):
     if not sql.strip():
         return None, ""
 
-    parsed = sqlparse.parse(sql)[0]
+    parsed = parse(sql)[0]
     flattened = list(parsed.flatten())
     flattened = flattened[: len(flattened) - n_skip]
 
@@ -109,7 +122,7 @@ def is_open_quote(sql):
     """Returns true if the query contains an unclosed quote"""
 
     # parsed can contain one or more semi-colon separated commands
-    parsed = sqlparse.parse(sql)
+    parsed = parse(sql)
     return any(_parsed_is_open_quote(p) for p in parsed)
 
 
@@ -129,7 +142,7 @@ def parse_partial_identifier(word):
     :return: sqlparse.sql.Identifier, or None
     """
 
-    p = sqlparse.parse(word)[0]
+    p = parse(word)[0]
     n_tok = len(p.tokens)
     if n_tok == 1 and isinstance(p.tokens[0], Identifier):
         return p.tokens[0]
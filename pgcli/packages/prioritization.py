@@ -8,6 +8,7 @@ sqlparse.engine.grouping.MAX_GROUPING_DEPTH = None
 sqlparse.engine.grouping.MAX_GROUPING_TOKENS = None
 
 white_space_regex = re.compile("\\s+", re.MULTILINE)
+word_regex = re.compile("\\w+")
 
 
 def _compile_regex(keyword):
@@ -21,10 +22,78 @@ keywords = get_literals("keywords")
 keyword_regexs = {kw: _compile_regex(kw) for kw in keywords}
 
 
+class KeywordMatcher:
+    """Counts the matches of each of keyword_regexs in a text, in one pass.
+
+    A keyword matches whole words: the words of the text are looked up in
+    those of the keywords, and keywords of several words are matched when
+    their words are only separated by whitespace. Like separate finditer()
+    calls, keywords contained in others (e.g. VIEW and MATERIALIZED VIEW)
+    are each counted, and the matches of a keyword don't overlap.
+    """
+
+    def __init__(self, keywords):
+        words = []
+        for keyword in keywords:
+            words.extend(w for w in keyword.split() if w not in words)
+        self.word_ids = {w: i for i, w in enumerate(words, 1)}
+        # Matches non ASCII words like the keyword regexes, e.g. "ſelect".
+        # Each word is a group, whose number identifies it.
+        self.word_regex = re.compile("|".join("({})".format(w) for w in words), re.IGNORECASE)
+        self.keywords = {}
+        self.prefixes = set()
+        for keyword in keywords:
+            key = tuple(self.word_ids[w] for w in keyword.split())
+            self.keywords[key] = keyword
+            self.prefixes.update(key[:i] for i in range(1, len(key)))
+
+    def _word_id(self, word):
+        if word.isascii():
+            return self.word_ids.get(word.upper())
+        match = self.word_regex.fullmatch(word)
+        return match and match.lastindex
+
+    def counts(self, text):
+        """Returns the number of matches of each keyword in `text`."""
+        counts = defaultdict(int)
+        # The end of the last match of each keyword
+        ends = {}
+        # Keywords being matched, as (words so far, start)
+        partial = []
+        previous_end = 0
+        for match in word_regex.finditer(text):
+            word = self._word_id(match.group())
+            if word is None:
+                partial = []
+                continue
+            start, end = match.span()
+            if partial and white_space_regex.fullmatch(text, previous_end, start):
+                candidates = [(words + (word,), s) for words, s in partial]
+            else:
+                candidates = []
+            candidates.append(((word,), start))
+            partial = []
+            for words, s in candidates:
+                keyword = self.keywords.get(words)
+                if keyword is not None and s >= ends.get(keyword, 0):
+                    counts[keyword] += 1
+                    ends[keyword] = end
+                if words in self.prefixes:
+                    partial.append((words, s))
+            previous_end = end
+        return counts
+
+
+keyword_matcher = KeywordMatcher(keywords)
+
+
 class PrevalenceCounter:
     def __init__(self):
         self.keyword_counts = defaultdict(int)
         self.name_counts = defaultdict(int)
+        # Counts added since take_updates() was last called, to be saved
+        self.keyword_updates = defaultdict(int)
+        self.name_updates = defaultdict(int)
 
     def update(self, text):
         self.update_keywords(text)
@@ -35,16 +104,32 @@ class PrevalenceCounter:
             for token in parsed.flatten():
                 if token.ttype in Name:
                     self.name_counts[token.value] += 1
+                    self.name_updates[token.value] += 1
 
     def clear_names(self):
         self.name_counts = defaultdict(int)
+        self.name_updates = defaultdict(int)
+
+    def load(self, keyword_counts, name_counts):
+        """Adds counts, e.g. those saved by earlier sessions."""
+        for counts, loaded in ((self.keyword_counts, keyword_counts), (self.name_counts, name_counts)):
+            for key, count in loaded.items():
+                counts[key] += count
+
+    def take_updates(self):
+        """Returns the (keyword_counts, name_counts) added since the last
+        call."""
+        updates = self.keyword_updates, self.name_updates
+        self.keyword_updates = defaultdict(int)
+        self.name_updates = defaultdict(int)
+        return updates
 
     def update_keywords(self, text):
         # Count keywords. Can't rely for sqlparse for this, because it's
         # database agnostic
-        for keyword, regex in keyword_regexs.items():
-            for _ in regex.finditer(text):
-                self.keyword_counts[keyword] += 1
+        for keyword, count in keyword_matcher.counts(text).items():
+            self.keyword_counts[keyword] += count
+            self.keyword_updates[keyword] += count
 
     def keyword_count(self, keyword):
         return self.keyword_counts[keyword]
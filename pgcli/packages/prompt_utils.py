@@ -11,13 +11,25 @@ def confirm_destructive_query(queries, keywords, alias):
     * True if the query is destructive and the user wants to proceed.
     * False if the query is destructive and the user doesn't want to proceed.
 
+    """
+    if is_destructive(queries, keywords):
+        return confirm_destructive(alias)
+
+
+def confirm_destructive(alias):
+    """Prompts the user to confirm running a query already found to be
+    destructive.
+
+    Returns None if we can't prompt the user, else whether the user wants to
+    proceed.
+
     """
     info = "You're about to run a destructive command"
     if alias:
         info += f" in {click.style(alias, fg='red')}"
 
     prompt_text = f"{info}.\nDo you want to proceed?"
-    if is_destructive(queries, keywords) and sys.stdin.isatty():
+    if sys.stdin.isatty():
         return confirm(prompt_text)
 
 
@@ -2,9 +2,11 @@ import re
 import sqlparse
 from collections import namedtuple
 from sqlparse.sql import Comparison, Identifier, Where
-from .parseutils.utils import last_word, find_prev_keyword, parse_partial_identifier
+from sqlparse.tokens import DML
+from .parseutils.utils import last_word, find_prev_keyword, parse, parse_partial_identifier
 from .parseutils.tables import extract_tables
 from .parseutils.ctes import isolate_query_ctes
+from .parseutils import lexer
 from pgspecial.main import parse_special_command
 
 sqlparse.engine.grouping.MAX_GROUPING_DEPTH = None
@@ -67,13 +69,13 @@ class SqlStatement:
         # keywords as completion.
         if self.word_before_cursor:
             if word_before_cursor[-1] == "(" or word_before_cursor[0] == "\\":
-                parsed = sqlparse.parse(text_before_cursor)
+                parsed = parse(text_before_cursor)
             else:
                 text_before_cursor = text_before_cursor[: -len(word_before_cursor)]
-                parsed = sqlparse.parse(text_before_cursor)
+                parsed = parse(text_before_cursor)
                 self.identifier = parse_partial_identifier(word_before_cursor)
         else:
-            parsed = sqlparse.parse(text_before_cursor)
+            parsed = parse(text_before_cursor)
 
         full_text, text_before_cursor, parsed = _split_multiple_statements(full_text, text_before_cursor, parsed)
 
@@ -127,6 +129,10 @@ def suggest_type(full_text, text_before_cursor):
     if full_text.startswith("\\i "):
         return (Path(),)
 
+    suggestions = _suggest_simple_select(full_text, text_before_cursor)
+    if suggestions is not None:
+        return suggestions
+
     # This is a temporary hack; the exception handling
     # here should be removed once sqlparse has been fixed
     try:
@@ -146,6 +152,118 @@ def suggest_type(full_text, text_before_cursor):
     return suggest_based_on_last_token(stmt.last_token, stmt)
 
 
+class SimpleStatement:
+    """The parts of a SqlStatement that suggestions for a simple SELECT
+    statement use, found from its tokens by _suggest_simple_select()."""
+
+    local_tables = ()
+
+    def __init__(self, identifier, tables):
+        self.identifier = identifier
+        self.tables = tables
+
+    def get_tables(self, scope="full"):
+        return self.tables[scope]
+
+    get_identifier_schema = SqlStatement.get_identifier_schema
+
+
+# Keywords that sqlparse leaves as the last token of a statement, so that
+# suggest_based_on_last_token() gets them as they are
+SIMPLE_LAST_KEYWORDS = ("select", "distinct", "from", "where", "order by", "having", "on", "and", "or")
+# Keywords that suggest_based_on_last_token() handles with the rest of the
+# parsed statement
+PARSED_KEYWORDS = (
+    "set",
+    "copy",
+    "into",
+    "update",
+    "describe",
+    "truncate",
+    "function",
+    "table",
+    "view",
+    "column",
+    "c",
+    "use",
+    "database",
+    "template",
+    "schema",
+    "type",
+    "alter",
+    "create",
+    "drop",
+    "to",
+)
+
+
+def _suggest_simple_select(full_text, text_before_cursor):
+    """Returns the same suggestions as suggest_based_on_last_token() for a
+    simple SELECT statement, using parseutils.lexer instead of parsing the
+    statement, or None if the statement isn't simple enough."""
+    word_before_cursor = last_word(text_before_cursor, include="many_punctuations")
+    if word_before_cursor and (word_before_cursor[-1] == "(" or word_before_cursor[0] == "\\"):
+        return None
+    text_before_cursor = text_before_cursor[: len(text_before_cursor) - len(word_before_cursor)]
+    full_tokens = lexer.tokenize(full_text)
+    tokens = lexer.tokenize(text_before_cursor)
+    if not (full_tokens and tokens and lexer.is_simple(full_tokens) and lexer.is_simple(tokens)):
+        return None
+    if not (tokens[0].ttype is DML and tokens[0].normalized == "SELECT"):
+        return None
+
+    token = tokens[-1]
+    token_v = token.value.lower()
+    allow_join = allow_join_condition = False
+    if lexer.in_where(tokens):
+        # sqlparse groups the WHERE clause into a single token
+        token, text_before_cursor, tokens = lexer.find_prev_keyword(text_before_cursor, tokens)
+    elif token_v == "," or (token.is_keyword and (token_v in SIMPLE_LAST_KEYWORDS or token_v.endswith("join"))):
+        if len(tokens) > 1 and tokens[-2].value == ",":
+            # sqlparse groups e.g. 'a, FROM' into an IdentifierList
+            return None
+        allow_join = token_v.endswith("join") and token_v not in ("cross join", "natural join")
+        allow_join_condition = token_v in ("on", "and", "or")
+        if token_v in (",", "and", "or"):
+            token, text_before_cursor, tokens = lexer.find_prev_keyword(text_before_cursor, tokens)
+            if token is None:
+                return ()
+    else:
+        return None
+
+    try:
+        identifier = parse_partial_identifier(word_before_cursor) if word_before_cursor else None
+    except (TypeError, AttributeError):
+        return None
+
+    while token.value != "(":
+        token_v = token.value.lower()
+        if token_v in ("select", "where", "having", "order by", "distinct"):
+            tables = lexer.extract_tables(full_text, full_tokens)
+            if tables is None:
+                return None
+            return _suggest_expression(token_v, SimpleStatement(identifier, {"full": tables}))
+        elif token_v == "as":
+            return ()
+        elif token_v == "from" or token_v.endswith("join") or token_v == "on":
+            tables = lexer.extract_tables(text_before_cursor, tokens)
+            if tables is None:
+                return None
+            stmt = SimpleStatement(identifier, {"before": tables})
+            if token_v == "on":
+                return _suggest_join_condition(stmt, allow_join_condition)
+            return _suggest_relation(token_v, token_v != "from", stmt, tables, allow_join)
+        elif token_v in PARSED_KEYWORDS:
+            return None
+        else:
+            # A keyword without special handling, see suggest_based_on_last_token()
+            prev_keyword, text_before_cursor, tokens = lexer.find_prev_keyword(text_before_cursor, tokens, n_skip=1)
+            if not prev_keyword:
+                return (Keyword(token_v.upper()),)
+            token = prev_keyword
+    return None
+
+
 named_query_regex = re.compile(r"^\s*\\ns\s+[A-z0-9\-_]+\s+")
 
 
@@ -178,7 +296,7 @@ def _statement_from_function(full_text, text_before_cursor, statement):
         return full_text, text_before_cursor, statement
     full_text = full_text[body_start:body_end]
     text_before_cursor = text_before_cursor[body_start:]
-    parsed = sqlparse.parse(text_before_cursor)
+    parsed = parse(text_before_cursor)
     return _split_multiple_statements(full_text, text_before_cursor, parsed)
 
 
@@ -317,7 +435,7 @@ def suggest_based_on_last_token(token, stmt):
     if not token:
         return (Keyword(), Special())
     elif token_v.endswith("("):
-        p = sqlparse.parse(stmt.text_before_cursor)[0]
+        p = parse(stmt.text_before_cursor)[0]
 
         if p.tokens and isinstance(p.tokens[-1], Where):
             # Four possibilities:
@@ -375,7 +493,7 @@ def suggest_based_on_last_token(token, stmt):
         return _suggest_expression(token_v, stmt)
     elif token_v == "set":
         # "set" for changing a run-time parameter
-        p = sqlparse.parse(stmt.text_before_cursor)[0]
+        p = parse(stmt.text_before_cursor)[0]
         is_first_token = p.token_first().value.upper() == token_v.upper()
         if is_first_token:
             return (Keyword(token_v.upper()),)
@@ -389,30 +507,8 @@ def suggest_based_on_last_token(token, stmt):
         # Don't suggest anything for aliases
         return ()
     elif (token_v.endswith("join") and token.is_keyword) or (token_v in ("copy", "from", "update", "into", "describe", "truncate")):
-        schema = stmt.get_identifier_schema()
-        tables = extract_tables(stmt.text_before_cursor)
         is_join = token_v.endswith("join") and token.is_keyword
-
-        # Suggest tables from either the currently-selected schema or the
-        # public schema if no schema has been specified
-        suggest = []
-
-        if not schema:
-            # Suggest schemas
-            suggest.insert(0, Schema())
-
-        if token_v == "from" or is_join:
-            suggest.append(FromClauseItem(schema=schema, table_refs=tables, local_tables=stmt.local_tables))
-        elif token_v == "truncate":
-            suggest.append(Table(schema))
-        else:
-            suggest.extend((Table(schema), View(schema)))
-
-        if is_join and _allow_join(stmt.parsed):
-            tables = stmt.get_tables("before")
-            suggest.append(Join(table_refs=tables, schema=schema))
-
-        return tuple(suggest)
+        return _suggest_relation(token_v, is_join, stmt, extract_tables(stmt.text_before_cursor), _allow_join(stmt.parsed))
 
     elif token_v == "function":
         schema = stmt.get_identifier_schema()
@@ -450,32 +546,7 @@ def suggest_based_on_last_token(token, stmt):
         return (Column(table_refs=stmt.get_tables()),)
 
     elif token_v == "on":
-        tables = stmt.get_tables("before")
-        parent = (stmt.identifier and stmt.identifier.get_parent_name()) or None
-        if parent:
-            # "ON parent.<suggestion>"
-            # parent can be either a schema name or table alias
-            filteredtables = tuple(t for t in tables if identifies(parent, t))
-            sugs = [
-                Column(table_refs=filteredtables, local_tables=stmt.local_tables),
-                Table(schema=parent),
-                View(schema=parent),
-                Function(schema=parent),
-            ]
-            if filteredtables and _allow_join_condition(stmt.parsed):
-                sugs.append(JoinCondition(table_refs=tables, parent=filteredtables[-1]))
-            return tuple(sugs)
-        else:
-            # ON <suggestion>
-            # Use table alias if there is one, otherwise the table name
-            aliases = tuple(t.ref for t in tables)
-            if _allow_join_condition(stmt.parsed):
-                return (
-                    Alias(aliases=aliases),
-                    JoinCondition(table_refs=tables, parent=None),
-                )
-            else:
-                return (Alias(aliases=aliases),)
+        return _suggest_join_condition(stmt, _allow_join_condition(stmt.parsed))
 
     elif token_v in ("c", "use", "database", "template"):
         # "\c <db", "use <db>", "DROP DATABASE <db>",
@@ -519,6 +590,67 @@ def suggest_based_on_last_token(token, stmt):
         return (Keyword(),)
 
 
+def _suggest_relation(token_v, is_join, stmt, tables, allow_join):
+    """
+    Return suggestions after FROM, JOIN and the other keywords followed by a
+    table name. `tables` are the tables before the cursor.
+    """
+    schema = stmt.get_identifier_schema()
+
+    # Suggest tables from either the currently-selected schema or the
+    # public schema if no schema has been specified
+    suggest = []
+
+    if not schema:
+        # Suggest schemas
+        suggest.insert(0, Schema())
+
+    if token_v == "from" or is_join:
+        suggest.append(FromClauseItem(schema=schema, table_refs=tables, local_tables=stmt.local_tables))
+    elif token_v == "truncate":
+        suggest.append(Table(schema))
+    else:
+        suggest.extend((Table(schema), View(schema)))
+
+    if is_join and allow_join:
+        tables = stmt.get_tables("before")
+        suggest.append(Join(table_refs=tables, schema=schema))
+
+    return tuple(suggest)
+
+
+def _suggest_join_condition(stmt, allow_join_condition):
+    """
+    Return suggestions after ON.
+    """
+    tables = stmt.get_tables("before")
+    parent = (stmt.identifier and stmt.identifier.get_parent_name()) or None
+    if parent:
+        # "ON parent.<suggestion>"
+        # parent can be either a schema name or table alias
+        filteredtables = tuple(t for t in tables if identifies(parent, t))
+        sugs = [
+            Column(table_refs=filteredtables, local_tables=stmt.local_tables),
+            Table(schema=parent),
+            View(schema=parent),
+            Function(schema=parent),
+        ]
+        if filteredtables and allow_join_condition:
+            sugs.append(JoinCondition(table_refs=tables, parent=filteredtables[-1]))
+        return tuple(sugs)
+    else:
+        # ON <suggestion>
+        # Use table alias if there is one, otherwise the table name
+        aliases = tuple(t.ref for t in tables)
+        if allow_join_condition:
+            return (
+                Alias(aliases=aliases),
+                JoinCondition(table_refs=tables, parent=None),
+            )
+        else:
+            return (Alias(aliases=aliases),)
+
+
 def _suggest_expression(token_v, stmt):
     """
     Return suggestions for an expression, taking account of any partially-typed
@@ -8,11 +8,16 @@ from .packages.parseutils.utils import is_open_quote
 _logger = logging.getLogger(__name__)
 
 
-def _is_complete(sql):
+def _is_complete(sql, statement_index=None):
     # A complete command is an sql statement that ends with a semicolon, unless
     # there's an open quote surrounding it, as is common when writing a
-    # CREATE FUNCTION command
-    return sql.endswith(";") and not is_open_quote(sql)
+    # CREATE FUNCTION command. The statement index of the completer only
+    # looks for quotes in what changed since it last saw the buffer.
+    if not sql.rstrip().endswith(";"):
+        return False
+    if statement_index is not None:
+        return not statement_index.is_open_quote(sql)
+    return not is_open_quote(sql)
 
 
 """
@@ -48,7 +53,7 @@ def buffer_should_be_handled(pgcli):
         return (
             text.startswith("\\")
             or text.endswith((r"\e", r"\G"))
-            or _is_complete(text)
+            or _is_complete(doc.text, pgcli.completer.statement_index)
             or text == "exit"
             or text == "quit"
             or text == ":q"
@@ -1,6 +1,8 @@
 import json
 import logging
 import re
+import threading
+import heapq
 from itertools import count, chain
 import operator
 from collections import namedtuple, defaultdict, OrderedDict
@@ -27,16 +29,26 @@ from .packages.sqlcompletion import (
     JoinCondition,
     Join,
 )
-from .packages.parseutils.meta import ColumnMetadata, ForeignKey
+from .packages.parseutils.meta import ColumnTable, ForeignKey
+from .packages.parseutils.statements import StatementIndex
 from .packages.parseutils.utils import last_word
 from .packages.parseutils.tables import TableReference
 from .packages.pgliterals.main import get_literals
 from .packages.prioritization import PrevalenceCounter
+from .packages.completion_index import NameIndex, fold, lexical_priority
 
 _logger = logging.getLogger(__name__)
 
 Match = namedtuple("Match", ["completion", "priority"])
 
+# The completions computed for the last word typed in a given context: `calls`
+# holds a (mode, meta, candidates) tuple for each find_matches call made, with
+# the candidates that matched. See PGCompleter._narrowed_matches.
+_CompletionSession = namedtuple("CompletionSession", "key word calls")
+
+# Characters that can be typed without changing the completion context.
+narrowing_suffix_regex = re.compile(r"^[\w$]*$")
+
 _SchemaObject = namedtuple("SchemaObject", "name schema meta")
 
 
@@ -81,6 +93,10 @@ class InvalidMapFile(ValueError):
     pass
 
 
+class CompletionCancelled(Exception):
+    """Raised while matching when a newer completion was requested."""
+
+
 def load_alias_map_file(path):
     try:
         with open(path) as fo:
@@ -126,6 +142,28 @@ class PGCompleter(Completer):
         self.generate_casing_file = settings.get("generate_casing_file")
         self.qualify_columns = settings.get("qualify_columns", "if_more_than_one_table")
         self.asterisk_column_order = settings.get("asterisk_column_order", "table_order")
+        # In lazy mode, columns are only loaded when a relation is used, by
+        # calling column_loader(schema_name, rel_name). At most
+        # lazy_column_cache_size relations keep their columns loaded.
+        self.lazy_columns = settings.get("lazy_column_loading", False)
+        self.lazy_column_cache_size = settings.get("lazy_column_cache_size", 1000)
+        self.column_loader = None
+        # At most max_completions completions are returned, 0 means no limit.
+        self.max_completions = settings.get("max_completions", 500)
+        self._loaded_relations = OrderedDict()
+        self._relation_foreignkeys = {}
+        self._columns_lock = threading.Lock()
+        # The last completion session, and the find_matches calls being
+        # recorded and the completion request handled by the current thread.
+        self._session = None
+        self._local = threading.local()
+        # Each completion request gets a new number. Matching for older
+        # requests stops, since their results are no longer wanted.
+        self._latest_request = 0
+        self._request_lock = threading.Lock()
+        # Where the statements of the buffer start, so that only the one
+        # being edited is parsed.
+        self.statement_index = StatementIndex()
 
         keyword_casing = settings.get("keyword_casing", "upper").lower()
         if keyword_casing not in ("upper", "lower", "auto"):
@@ -137,6 +175,12 @@ class PGCompleter(Completer):
         self.dbmetadata = {"tables": {}, "views": {}, "functions": {}, "datatypes": {}}
         self.search_path = []
         self.casing = {}
+        # Versions of the catalog objects in dbmetadata, used to refresh only
+        # what changed. See PGExecute.catalog_snapshot.
+        self.catalog_snapshot = None
+        # Names of the tables, views, functions and data types, used to
+        # narrow down the candidates before fuzzy matching.
+        self.name_index = NameIndex()
 
         self.all_completions = set(self.keywords + self.functions)
 
@@ -180,6 +224,24 @@ class PGCompleter(Completer):
 
         self.all_completions.update(schemata)
 
+    def copy_metadata(self, completer):
+        """Copy the schema, relation, function and data type metadata of
+        another completer.
+
+        The copy is shallow, but the drop_* and extend_* methods can be used
+        on it without affecting the other completer.
+        """
+        self.dbmetadata = {
+            kind: {schema: dict(objects) for schema, objects in metadata.items()} for kind, metadata in completer.dbmetadata.items()
+        }
+        self.all_completions = set(completer.all_completions)
+        self.name_index = completer.name_index.copy()
+        self.casing = completer.casing
+        self._arg_list_cache = completer._arg_list_cache
+        self.column_loader = completer.column_loader
+        self._loaded_relations = OrderedDict(completer._loaded_relations)
+        self._relation_foreignkeys = dict(completer._relation_foreignkeys)
+
     def extend_casing(self, words):
         """extend casing data
 
@@ -200,15 +262,35 @@ class PGCompleter(Completer):
 
         data = [self.escaped_names(d) for d in data]
 
-        # dbmetadata['tables']['schema_name']['table_name'] should be an
-        # OrderedDict {column_name:ColumnMetaData}.
+        # dbmetadata['tables']['schema_name']['table_name'] should be a
+        # ColumnTable {column_name:ColumnMetaData}.
         metadata = self.dbmetadata[kind]
         for schema, relname in data:
             try:
-                metadata[schema][relname] = OrderedDict()
+                metadata[schema][relname] = ColumnTable()
             except KeyError:
                 _logger.error("%r %r listed in unrecognized schema %r", kind, relname, schema)
             self.all_completions.add(relname)
+            self.name_index.add(relname)
+
+    def drop_relations(self, data, kind):
+        """drop metadata for tables or views.
+
+        :param data: list of (schema_name, rel_name) tuples
+        :param kind: either 'tables' or 'views'
+
+        :return:
+
+        """
+        metadata = self.dbmetadata[kind]
+        names = set()
+        for schema, relname in data:
+            schema, relname = self.escaped_names([schema, relname])
+            names.add(relname)
+            names.update(metadata.get(schema, {}).pop(relname, ()))
+            self._loaded_relations.pop((kind, schema, relname), None)
+            self._relation_foreignkeys.pop((schema, relname), None)
+        self._discard_completions(names)
 
     def extend_columns(self, column_data, kind):
         """extend column metadata.
@@ -223,13 +305,7 @@ class PGCompleter(Completer):
         metadata = self.dbmetadata[kind]
         for schema, relname, colname, datatype, has_default, default in column_data:
             (schema, relname, colname) = self.escaped_names([schema, relname, colname])
-            column = ColumnMetadata(
-                name=colname,
-                datatype=datatype,
-                has_default=has_default,
-                default=default,
-            )
-            metadata[schema][relname][colname] = column
+            metadata[schema][relname].add_column(colname, datatype, has_default, default)
             self.all_completions.add(colname)
 
     def extend_functions(self, func_data):
@@ -248,9 +324,48 @@ class PGCompleter(Completer):
                 metadata[schema][func] = [f]
 
             self.all_completions.add(func)
+            self.name_index.add(func)
 
         self._refresh_arg_list_cache()
 
+    def drop_functions(self, data):
+        """drop metadata for functions, including all their overloads.
+
+        :param data: list of (schema_name, func_name) tuples
+        """
+        metadata = self.dbmetadata["functions"]
+        names = set()
+        for schema, func in data:
+            schema, func = self.escaped_names([schema, func])
+            metadata.get(schema, {}).pop(func, None)
+            names.add(func)
+        self._discard_completions(names)
+
+        self._refresh_arg_list_cache()
+
+    def drop_datatypes(self):
+        """drop metadata for all data types, before reloading them."""
+        metadata = self.dbmetadata["datatypes"]
+        names = {type_name for types in metadata.values() for type_name in types}
+        self.dbmetadata["datatypes"] = {schema: {} for schema in metadata}
+        self._discard_completions(names)
+
+    def _discard_completions(self, names):
+        """Removes `names` from all_completions, except those still used by a
+        keyword, schema, relation, column, function or data type."""
+        names = set(names) & self.all_completions
+        names.difference_update(self.keywords, self.functions)
+        for kind, metadata in self.dbmetadata.items():
+            if not names:
+                return
+            names.difference_update(metadata)
+            for objects in metadata.values():
+                names.difference_update(objects)
+                if kind in ("tables", "views"):
+                    for columns in objects.values():
+                        names.difference_update(columns)
+        self.all_completions.difference_update(names)
+
     def _refresh_arg_list_cache(self):
         # We keep a cache of {function_usage:{function_metadata: function_arg_list_string}}
         # This is used when suggesting functions, to avoid the latency that would result
@@ -265,25 +380,37 @@ class PGCompleter(Completer):
             for usage in ("call", "call_display", "signature")
         }
 
-    def extend_foreignkeys(self, fk_data):
+    def extend_foreignkeys(self, fk_data, relations=None):
         # fk_data is a list of ForeignKey namedtuples, with fields
         # parentschema, childschema, parenttable, childtable,
         # parentcolumns, childcolumns
 
         # These are added as a list of ForeignKey namedtuples to the
-        # ColumnMetadata namedtuple for both the child and parent
+        # ColumnMetadata namedtuple for both the child and parent. If
+        # relations is given, only columns of these (schema_name, rel_name)
+        # tables are updated.
         meta = self.dbmetadata["tables"]
 
         for fk in fk_data:
+            update_child = relations is None or (fk.childschema, fk.childtable) in relations
+            update_parent = relations is None or (fk.parentschema, fk.parenttable) in relations
             e = self.escaped_names
             parentschema, childschema = e([fk.parentschema, fk.childschema])
             parenttable, childtable = e([fk.parenttable, fk.childtable])
             childcol, parcol = e([fk.childcolumn, fk.parentcolumn])
-            childcolmeta = meta[childschema][childtable][childcol]
-            parcolmeta = meta[parentschema][parenttable][parcol]
             fk = ForeignKey(parentschema, parenttable, parcol, childschema, childtable, childcol)
-            childcolmeta.foreignkeys.append(fk)
-            parcolmeta.foreignkeys.append(fk)
+            if self.lazy_columns:
+                # Columns don't exist yet, keep the foreign keys until they
+                # are loaded.
+                if update_child:
+                    self._relation_foreignkeys.setdefault((childschema, childtable), []).append(fk)
+                if update_parent and (parentschema, parenttable) != (childschema, childtable):
+                    self._relation_foreignkeys.setdefault((parentschema, parenttable), []).append(fk)
+                continue
+            if update_child:
+                meta[childschema][childtable].add_foreignkey(childcol, fk)
+            if update_parent:
+                meta[parentschema][parenttable].add_foreignkey(parcol, fk)
 
     def extend_datatypes(self, type_data):
         # dbmetadata['datatypes'][schema_name][type_name] should store type
@@ -295,6 +422,7 @@ class PGCompleter(Completer):
             schema, type_name = self.escaped_names(t)
             meta[schema][type_name] = None
             self.all_completions.add(type_name)
+            self.name_index.add(type_name)
 
     def extend_query_history(self, text, is_init=False):
         if is_init:
@@ -306,12 +434,18 @@ class PGCompleter(Completer):
 
     def set_search_path(self, search_path):
         self.search_path = self.escaped_names(search_path)
+        self._session = None
 
     def reset_completions(self):
         self.databases = []
         self.special_commands = []
         self.search_path = []
         self.dbmetadata = {"tables": {}, "views": {}, "functions": {}, "datatypes": {}}
+        self.catalog_snapshot = None
+        self._session = None
+        self._loaded_relations = OrderedDict()
+        self._relation_foreignkeys = {}
+        self.name_index = NameIndex()
         self.all_completions = set(self.keywords + self.functions)
 
     def find_matches(self, text, collection, mode="fuzzy", meta=None):
@@ -382,7 +516,7 @@ class PGCompleter(Completer):
                     # E.g. for input `e`, 'Entries E' should be on top
                     # (before e.g. `EndUsers EU`)
                     return float("Infinity"), -1
-                r = pat.search(self.unescape_name(item.lower()))
+                r = pat.search(fold(item))
                 if r:
                     return -len(r.group()), -r.start()
 
@@ -396,8 +530,12 @@ class PGCompleter(Completer):
                     # fuzzy matches
                     return -float("Infinity"), -match_point
 
+        request = getattr(self._local, "request", None)
         matches = []
-        for cand in collection:
+        matched = []
+        for i, cand in enumerate(collection):
+            if request is not None and not i % 256 and request != self._latest_request:
+                raise CompletionCancelled()
             if isinstance(cand, _Candidate):
                 item, prio, display_meta, synonyms, prio2, display = cand
                 if display_meta is None:
@@ -411,22 +549,15 @@ class PGCompleter(Completer):
                 sort_key = _match(cand)
 
             if sort_key:
+                matched.append(cand)
                 if display_meta and len(display_meta) > 50:
                     # Truncate meta-text to 50 characters, if necessary
                     display_meta = display_meta[:47] + "..."
 
                 # Lexical order of items in the collection, used for
                 # tiebreaking items with the same match group length and start
-                # position. Since we use *higher* priority to mean "more
-                # important," we use -ord(c) to prioritize "aa" > "ab" and end
-                # with 1 to prioritize shorter strings (ie "user" > "users").
-                # We first do a case-insensitive sort and then a
-                # case-sensitive one as a tie breaker.
-                # We also use the unescape_name to make sure quoted names have
-                # the same priority as unquoted names.
-                lexical_priority = (
-                    tuple(0 if c in " _" else -ord(c) for c in self.unescape_name(item.lower())) + (1,) + tuple(c for c in item)
-                )
+                # position.
+                lexical_key = lexical_priority(item)
 
                 item = self.case(item)
                 display = self.case(display)
@@ -436,7 +567,7 @@ class PGCompleter(Completer):
                     prio,
                     priority_func(item),
                     prio2,
-                    lexical_priority,
+                    lexical_key,
                 )
                 matches.append(
                     Match(
@@ -449,40 +580,121 @@ class PGCompleter(Completer):
                         priority=priority,
                     )
                 )
+        calls = getattr(self._local, "calls", None)
+        if calls is not None:
+            calls.append((mode, meta, matched))
         return matches
 
     def case(self, word):
         return self.casing.get(word, word)
 
     def get_completions(self, document, complete_event, smart_completion=None):
-        word_before_cursor = document.get_word_before_cursor(WORD=True)
+        return list(self.iter_completions(document, complete_event, smart_completion))
+
+    def iter_completions(self, document, complete_event, smart_completion=None):
+        """Yields the completions for `document`, best first, up to
+        max_completions of them.
 
+        Requesting other completions in the meantime, e.g. because another
+        key was pressed, cancels this request: nothing is yielded.
+        """
         if smart_completion is None:
             smart_completion = self.smart_completion
 
+        with self._request_lock:
+            self._latest_request += 1
+            self._local.request = self._latest_request
+        try:
+            completions = self._completions(document, smart_completion)
+        except CompletionCancelled:
+            _logger.debug("Completion cancelled: %r", document.text_before_cursor)
+            return
+        finally:
+            self._local.request = None
+        yield from completions
+
+    def _completions(self, document, smart_completion):
+        word_before_cursor = document.get_word_before_cursor(WORD=True)
+
         # If smart_completion is off then match any word that starts with
         # 'word_before_cursor'.
         if not smart_completion:
             matches = self.find_matches(word_before_cursor, self.all_completions, mode="strict")
-            completions = [m.completion for m in matches]
-            return sorted(completions, key=operator.attrgetter("text"))
+            completions = (m.completion for m in matches)
+            return self._top(completions, key=operator.attrgetter("text"), reverse=False)
 
+        key = self._session_key(document, word_before_cursor)
+        self._local.calls = calls = []
+        try:
+            matches = self._narrowed_matches(key, word_before_cursor)
+            narrowable = True
+            if matches is None:
+                matches = []
+                start = self.statement_index.statement_start(document.text, document.cursor_position)
+                suggestions = suggest_type(document.text[start:], document.text_before_cursor[start:])
+
+                for suggestion in suggestions:
+                    suggestion_type = type(suggestion)
+                    _logger.debug("Suggestion type: %r", suggestion_type)
+
+                    # Map suggestion type to method
+                    # e.g. 'table' -> self.get_table_matches
+                    matcher = self.suggestion_matchers[suggestion_type]
+                    recorded = len(calls)
+                    suggestion_matches = list(matcher(self, suggestion, word_before_cursor))
+                    # Matches that don't come straight from find_matches can't
+                    # be narrowed down.
+                    narrowable = (
+                        narrowable
+                        and suggestion_type is not Path
+                        and len(suggestion_matches) == sum(len(candidates) for _, _, candidates in calls[recorded:])
+                    )
+                    matches.extend(suggestion_matches)
+        finally:
+            self._local.calls = None
+        self._session = _CompletionSession(key, word_before_cursor, calls) if narrowable else None
+
+        # Highest priorities first
+        return [m.completion for m in self._top(matches, key=operator.attrgetter("priority"))]
+
+    def _top(self, items, key, reverse=True):
+        """Returns the first max_completions `items` sorted by `key`, without
+        sorting all of them."""
+        if not self.max_completions:
+            return sorted(items, key=key, reverse=reverse)
+        # Same order as sorted(), including for ties.
+        select = heapq.nlargest if reverse else heapq.nsmallest
+        return select(self.max_completions, items, key=key)
+
+    def _session_key(self, document, word_before_cursor):
+        """Returns what, besides the word before the cursor, the completions
+        depend on."""
+        text_before_word = document.text_before_cursor[: len(document.text_before_cursor) - len(word_before_cursor)]
+        # The word before the cursor also decides whether pg_ objects are
+        # suggested, and the casing of keywords.
+        keyword_casing = word_before_cursor[-1:].islower() if self.keyword_casing == "auto" else None
+        return text_before_word, document.text_after_cursor, word_before_cursor.startswith("pg_"), keyword_casing
+
+    def _narrowed_matches(self, key, word_before_cursor):
+        """Returns the matches for `word_before_cursor` if the last session
+        was in the same context and the word was only extended, or None.
+
+        Anything matching the extended word matched the shorter one, so only
+        the candidates that matched last time need to be tried again.
+        """
+        session = self._session
+        if (
+            session is None
+            or session.key != key
+            or not session.word
+            or not word_before_cursor.startswith(session.word)
+            or not narrowing_suffix_regex.match(word_before_cursor[len(session.word) :])
+        ):
+            return None
         matches = []
-        suggestions = suggest_type(document.text, document.text_before_cursor)
-
-        for suggestion in suggestions:
-            suggestion_type = type(suggestion)
-            _logger.debug("Suggestion type: %r", suggestion_type)
-
-            # Map suggestion type to method
-            # e.g. 'table' -> self.get_table_matches
-            matcher = self.suggestion_matchers[suggestion_type]
-            matches.extend(matcher(self, suggestion, word_before_cursor))
-
-        # Sort matches so highest priorities are first
-        matches = sorted(matches, key=operator.attrgetter("priority"), reverse=True)
-
-        return [m.completion for m in matches]
+        for mode, meta, candidates in session.calls:
+            matches.extend(self.find_matches(word_before_cursor, candidates, mode, meta))
+        return matches
 
     def get_column_matches(self, suggestion, word_before_cursor):
         tables = suggestion.table_refs
@@ -674,7 +886,7 @@ class PGCompleter(Completer):
 
         # Function overloading means we way have multiple functions of the same
         # name at this point, so keep unique names only
-        all_functions = self.populate_functions(suggestion.schema, filt)
+        all_functions = self.populate_functions(suggestion.schema, filt, word_before_cursor)
         funcs = {self._make_cand(f, alias, suggestion, arg_mode) for f in all_functions}
 
         matches = self.find_matches(word_before_cursor, funcs, meta="function")
@@ -782,7 +994,7 @@ class PGCompleter(Completer):
         return Candidate(item, synonyms=synonyms, prio2=prio2, display=display)
 
     def get_table_matches(self, suggestion, word_before_cursor, alias=False):
-        tables = self.populate_schema_objects(suggestion.schema, "tables")
+        tables = self.populate_schema_objects(suggestion.schema, "tables", word_before_cursor)
         tables.extend(SchemaObject(tbl.name) for tbl in suggestion.local_tables)
 
         # Unless we're sure the user really wants them, don't suggest the
@@ -797,7 +1009,7 @@ class PGCompleter(Completer):
         return self.find_matches(word_before_cursor, formats, meta="table format")
 
     def get_view_matches(self, suggestion, word_before_cursor, alias=False):
-        views = self.populate_schema_objects(suggestion.schema, "views")
+        views = self.populate_schema_objects(suggestion.schema, "views", word_before_cursor)
 
         if not suggestion.schema and (not word_before_cursor.startswith("pg_")):
             views = [v for v in views if not v.name.startswith("pg_")]
@@ -850,7 +1062,7 @@ class PGCompleter(Completer):
 
     def get_datatype_matches(self, suggestion, word_before_cursor):
         # suggest custom datatypes
-        types = self.populate_schema_objects(suggestion.schema, "datatypes")
+        types = self.populate_schema_objects(suggestion.schema, "datatypes", word_before_cursor)
         types = [self._make_cand(t, False, suggestion) for t in types]
         matches = self.find_matches(word_before_cursor, types, meta="datatype")
 
@@ -920,6 +1132,8 @@ class PGCompleter(Completer):
                         addcols(schema, relname, tbl.alias, "functions", cols)
                 else:
                     for reltype in ("tables", "views"):
+                        if self.lazy_columns:
+                            self._load_columns(reltype, schema, relname)
                         cols = meta[reltype].get(schema, {}).get(relname)
                         if cols:
                             cols = cols.values()
@@ -928,6 +1142,54 @@ class PGCompleter(Completer):
 
         return columns
 
+    def _load_columns(self, kind, schema, relname):
+        """Loads the columns of a relation if they aren't loaded yet, and
+        unloads the least recently used relations past the cache size.
+
+        :param kind: either 'tables' or 'views'
+        """
+        relations = self.dbmetadata[kind].get(schema, {})
+        if relname not in relations or self.column_loader is None:
+            return
+        key = (kind, schema, relname)
+        with self._columns_lock:
+            if key in self._loaded_relations:
+                self._loaded_relations.move_to_end(key)
+                return
+
+        # Query outside the lock, the loader skips loads while one is running.
+        column_data = self.column_loader(self.unescape_name(schema), self.unescape_name(relname))
+        if column_data is None:
+            # Couldn't be loaded, try again next time.
+            return
+        columns = ColumnTable()
+        for _, _, colname, datatype, has_default, default in column_data:
+            columns.add_column(self.escape_name(colname), datatype, has_default, default)
+        for fk in self._relation_foreignkeys.get((schema, relname), ()):
+            if (fk.childschema, fk.childtable) == (schema, relname) and fk.childcolumn in columns:
+                columns.add_foreignkey(fk.childcolumn, fk)
+            if (fk.parentschema, fk.parenttable) == (schema, relname) and fk.parentcolumn in columns:
+                columns.add_foreignkey(fk.parentcolumn, fk)
+
+        with self._columns_lock:
+            if key in self._loaded_relations:
+                return
+            # Completions iterate all_completions without the lock, so swap in
+            # a new set rather than adding to it.
+            new_names = columns.keys() - self.all_completions
+            if new_names:
+                self.all_completions = self.all_completions | new_names
+            # Replace rather than fill the relation's dict, it may be shared
+            # with another completer (see copy_metadata).
+            relations[relname] = columns
+            self._loaded_relations[key] = True
+
+            while len(self._loaded_relations) > max(self.lazy_column_cache_size, 1):
+                (kind, schema, relname), _ = self._loaded_relations.popitem(last=False)
+                relations = self.dbmetadata[kind].get(schema, {})
+                if relname in relations:
+                    relations[relname] = ColumnTable()
+
     def _get_schemas(self, obj_typ, schema):
         """Returns a list of schemas from which to suggest objects.
 
@@ -943,27 +1205,56 @@ class PGCompleter(Completer):
     def _maybe_schema(self, schema, parent):
         return None if parent or schema in self.search_path else schema
 
-    def populate_schema_objects(self, schema, obj_type):
+    def _candidate_names(self, word_before_cursor):
+        """Returns the set of names that may fuzzy match `word_before_cursor`
+        (see find_matches), or None if any name may match.
+        """
+        text = last_word(word_before_cursor or "", include="most_punctuations")
+        if text.startswith('"'):
+            text = text[1:]
+        # Predefined aliases don't have to share any character with the name
+        # they stand for.
+        if not text or self.alias_map:
+            return None
+        return self.name_index.candidates(text)
+
+    def _schema_names(self, objects, names):
+        """Returns the keys of `objects` that are in `names`, iterating over
+        the smaller of the two. They're sorted, so that their order doesn't
+        depend on the iteration order of the `names` set, which changes with
+        string hashing."""
+        if names is None:
+            return objects.keys()
+        if len(names) < len(objects):
+            return sorted(name for name in names if name in objects)
+        return sorted(name for name in objects if name in names)
+
+    def populate_schema_objects(self, schema, obj_type, word_before_cursor=None):
         """Returns a list of SchemaObjects representing tables or views.
 
         :param schema is the schema qualification input by the user (if any)
+        :param word_before_cursor, if given, leaves out the objects that can't
+        match it
 
         """
-
+        names = self._candidate_names(word_before_cursor)
         return [
             SchemaObject(name=obj, schema=(self._maybe_schema(schema=sch, parent=schema)))
             for sch in self._get_schemas(obj_type, schema)
-            for obj in self.dbmetadata[obj_type][sch].keys()
+            for obj in self._schema_names(self.dbmetadata[obj_type][sch], names)
         ]
 
-    def populate_functions(self, schema, filter_func):
+    def populate_functions(self, schema, filter_func, word_before_cursor=None):
         """Returns a list of function SchemaObjects.
 
         :param filter_func is a function that accepts a FunctionMetadata
         namedtuple and returns a boolean indicating whether that
         function should be kept or discarded
+        :param word_before_cursor, if given, leaves out the functions that
+        can't match it
 
         """
+        names = self._candidate_names(word_before_cursor)
 
         # Because of multiple dispatch, we can have multiple functions
         # with the same name, which is why `for meta in metas` is necessary
@@ -975,7 +1266,7 @@ class PGCompleter(Completer):
                 meta=meta,
             )
             for sch in self._get_schemas("functions", schema)
-            for (func, metas) in self.dbmetadata["functions"][sch].items()
-            for meta in metas
+            for func in self._schema_names(self.dbmetadata["functions"][sch], names)
+            for meta in self.dbmetadata["functions"][sch][func]
             if filter_func(meta)
         ]
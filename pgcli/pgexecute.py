@@ -1,7 +1,14 @@
 import ipaddress
 import logging
+import signal
+import threading
+import time
 import traceback
+import unicodedata
 from collections import namedtuple
+from itertools import accumulate
+from contextlib import contextmanager
+from operator import itemgetter
 import re
 import pgspecial as special
 import psycopg
@@ -13,11 +20,79 @@ sqlparse.engine.grouping.MAX_GROUPING_DEPTH = None
 sqlparse.engine.grouping.MAX_GROUPING_TOKENS = None
 
 from .packages.parseutils.meta import FunctionMetadata, ForeignKey
+from .packages.parseutils.splitter import split_script
 
 _logger = logging.getLogger(__name__)
 
 ViewDef = namedtuple("ViewDef", "nspname relname relkind viewdef reloptions checkoption")
 
+# The versions of the catalog objects used for completions, see
+# PGExecute.catalog_snapshot.
+CatalogSnapshot = namedtuple("CatalogSnapshot", "namespaces datatypes xmin relations functions foreignkeys")
+
+# A catalog query used for completions: the SQL and parameters to run, and an
+# optional function turning each row into the item the PGExecute method returns.
+CatalogQuery = namedtuple("CatalogQuery", "title sql params transform")
+
+# The queries streamed through a server-side cursor, as psql does with
+# FETCH_COUNT: those starting with SELECT or VALUES, after comments and
+# parentheses. SELECT INTO can't be declared as a cursor, so queries with INTO
+# anywhere aren't.
+_STREAMED_QUERY_REGEX = re.compile(r"(?:\s+|--[^\n]*|/\*.*?\*/)*[(\s]*(?:select|values)\b", re.IGNORECASE | re.DOTALL)
+# SELECT ... INTO creates a table rather than returning rows. Strings,
+# quoted identifiers and comments are matched to skip the words in them.
+_INTO_REGEX = re.compile(
+    r"'[^']*'|\"[^\"]*\"|(?<![\w$])(\$(?:[^\W\d]\w*)?\$).*?\1|--[^\n]*|/\*.*?\*/|\b(into)\b",
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+def _has_into(sql):
+    return any(m.group(2) for m in _INTO_REGEX.finditer(sql))
+
+
+# The width of the query line libpq shows in error messages, and how far from
+# its end the error position is kept when it's cut.
+_ERROR_LINE_WIDTH = 60
+_ERROR_LINE_RIGHT_CUT = 10
+
+
+def _error_position(query, position):
+    """Returns the "LINE n: ..." line and the caret under the character at
+    `position` (1-based) of `query`, the way libpq adds them to error
+    messages, or None if `position` is out of `query`."""
+    loc = position - 1
+    if not 0 <= loc <= len(query):
+        return None
+    # The screen column each character starts at, and the end of the last one
+    columns = list(accumulate((2 if unicodedata.east_asian_width(c) in ("W", "F") else 1 for c in query), initial=0))
+    line, begin, end = 1, 0, len(query)
+    for i, c in enumerate(query):
+        if c in "\r\n":
+            if i >= loc:
+                end = i
+                break
+            # \r\n ends a single line
+            if c == "\r" or i == 0 or query[i - 1] != "\r":
+                line += 1
+            begin = i + 1
+    begin_cut = end_cut = False
+    if columns[end] - columns[begin] > _ERROR_LINE_WIDTH:
+        if columns[begin] + _ERROR_LINE_WIDTH >= columns[loc] + _ERROR_LINE_RIGHT_CUT:
+            while columns[end] - columns[begin] > _ERROR_LINE_WIDTH:
+                end -= 1
+            end_cut = True
+        else:
+            while columns[loc] + _ERROR_LINE_RIGHT_CUT < columns[end]:
+                end -= 1
+                end_cut = True
+            while columns[end] - columns[begin] > _ERROR_LINE_WIDTH:
+                begin += 1
+                begin_cut = True
+    prefix = "LINE %d: %s" % (line, "..." if begin_cut else "")
+    text = query[begin:end].replace("\t", " ") + ("..." if end_cut else "")
+    return prefix + text + "\n" + " " * (len(prefix) + columns[loc] - columns[begin]) + "^"
+
 
 # we added this funcion to strip beginning comments
 # because sqlparse didn't handle tem well.  It won't be needed if sqlparse
@@ -96,7 +171,99 @@ class ProtocolSafeCursor(psycopg.Cursor):
             _logger.debug("%s: %s" % (ex.__class__.__name__, ex))
 
 
+class StreamedRows:
+    """The rows of a query run through a server-side cursor, fetched
+    `batch_size` rows at a time as they are iterated over, so that they don't
+    all need to fit in memory.
+
+    If `max_rows` is not 0, only that many rows are read, and more_rows tells
+    if the query has more, found by fetching one more row than that.
+
+    Like a cursor, has the description and adapters of the result, and a
+    rowcount: the number of rows read so far. received is the number of rows
+    fetched from the server, counted as they come. The cursor is closed when
+    all the rows are fetched or close() is called, and the transaction opened
+    for it, if any, ends then."""
+
+    # The first rows are fetched this many at a time, then twice as many each
+    # time up to batch_size, so that they are counted as they come
+    first_fetch_size = 100
+
+    def __init__(self, cursor, batch_size, own_transaction, max_rows=0):
+        self.cursor = cursor
+        self.batch_size = batch_size
+        self.own_transaction = own_transaction
+        self.max_rows = max_rows
+        self.description = cursor.description
+        self.adapters = cursor.adapters
+        self.rowcount = 0
+        self.received = 0
+        self.fetch_size = min(self.first_fetch_size, batch_size)
+        self.more_rows = False
+        self.closed = False
+
+    @property
+    def is_batched(self):
+        """True if the rows may be fetched in more than one batch."""
+        return not self.max_rows or self.batch_size <= self.max_rows
+
+    def batches(self):
+        """Yields the rows in lists of up to batch_size rows."""
+        try:
+            while not self.closed:
+                size = self.batch_size
+                if self.max_rows:
+                    size = min(size, self.max_rows + 1 - self.rowcount)
+                rows = self._fetch(size)
+                if self.max_rows and self.rowcount + len(rows) > self.max_rows:
+                    rows = rows[: self.max_rows - self.rowcount]
+                    self.more_rows = True
+                if rows:
+                    self.rowcount += len(rows)
+                    yield rows
+                if self.more_rows or len(rows) < size:
+                    break
+        finally:
+            self.close()
+
+    def _fetch(self, size):
+        """Fetches up to `size` rows."""
+        rows = []
+        while len(rows) < size:
+            count = min(self.fetch_size, size - len(rows))
+            fetched = self.cursor.fetchmany(count)
+            rows += fetched
+            self.received += len(fetched)
+            if len(fetched) < count:
+                break
+            self.fetch_size = min(self.fetch_size * 2, self.batch_size)
+        return rows
+
+    def __iter__(self):
+        for rows in self.batches():
+            yield from rows
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        conn = self.cursor.connection
+        try:
+            if self.own_transaction:
+                # Ending the transaction closes the cursor too, without a
+                # CLOSE statement.
+                if conn.info.transaction_status == psycopg.pq.TransactionStatus.INERROR:
+                    conn.rollback()
+                else:
+                    conn.commit()
+        finally:
+            self.cursor.close()
+
+
 class PGExecute:
+    # The server-side cursor of streamed queries, see execute_streamed
+    streamed_cursor_name = "pgcli_streamed_rows"
+
     # The boolean argument to the current_schemas function indicates whether
     # implicit schemas, e.g. pg_catalog
     search_path_query = """
@@ -113,7 +280,8 @@ class PGExecute:
         FROM    pg_catalog.pg_class c
                 LEFT JOIN pg_catalog.pg_namespace n
                     ON n.oid = c.relnamespace
-        WHERE   c.relkind = ANY(%s)
+        WHERE   c.relkind = ANY(%(kinds)s)
+                AND (%(oids)s::oid[] IS NULL OR c.oid = ANY(%(oids)s::oid[]))
         ORDER BY 1,2;"""
 
     databases_query = """
@@ -137,6 +305,124 @@ class PGExecute:
         WHERE name = 'unix_socket_directories'
     """
 
+    # The statistics counters of the rows inserted, updated and deleted in the
+    # catalog tables change with the catalog, and don't need scanning them.
+    # NULL if they aren't collected.
+    catalog_stats_fingerprint_query = """
+        SELECT  COALESCE((SELECT stats_reset::text
+                          FROM   pg_catalog.pg_stat_database
+                          WHERE  datname = pg_catalog.current_database()), '')
+                || ';' || string_agg(relname || ':' || n_tup_ins || '/' || n_tup_upd || '/' || n_tup_del, ',' ORDER BY relname)
+        FROM    pg_catalog.pg_stat_sys_tables
+        WHERE   pg_catalog.current_setting('track_counts')::bool
+                AND schemaname = 'pg_catalog'
+                AND relname = ANY('{pg_namespace,pg_class,pg_attribute,pg_attrdef,pg_constraint,pg_proc,pg_type,pg_database}')
+        HAVING  count(*) > 0"""
+
+    # Every catalog change touches the row count or the highest xmin of at
+    # least one of these tables.
+    catalog_fingerprint_query = """
+        SELECT  string_agg(c.relname || ':' || c.fingerprint, ',' ORDER BY c.relname)
+        FROM    (
+                    SELECT 'pg_namespace' relname, count(*) || '/' || max(xmin::text::bigint) fingerprint FROM pg_catalog.pg_namespace
+                    UNION ALL
+                    SELECT 'pg_class', count(*) || '/' || max(xmin::text::bigint) FROM pg_catalog.pg_class
+                    UNION ALL
+                    SELECT 'pg_attribute', count(*) || '/' || max(xmin::text::bigint) FROM pg_catalog.pg_attribute
+                    UNION ALL
+                    SELECT 'pg_attrdef', count(*) || '/' || max(xmin::text::bigint) FROM pg_catalog.pg_attrdef
+                    UNION ALL
+                    SELECT 'pg_constraint', count(*) || '/' || max(xmin::text::bigint) FROM pg_catalog.pg_constraint
+                    UNION ALL
+                    SELECT 'pg_proc', count(*) || '/' || max(xmin::text::bigint) FROM pg_catalog.pg_proc
+                    UNION ALL
+                    SELECT 'pg_type', count(*) || '/' || max(xmin::text::bigint) FROM pg_catalog.pg_type
+                    UNION ALL
+                    SELECT 'pg_database', count(*) || '/' || max(xmin::text::bigint) FROM pg_catalog.pg_database
+                ) c"""
+
+    snapshot_fingerprints_query = """
+        SELECT  (SELECT count(*) || '/' || max(xmin::text::bigint)
+                 FROM   pg_catalog.pg_namespace),
+                (SELECT count(*) || '/' || max(t.xmin::text::bigint)
+                 FROM   pg_catalog.pg_type t
+                        LEFT JOIN pg_catalog.pg_class c
+                            ON c.oid = t.typrelid
+                 WHERE  t.typrelid = 0 OR c.relkind = 'c'),
+                txid_snapshot_xmin(txid_current_snapshot())"""
+
+    # The queries below only return the objects changed by the transactions
+    # from %(since)s on, or all of them if it's NULL.
+
+    snapshot_relations_query = """
+        SELECT  c.oid,
+                c.xmin::text
+                    || '/' || COALESCE((SELECT max(a.xmin::text::bigint)
+                                        FROM   pg_catalog.pg_attribute a
+                                        WHERE  a.attrelid = c.oid AND a.attnum > 0), 0)
+                    || '/' || COALESCE((SELECT max(d.xmin::text::bigint)
+                                        FROM   pg_catalog.pg_attrdef d
+                                        WHERE  d.adrelid = c.oid), 0),
+                c.relkind,
+                n.nspname,
+                c.relname
+        FROM    pg_catalog.pg_class c
+                INNER JOIN pg_catalog.pg_namespace n
+                    ON n.oid = c.relnamespace
+        WHERE   c.relkind = ANY('{r,p,f,v,m}')
+                AND (%(since)s::bigint IS NULL
+                     OR c.xmin::text::bigint >= %(since)s::bigint
+                     OR c.oid IN (SELECT a.attrelid
+                                  FROM   pg_catalog.pg_attribute a
+                                  WHERE  a.xmin::text::bigint >= %(since)s::bigint)
+                     OR c.oid IN (SELECT d.adrelid
+                                  FROM   pg_catalog.pg_attrdef d
+                                  WHERE  d.xmin::text::bigint >= %(since)s::bigint))"""
+
+    snapshot_functions_query = """
+        SELECT  p.oid,
+                p.xmin::text,
+                n.nspname,
+                p.proname
+        FROM    pg_catalog.pg_proc p
+                INNER JOIN pg_catalog.pg_namespace n
+                    ON n.oid = p.pronamespace
+        WHERE   p.prorettype::regtype != 'trigger'::regtype
+                AND (%(since)s::bigint IS NULL OR p.xmin::text::bigint >= %(since)s::bigint)"""
+
+    snapshot_foreignkeys_query = """
+        SELECT  oid,
+                xmin::text,
+                conrelid,
+                confrelid
+        FROM    pg_catalog.pg_constraint
+        WHERE   contype = 'f'
+                AND (%(since)s::bigint IS NULL OR xmin::text::bigint >= %(since)s::bigint)"""
+
+    snapshot_counts_query = """
+        SELECT  (SELECT count(*)
+                 FROM   pg_catalog.pg_class
+                 WHERE  relkind = ANY('{r,p,f,v,m}')),
+                (SELECT count(*)
+                 FROM   pg_catalog.pg_proc
+                 WHERE  prorettype::regtype != 'trigger'::regtype),
+                (SELECT count(*)
+                 FROM   pg_catalog.pg_constraint
+                 WHERE  contype = 'f')"""
+
+    snapshot_oids_query = """
+        SELECT  0, oid
+        FROM    pg_catalog.pg_class
+        WHERE   %(relations)s AND relkind = ANY('{r,p,f,v,m}')
+        UNION ALL
+        SELECT  1, oid
+        FROM    pg_catalog.pg_proc
+        WHERE   %(functions)s AND prorettype::regtype != 'trigger'::regtype
+        UNION ALL
+        SELECT  2, oid
+        FROM    pg_catalog.pg_constraint
+        WHERE   %(foreignkeys)s AND contype = 'f'"""
+
     view_definition_query = """
         WITH v AS (SELECT %s::pg_catalog.regclass::pg_catalog.oid AS v_oid)
         SELECT nspname, relname, relkind,
@@ -180,6 +466,10 @@ class PGExecute:
         self.server_version = None
         self.extra_args = None
         self.notify_callback = notify_callback
+        self.streamed_rows = None
+        # The rows or cursor of the running statement, for rows_received()
+        self.statement_rows = None
+        self.cancelled_at = None
         self.connect(database, user, password, host, port, dsn, **kwargs)
         self.reset_expanded = None
 
@@ -234,6 +524,8 @@ class PGExecute:
         if self.conn:
             self.conn.close()
         self.conn = conn
+        self.streamed_rows = None
+        self.statement_rows = None
         self.conn.autocommit = True
 
         if self.notify_callback is not None:
@@ -294,6 +586,50 @@ class PGExecute:
         cur.execute(sql)
         return cur.fetchone()
 
+    @contextmanager
+    def cancel_on_interrupt(self):
+        """Makes Ctrl-C cancel the query running on the connection, rather
+        than interrupt the program, within the context.
+
+        The server is sent a cancel request, and acknowledges it before the
+        query is waited for again. The query then fails with QueryCanceled
+        like any failed query, and the connection and the session, with its
+        temporary tables and prepared statements, are kept. The time of the
+        cancel is kept in cancelled_at. When no query is running, Ctrl-C
+        raises KeyboardInterrupt as usual."""
+        self.cancelled_at = None
+        if threading.current_thread() is not threading.main_thread():
+            # Signal handlers can only be set in the main thread
+            yield
+            return
+
+        def cancel(signum, frame):
+            if not self.cancel():
+                # psycopg also cancels a running query on the interrupt
+                signal.default_int_handler(signum, frame)
+
+        previous = signal.signal(signal.SIGINT, cancel)
+        try:
+            yield
+        finally:
+            signal.signal(signal.SIGINT, previous)
+
+    def cancel(self):
+        """Cancels the query running on the connection, as Ctrl-C does within
+        cancel_on_interrupt(). Can be called from another thread than the
+        one running the query. Returns False if no query was cancelled."""
+        if self.conn.info.transaction_status != psycopg.pq.TransactionStatus.ACTIVE:
+            return False
+        _logger.debug("Cancelling query on Ctrl-C.")
+        self.cancelled_at = time.time()
+        try:
+            self.conn.cancel_safe(timeout=5.0)
+        except psycopg.Error as e:
+            _logger.error("Cancel request failed: %r", e)
+            self.cancelled_at = None
+            return False
+        return True
+
     def failed_transaction(self):
         return self.conn.info.transaction_status == psycopg.pq.TransactionStatus.INERROR
 
@@ -321,6 +657,8 @@ class PGExecute:
         exception_formatter=None,
         on_error_resume=False,
         explain_mode=False,
+        fetch_count=0,
+        row_limit=None,
     ):
         """Execute the sql in the database and return the results.
 
@@ -333,6 +671,11 @@ class PGExecute:
         :param on_error_resume: Bool. If true, queries following an exception
                (assuming exception_formatter has been supplied) continue to
                execute.
+        :param fetch_count: Int. If not 0, the rows of SELECT queries are
+               fetched this many at a time, see execute_normal_sql().
+        :param row_limit: A callable that accepts the sql of a query and
+               returns how many of its rows to fetch at most, or 0 to fetch
+               all of them. If it is not supplied, all the rows are fetched.
 
         :return: Generator yielding tuples containing
                  (title, rows, headers, status, query, success, is_special)
@@ -361,13 +704,54 @@ class PGExecute:
         if len(removed_comments) > 0:
             sqlarr = removed_comments + sqlarr
 
-        # run each sql query
-        for sql in sqlarr:
-            # Remove spaces, eol and semi-colons.
-            sql = sql.rstrip(";")
-            sql = sqlparse.format(sql, strip_comments=False).strip()
+        # Remove spaces, eol and semi-colons.
+        statements = ((sqlparse.format(sql.rstrip(";"), strip_comments=False).strip(), None) for sql in sqlarr)
+        yield from self._run_statements(
+            statements, statement, pgspecial, exception_formatter, on_error_resume, explain_mode, fetch_count, row_limit
+        )
+
+    def run_file(
+        self,
+        f,
+        pgspecial=None,
+        exception_formatter=None,
+        on_error_resume=False,
+        explain_mode=False,
+        fetch_count=0,
+        row_limit=None,
+    ):
+        """Execute the sql script read from the file object `f`, like run().
+
+        The statements are run as they are read, so a large script doesn't
+        need to fit in memory. COPY ... FROM STDIN statements get their data
+        from the script, up to a line containing only \\.
+        """
+        return self.run_script(split_script(f), pgspecial, exception_formatter, on_error_resume, explain_mode, fetch_count, row_limit)
+
+    def run_script(
+        self,
+        statements,
+        pgspecial=None,
+        exception_formatter=None,
+        on_error_resume=False,
+        explain_mode=False,
+        fetch_count=0,
+        row_limit=None,
+    ):
+        """Execute the ScriptStatements of `statements`, as split_script()
+        yields them, like run_file()."""
+        statements = ((statement.sql.rstrip(";").strip(), statement.copy_data) for statement in statements)
+        return self._run_statements(statements, None, pgspecial, exception_formatter, on_error_resume, explain_mode, fetch_count, row_limit)
+
+    def _run_statements(self, statements, statement, pgspecial, exception_formatter, on_error_resume, explain_mode, fetch_count, row_limit):
+        """Runs the (sql, copy_data) tuples of `statements`, see run().
+
+        `statement` is the text all of them come from, if any."""
+        for sql, copy_data in statements:
             if not sql:
                 continue
+            self.close_streamed_rows()
+            self.statement_rows = None
             try:
                 if explain_mode:
                     sql = self.explain_prefix() + sql
@@ -391,7 +775,7 @@ class PGExecute:
                     try:
                         response = pgspecial.execute(cur, sql)
                         if cur and cur.protocol_error:
-                            yield None, None, None, cur.protocol_message, statement, False, False
+                            yield None, None, None, cur.protocol_message, statement or sql, False, False
                             # this would close connection. We should reconnect.
                             self.connect()
                             continue
@@ -406,7 +790,11 @@ class PGExecute:
                         pass
 
                 # Not a special command, so execute as normal sql
-                yield self.execute_normal_sql(sql) + (sql, True, False)
+                if copy_data is not None and not explain_mode:
+                    yield self.execute_copy(sql, copy_data) + (sql, True, False)
+                else:
+                    max_rows = row_limit(sql) if row_limit else 0
+                    yield self.execute_normal_sql(sql, fetch_count, max_rows) + (sql, True, False)
             except psycopg.DatabaseError as e:
                 _logger.error("sql: %r, error: %r", sql, e)
                 _logger.error("traceback: %r", traceback.format_exc())
@@ -437,8 +825,15 @@ class PGExecute:
         """
         return self.conn.closed != 0
 
-    def execute_normal_sql(self, split_sql):
-        """Returns tuple (title, rows, headers, status)"""
+    def execute_normal_sql(self, split_sql, fetch_count=0, max_rows=0):
+        """Returns tuple (title, rows, headers, status)
+
+        If `fetch_count` is not 0, the rows of a SELECT query are StreamedRows,
+        fetched `fetch_count` at a time through a server-side cursor. So are
+        they if `max_rows` is not 0, to only fetch that many of them, and one
+        more to know if there are more. The query then stops there, so its
+        functions, e.g. nextval(), only run for the rows fetched. The rows of
+        other queries are all fetched, and limited to `max_rows` too."""
         _logger.debug("Regular sql statement. sql: %r", split_sql)
 
         title = ""
@@ -459,13 +854,23 @@ class PGExecute:
             res = self.conn.pgconn.exec_(split_sql.encode())
             return title, None, None, res.command_status.decode()
 
+        if (fetch_count or max_rows) and _STREAMED_QUERY_REGEX.match(split_sql) and not _has_into(split_sql):
+            rows = self.statement_rows = self.execute_streamed(split_sql, fetch_count or max_rows + 1, max_rows)
+            # The row count is added to the status once the rows are read
+            return title, rows, [x[0] for x in rows.description], "SELECT"
+
         cur = self.conn.cursor()
         cur.execute(split_sql)
 
         # cur.description will be None for operations that do not return
         # rows.
         if cur.description:
+            # All the rows are received with the result
+            self.statement_rows = cur
             headers = [x[0] for x in cur.description]
+            if max_rows:
+                # All the rows were received, but are limited the same way
+                return title, StreamedRows(cur, max_rows + 1, False, max_rows), headers, "SELECT"
             return title, cur, headers, cur.statusmessage
         elif cur.protocol_error:
             _logger.debug("Protocol error, unsupported command.")
@@ -474,6 +879,71 @@ class PGExecute:
             _logger.debug("No rows in result.")
             return title, None, None, cur.statusmessage
 
+    def execute_streamed(self, sql, batch_size, max_rows=0):
+        """Runs the query `sql` through a server-side cursor, and returns its
+        StreamedRows, fetched `batch_size` at a time, up to `max_rows` rows
+        if it is not 0.
+
+        The cursor only lives in a transaction: outside of one, a transaction
+        is started for it, and committed once the rows are read, like psql
+        does with FETCH_COUNT."""
+        _logger.debug("Streamed sql statement. sql: %r", sql)
+        own_transaction = self.conn.info.transaction_status == psycopg.pq.TransactionStatus.IDLE
+        if own_transaction:
+            self.conn.execute("BEGIN")
+        cur = self.conn.cursor(name=self.streamed_cursor_name)
+        try:
+            cur.execute(sql)
+        except BaseException as e:
+            if own_transaction and not self.conn.closed:
+                self.conn.rollback()
+            if isinstance(e, psycopg.DatabaseError):
+                prefix = psycopg.sql.SQL("DECLARE {} CURSOR FOR ").format(psycopg.sql.Identifier(self.streamed_cursor_name))
+                raise self._statement_error(e, sql, prefix.as_string(self.conn)) from None
+            raise
+        self.streamed_rows = StreamedRows(cur, batch_size, own_transaction, max_rows)
+        return self.streamed_rows
+
+    def _statement_error(self, error, sql, prefix):
+        """Returns `error`, raised by running `sql` with `prefix` added in
+        front of it, with its position and message pointing into `sql`."""
+        position = error.diag.statement_position
+        if error.pgresult is None or not position or int(position) <= len(prefix):
+            return error
+        position = int(position) - len(prefix)
+        message = str(error)
+        context = _error_position(prefix + sql, position + len(prefix))
+        if context in message:
+            message = message.replace(context, _error_position(sql, position), 1)
+        fields = {field: error.pgresult.error_field(field) for field in psycopg.pq.DiagnosticField}
+        fields[psycopg.pq.DiagnosticField.STATEMENT_POSITION] = str(position).encode()
+        return type(error)(message, info=fields, encoding=self.conn.info.encoding)
+
+    def rows_received(self):
+        """Returns how many rows the running statement has received so far,
+        or None if it doesn't return rows, or didn't start to."""
+        rows = self.statement_rows
+        if rows is None:
+            return None
+        return rows.received if isinstance(rows, StreamedRows) else rows.rowcount
+
+    def close_streamed_rows(self):
+        """Closes the cursor of the last streamed query, if its rows weren't
+        all read, ending the transaction started for it."""
+        if self.streamed_rows is not None:
+            rows, self.streamed_rows = self.streamed_rows, None
+            rows.close()
+
+    def execute_copy(self, sql, data):
+        """Runs a COPY ... FROM STDIN statement, sending it the lines of
+        `data`. Returns tuple (title, rows, headers, status)"""
+        _logger.debug("Copy from stdin. sql: %r", sql)
+        with self.conn.cursor() as cur:
+            with cur.copy(sql) as copy:
+                for line in data:
+                    copy.write(line)
+            return "", None, None, cur.statusmessage
+
     def search_path(self):
         """Returns the current search path as a list of schema names"""
 
@@ -530,15 +1000,28 @@ class PGExecute:
             except psycopg.ProgrammingError:
                 raise RuntimeError(f"Function {spec} does not exist.")
 
-    def schemata(self):
-        """Returns a list of schema names in the database"""
+    def _catalog_rows(self, query):
+        """Yields the items returned by a CatalogQuery"""
 
+        if query is None:
+            # Not supported by this server version.
+            return
         with self.conn.cursor() as cur:
-            _logger.debug("Schemata Query. sql: %r", self.schemata_query)
-            cur.execute(self.schemata_query)
-            return [x[0] for x in cur.fetchall()]
+            _logger.debug("%s Query. sql: %r", query.title, query.sql)
+            cur.execute(query.sql, query.params)
+            if query.transform:
+                yield from map(query.transform, cur)
+            else:
+                yield from cur
 
-    def _relations(self, kinds=("r", "p", "f", "v", "m")):
+    def _schemata_query(self):
+        return CatalogQuery("Schemata", self.schemata_query, None, itemgetter(0))
+
+    def schemata(self):
+        """Returns a list of schema names in the database"""
+        return list(self._catalog_rows(self._schemata_query()))
+
+    def _relations_query(self, kinds=("r", "p", "f", "v", "m"), oids=None):
         """Get table or view name metadata
 
         :param kinds: list of postgres relkind filters:
@@ -547,27 +1030,23 @@ class PGExecute:
                 'f' - foreign table
                 'v' - view
                 'm' - materialized view
-        :return: (schema_name, rel_name) tuples
+        :param oids: optional list of relation oids to restrict the results to
+        :return: CatalogQuery of (schema_name, rel_name) tuples
         """
+        return CatalogQuery("Relations", self.tables_query, {"kinds": list(kinds), "oids": oids}, None)
 
-        with self.conn.cursor() as cur:
-            # sql = cur.mogrify(self.tables_query, kinds)
-            # _logger.debug("Tables Query. sql: %r", sql)
-            cur.execute(self.tables_query, [kinds])
-            yield from cur
-
-    def tables(self):
+    def tables(self, oids=None):
         """Yields (schema_name, table_name) tuples"""
-        yield from self._relations(kinds=["r", "p", "f"])
+        yield from self._catalog_rows(self._relations_query(kinds=["r", "p", "f"], oids=oids))
 
-    def views(self):
+    def views(self, oids=None):
         """Yields (schema_name, view_name) tuples.
 
         Includes both views and and materialized views
         """
-        yield from self._relations(kinds=["v", "m"])
+        yield from self._catalog_rows(self._relations_query(kinds=["v", "m"], oids=oids))
 
-    def _columns(self, kinds=("r", "p", "f", "v", "m")):
+    def _columns_query(self, kinds=("r", "p", "f", "v", "m"), oids=None, relation=None):
         """Get column metadata for tables and views
 
         :param kinds: kinds: list of postgres relkind filters:
@@ -576,7 +1055,11 @@ class PGExecute:
                 'f' - foreign table
                 'v' - view
                 'm' - materialized view
-        :return: list of (schema_name, relation_name, column_name, column_type) tuples
+        :param oids: optional list of relation oids to restrict the results to
+        :param relation: optional (schema_name, rel_name) tuple to restrict
+                         the results to
+        :return: CatalogQuery of (schema_name, relation_name, column_name,
+                 column_type, has_default, default) tuples
         """
 
         if self.conn.info.server_version >= 80400:
@@ -595,7 +1078,9 @@ class PGExecute:
                         LEFT OUTER JOIN pg_attrdef def
                             ON def.adrelid = att.attrelid
                             AND def.adnum = att.attnum
-                WHERE   cls.relkind = ANY(%s)
+                WHERE   cls.relkind = ANY(%(kinds)s)
+                        AND (%(oids)s::oid[] IS NULL OR cls.oid = ANY(%(oids)s::oid[]))
+                        AND (%(schema)s::text IS NULL OR (nsp.nspname = %(schema)s AND cls.relname = %(relname)s))
                         AND NOT att.attisdropped
                         AND att.attnum  > 0
                 ORDER BY 1, 2, att.attnum"""
@@ -614,28 +1099,38 @@ class PGExecute:
                             ON cls.relnamespace = nsp.oid
                         INNER JOIN pg_catalog.pg_type typ
                             ON typ.oid = att.atttypid
-                WHERE   cls.relkind = ANY(%s)
+                WHERE   cls.relkind = ANY(%(kinds)s)
+                        AND (%(oids)s::oid[] IS NULL OR cls.oid = ANY(%(oids)s::oid[]))
+                        AND (%(schema)s::text IS NULL OR (nsp.nspname = %(schema)s AND cls.relname = %(relname)s))
                         AND NOT att.attisdropped
                         AND att.attnum  > 0
                 ORDER BY 1, 2, att.attnum"""
 
-        with self.conn.cursor() as cur:
-            # sql = cur.mogrify(columns_query, kinds)
-            # _logger.debug("Columns Query. sql: %r", sql)
-            cur.execute(columns_query, [kinds])
-            yield from cur
+        schema, relname = relation or (None, None)
+        params = {"kinds": list(kinds), "oids": oids, "schema": schema, "relname": relname}
+        return CatalogQuery("Columns", columns_query, params, None)
 
-    def table_columns(self):
-        yield from self._columns(kinds=["r", "p", "f"])
+    def table_columns(self, oids=None):
+        yield from self._catalog_rows(self._columns_query(kinds=["r", "p", "f"], oids=oids))
 
-    def view_columns(self):
-        yield from self._columns(kinds=["v", "m"])
+    def view_columns(self, oids=None):
+        yield from self._catalog_rows(self._columns_query(kinds=["v", "m"], oids=oids))
+
+    def relation_columns(self, schema, relname, timeout=None):
+        """Returns column metadata tuples for a single table or view. With a
+        timeout, in milliseconds, the query is cancelled if it runs longer."""
+        query = self._columns_query(relation=(schema, relname))
+        if not timeout:
+            return list(self._catalog_rows(query))
+        with self.conn.transaction():
+            self.conn.execute("SELECT pg_catalog.set_config('statement_timeout', %s, true)", (str(timeout),))
+            return list(self._catalog_rows(query))
+
+    def _databases_query(self):
+        return CatalogQuery("Databases", self.databases_query, None, itemgetter(0))
 
     def databases(self):
-        with self.conn.cursor() as cur:
-            _logger.debug("Databases Query. sql: %r", self.databases_query)
-            cur.execute(self.databases_query)
-            return [x[0] for x in cur.fetchall()]
+        return list(self._catalog_rows(self._databases_query()))
 
     def full_databases(self):
         with self.conn.cursor() as cur:
@@ -658,49 +1153,50 @@ class PGExecute:
             result = cur.fetchone()
             return result[0] if result else ""
 
-    def foreignkeys(self):
-        """Yields ForeignKey named tuples"""
-
+    def _foreignkeys_query(self, oids=None):
         if self.conn.info.server_version < 90000:
-            return
+            return None
+
+        query = """
+            SELECT s_p.nspname AS parentschema,
+                   t_p.relname AS parenttable,
+                   unnest((
+                    select
+                        array_agg(attname ORDER BY i)
+                    from
+                        (select unnest(confkey) as attnum, generate_subscripts(confkey, 1) as i) x
+                        JOIN pg_catalog.pg_attribute c USING(attnum)
+                        WHERE c.attrelid = fk.confrelid
+                    )) AS parentcolumn,
+                   s_c.nspname AS childschema,
+                   t_c.relname AS childtable,
+                   unnest((
+                    select
+                        array_agg(attname ORDER BY i)
+                    from
+                        (select unnest(conkey) as attnum, generate_subscripts(conkey, 1) as i) x
+                        JOIN pg_catalog.pg_attribute c USING(attnum)
+                        WHERE c.attrelid = fk.conrelid
+                    )) AS childcolumn
+            FROM pg_catalog.pg_constraint fk
+            JOIN pg_catalog.pg_class      t_p ON t_p.oid = fk.confrelid
+            JOIN pg_catalog.pg_namespace  s_p ON s_p.oid = t_p.relnamespace
+            JOIN pg_catalog.pg_class      t_c ON t_c.oid = fk.conrelid
+            JOIN pg_catalog.pg_namespace  s_c ON s_c.oid = t_c.relnamespace
+            WHERE fk.contype = 'f'
+                  AND (%(oids)s::oid[] IS NULL OR fk.conrelid = ANY(%(oids)s::oid[]) OR fk.confrelid = ANY(%(oids)s::oid[]));
+            """
+        return CatalogQuery("Foreign keys", query, {"oids": oids}, ForeignKey._make)
 
-        with self.conn.cursor() as cur:
-            query = """
-                SELECT s_p.nspname AS parentschema,
-                       t_p.relname AS parenttable,
-                       unnest((
-                        select
-                            array_agg(attname ORDER BY i)
-                        from
-                            (select unnest(confkey) as attnum, generate_subscripts(confkey, 1) as i) x
-                            JOIN pg_catalog.pg_attribute c USING(attnum)
-                            WHERE c.attrelid = fk.confrelid
-                        )) AS parentcolumn,
-                       s_c.nspname AS childschema,
-                       t_c.relname AS childtable,
-                       unnest((
-                        select
-                            array_agg(attname ORDER BY i)
-                        from
-                            (select unnest(conkey) as attnum, generate_subscripts(conkey, 1) as i) x
-                            JOIN pg_catalog.pg_attribute c USING(attnum)
-                            WHERE c.attrelid = fk.conrelid
-                        )) AS childcolumn
-                FROM pg_catalog.pg_constraint fk
-                JOIN pg_catalog.pg_class      t_p ON t_p.oid = fk.confrelid
-                JOIN pg_catalog.pg_namespace  s_p ON s_p.oid = t_p.relnamespace
-                JOIN pg_catalog.pg_class      t_c ON t_c.oid = fk.conrelid
-                JOIN pg_catalog.pg_namespace  s_c ON s_c.oid = t_c.relnamespace
-                WHERE fk.contype = 'f';
-                """
-            _logger.debug("Functions Query. sql: %r", query)
-            cur.execute(query)
-            for row in cur:
-                yield ForeignKey(*row)
+    def foreignkeys(self, oids=None):
+        """Yields ForeignKey named tuples
 
-    def functions(self):
-        """Yields FunctionMetadata named tuples"""
+        :param oids: optional list of relation oids; only foreign keys
+                     referencing or referenced by these relations are returned
+        """
+        yield from self._catalog_rows(self._foreignkeys_query(oids))
 
+    def _functions_query(self, oids=None):
         if self.conn.info.server_version >= 110000:
             query = """
                 SELECT n.nspname schema_name,
@@ -719,6 +1215,7 @@ class PGExecute:
                             ON n.oid = p.pronamespace
                 LEFT JOIN pg_depend d ON d.objid = p.oid and d.deptype = 'e'
                 WHERE p.prorettype::regtype != 'trigger'::regtype
+                      AND (%(oids)s::oid[] IS NULL OR p.oid = ANY(%(oids)s::oid[]))
                 ORDER BY 1, 2
                 """
         elif self.conn.info.server_version > 90000:
@@ -739,6 +1236,7 @@ class PGExecute:
                             ON n.oid = p.pronamespace
                 LEFT JOIN pg_depend d ON d.objid = p.oid and d.deptype = 'e'
                 WHERE p.prorettype::regtype != 'trigger'::regtype
+                      AND (%(oids)s::oid[] IS NULL OR p.oid = ANY(%(oids)s::oid[]))
                 ORDER BY 1, 2
                 """
         elif self.conn.info.server_version >= 80400:
@@ -759,6 +1257,7 @@ class PGExecute:
                             ON n.oid = p.pronamespace
                 LEFT JOIN pg_depend d ON d.objid = p.oid and d.deptype = 'e'
                 WHERE p.prorettype::regtype != 'trigger'::regtype
+                      AND (%(oids)s::oid[] IS NULL OR p.oid = ANY(%(oids)s::oid[]))
                 ORDER BY 1, 2
                 """
         else:
@@ -779,58 +1278,106 @@ class PGExecute:
                             ON n.oid = p.pronamespace
                 LEFT JOIN pg_depend d ON d.objid = p.oid and d.deptype = 'e'
                 WHERE p.prorettype::regtype != 'trigger'::regtype
+                      AND (%(oids)s::oid[] IS NULL OR p.oid = ANY(%(oids)s::oid[]))
                 ORDER BY 1, 2
                 """
+        return CatalogQuery("Functions", query, {"oids": oids}, lambda row: FunctionMetadata(*row))
 
-        with self.conn.cursor() as cur:
-            _logger.debug("Functions Query. sql: %r", query)
-            cur.execute(query)
-            for row in cur:
-                yield FunctionMetadata(*row)
+    def functions(self, oids=None):
+        """Yields FunctionMetadata named tuples
 
-    def datatypes(self):
-        """Yields tuples of (schema_name, type_name)"""
+        :param oids: optional list of function oids to restrict the results to
+        """
+        yield from self._catalog_rows(self._functions_query(oids))
 
-        with self.conn.cursor() as cur:
-            if self.conn.info.server_version > 90000:
-                query = """
-                    SELECT n.nspname schema_name,
-                           t.typname type_name
-                    FROM   pg_catalog.pg_type t
-                           INNER JOIN pg_catalog.pg_namespace n
-                              ON n.oid = t.typnamespace
-                    WHERE ( t.typrelid = 0  -- non-composite types
-                            OR (  -- composite type, but not a table
-                                  SELECT c.relkind = 'c'
-                                  FROM pg_catalog.pg_class c
-                                  WHERE c.oid = t.typrelid
-                                )
+    def _datatypes_query(self):
+        if self.conn.info.server_version > 90000:
+            query = """
+                SELECT n.nspname schema_name,
+                       t.typname type_name
+                FROM   pg_catalog.pg_type t
+                       INNER JOIN pg_catalog.pg_namespace n
+                          ON n.oid = t.typnamespace
+                WHERE ( t.typrelid = 0  -- non-composite types
+                        OR (  -- composite type, but not a table
+                              SELECT c.relkind = 'c'
+                              FROM pg_catalog.pg_class c
+                              WHERE c.oid = t.typrelid
+                            )
+                      )
+                      AND NOT EXISTS( -- ignore array types
+                            SELECT  1
+                            FROM    pg_catalog.pg_type el
+                            WHERE   el.oid = t.typelem AND el.typarray = t.oid
                           )
-                          AND NOT EXISTS( -- ignore array types
-                                SELECT  1
-                                FROM    pg_catalog.pg_type el
-                                WHERE   el.oid = t.typelem AND el.typarray = t.oid
-                              )
-                          AND n.nspname <> 'pg_catalog'
-                          AND n.nspname <> 'information_schema'
-                    ORDER BY 1, 2;
-                    """
-            else:
-                query = """
-                    SELECT n.nspname schema_name,
-                      pg_catalog.format_type(t.oid, NULL) type_name
-                    FROM pg_catalog.pg_type t
-                         LEFT JOIN pg_catalog.pg_namespace n ON n.oid = t.typnamespace
-                    WHERE (t.typrelid = 0 OR (SELECT c.relkind = 'c' FROM pg_catalog.pg_class c WHERE c.oid = t.typrelid))
-                      AND t.typname !~ '^_'
-                          AND n.nspname <> 'pg_catalog'
-                          AND n.nspname <> 'information_schema'
-                      AND pg_catalog.pg_type_is_visible(t.oid)
-                    ORDER BY 1, 2;
+                      AND n.nspname <> 'pg_catalog'
+                      AND n.nspname <> 'information_schema'
+                ORDER BY 1, 2;
                 """
-            _logger.debug("Datatypes Query. sql: %r", query)
-            cur.execute(query)
-            yield from cur
+        else:
+            query = """
+                SELECT n.nspname schema_name,
+                  pg_catalog.format_type(t.oid, NULL) type_name
+                FROM pg_catalog.pg_type t
+                     LEFT JOIN pg_catalog.pg_namespace n ON n.oid = t.typnamespace
+                WHERE (t.typrelid = 0 OR (SELECT c.relkind = 'c' FROM pg_catalog.pg_class c WHERE c.oid = t.typrelid))
+                  AND t.typname !~ '^_'
+                      AND n.nspname <> 'pg_catalog'
+                      AND n.nspname <> 'information_schema'
+                  AND pg_catalog.pg_type_is_visible(t.oid)
+                ORDER BY 1, 2;
+            """
+        return CatalogQuery("Datatypes", query, None, None)
+
+    def datatypes(self):
+        """Yields tuples of (schema_name, type_name)"""
+        yield from self._catalog_rows(self._datatypes_query())
+
+    def catalog_queries(self):
+        """Returns the CatalogQuery run by each catalog method, by method name"""
+        return {
+            "schemata": self._schemata_query(),
+            "tables": self._relations_query(kinds=["r", "p", "f"]),
+            "table_columns": self._columns_query(kinds=["r", "p", "f"]),
+            "foreignkeys": self._foreignkeys_query(),
+            "views": self._relations_query(kinds=["v", "m"]),
+            "view_columns": self._columns_query(kinds=["v", "m"]),
+            "datatypes": self._datatypes_query(),
+            "databases": self._databases_query(),
+            "functions": self._functions_query(),
+        }
+
+    def can_pipeline(self):
+        """Returns True if queries can be sent in pipeline mode"""
+        return psycopg.Pipeline.is_supported() and not self.is_virtual_database()
+
+    def pipeline_catalog(self, names):
+        """Runs the queries of the catalog methods in `names` in a single
+        pipeline, so they take one network round trip.
+
+        Yields (name, results) tuples in the order of `names`, each as soon as
+        its results have arrived. The results are lists of the items the
+        catalog method would return.
+        """
+        queries = self.catalog_queries()
+        with self.conn.pipeline():
+            cursors = []
+            for name in names:
+                query = queries[name]
+                cur = None
+                if query is not None:
+                    _logger.debug("%s Query (pipelined). sql: %r", query.title, query.sql)
+                    cur = self.conn.cursor()
+                    cur.execute(query.sql, query.params)
+                cursors.append((name, query, cur))
+
+            for name, query, cur in cursors:
+                if cur is None:
+                    yield name, []
+                    continue
+                with cur:
+                    rows = cur.fetchall()
+                yield name, list(map(query.transform, rows)) if query.transform else rows
 
     def casing(self):
         """Yields the most common casing for names used in db functions"""
@@ -881,6 +1428,87 @@ class PGExecute:
             for row in cur:
                 yield row[0]
 
+    def catalog_fingerprint(self):
+        """Returns a string that changes whenever the catalog metadata used
+        for completions changes, or None if it can't be determined.
+
+        It's taken from the statistics counters of the catalog tables, which
+        may lag behind the changes of the last second or so. The catalog
+        tables are only scanned if the counters aren't collected.
+        """
+        if self.is_virtual_database():
+            return None
+        try:
+            with self.conn.cursor() as cur:
+                for query in (self.catalog_stats_fingerprint_query, self.catalog_fingerprint_query):
+                    _logger.debug("Catalog fingerprint query. sql: %r", query)
+                    cur.execute(query)
+                    row = cur.fetchone()
+                    if row and row[0]:
+                        return row[0]
+                return None
+        except psycopg.Error as e:
+            _logger.error("Could not compute catalog fingerprint: %r", e)
+            return None
+
+    def catalog_snapshot(self, previous=None):
+        """Returns a CatalogSnapshot of the objects used for completions, or
+        None if it can't be taken.
+
+        Each of relations, functions and foreignkeys maps an oid to a tuple
+        whose first item changes whenever the object is altered. Changes to
+        schemas and data types are only tracked as a whole.
+
+        If `previous` is given, only the objects changed since it was taken
+        are queried, the others are copied from it.
+        """
+        if self.is_virtual_database():
+            return None
+        try:
+            with self.conn.cursor() as cur:
+                _logger.debug("Catalog snapshot queries.")
+                cur.execute(self.snapshot_fingerprints_query)
+                namespaces, datatypes, xmin = cur.fetchone()
+                # The transactions older than xmin are over, so the catalog
+                # rows changed since have a newer xmin. The xmin of rows only
+                # holds the low 32 bits of the transaction id: start over when
+                # the high ones (the wraparound epoch) change.
+                since = None
+                if previous and previous.xmin >> 32 == xmin >> 32:
+                    since = previous.xmin & 0xFFFFFFFF
+                snapshots = []
+                for query, objects in (
+                    (self.snapshot_relations_query, "relations"),
+                    (self.snapshot_functions_query, "functions"),
+                    (self.snapshot_foreignkeys_query, "foreignkeys"),
+                ):
+                    cur.execute(query, {"since": since})
+                    changed = {row[0]: row[1:] for row in cur}
+                    snapshots.append({**getattr(previous, objects), **changed} if since is not None else changed)
+                if since is not None:
+                    self._drop_snapshot_objects(cur, snapshots)
+        except psycopg.Error as e:
+            _logger.error("Could not take catalog snapshot: %r", e)
+            return None
+        return CatalogSnapshot(namespaces, datatypes, xmin, *snapshots)
+
+    def _drop_snapshot_objects(self, cur, snapshots):
+        """Removes the dropped objects from the relations, functions and
+        foreignkeys of a snapshot. Only their oids are queried, and only if
+        their count shows some are gone."""
+        cur.execute(self.snapshot_counts_query)
+        stale = [len(objects) != count for objects, count in zip(snapshots, cur.fetchone())]
+        if not any(stale):
+            return
+        cur.execute(self.snapshot_oids_query, dict(zip(("relations", "functions", "foreignkeys"), stale)))
+        existing = [set() for _ in snapshots]
+        for index, oid in cur:
+            existing[index].add(oid)
+        for objects, oids, is_stale in zip(snapshots, existing, stale):
+            if is_stale:
+                for oid in objects.keys() - oids:
+                    del objects[oid]
+
     def explain_prefix(self):
         return "EXPLAIN (ANALYZE, COSTS, VERBOSE, BUFFERS, FORMAT JSON) "
 
@@ -1,3 +1,5 @@
+from time import time
+
 from prompt_toolkit.key_binding.vi_state import InputMode
 from prompt_toolkit.application import get_app
 
@@ -16,10 +18,22 @@ def _get_vi_mode():
     return vi_modes[get_app().vi_state.input_mode]
 
 
+def _get_query_progress_tokens(pgcli):
+    result = [("class:bottom-toolbar", " Running: {:.1f}s".format(time() - pgcli.query_started))]
+    rows = pgcli.pgexecute.rows_received()
+    if rows is not None:
+        result.append(("class:bottom-toolbar", "  Rows: {:,}".format(rows)))
+    result.append(("class:bottom-toolbar", "  [Ctrl-C] Cancel"))
+    return result
+
+
 def create_toolbar_tokens_func(pgcli):
     """Return a function that generates the toolbar tokens."""
 
     def get_toolbar_tokens():
+        if pgcli.query_started is not None:
+            return _get_query_progress_tokens(pgcli)
+
         result = []
         result.append(("class:bottom-toolbar", " "))
 
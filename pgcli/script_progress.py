@@ -0,0 +1,64 @@
+import sys
+import time
+
+
+def format_size(size):
+    """Returns `size` bytes in a human readable form, like pg_size_pretty()."""
+    for unit in ("bytes", "kB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            break
+        size /= 1024
+    if unit == "bytes":
+        return f"{int(size)} bytes"
+    return f"{size:.1f} {unit}"
+
+
+class ScriptProgress:
+    """Shows how far \\i is in a script: the number of statements run, the
+    bytes read and the reading rate.
+
+    The progress is written on a single line of `file`, rewritten at most
+    every `interval` seconds, and only once the script has run for that long,
+    so that short scripts don't show it. Nothing is shown unless `file` is a
+    terminal."""
+
+    def __init__(self, name, size=None, file=None, interval=0.5, clock=time.monotonic):
+        self.name = name
+        self.size = size
+        self.file = file or sys.stderr
+        self.interval = interval
+        self.clock = clock
+        self.enabled = self.file.isatty()
+        self.started = self.shown = clock()
+        self.width = 0
+        self.start_offset = None
+
+    def update(self, statements, offset):
+        """Shows the progress after `statements` statements, `offset` bytes
+        into the file, if it is time to."""
+        if self.start_offset is None:
+            self.start_offset = offset
+        if not self.enabled:
+            return
+        now = self.clock()
+        if now - self.shown < self.interval:
+            return
+        self.shown = now
+        self._write(self.format(statements, offset, now - self.started))
+
+    def format(self, statements, offset, elapsed):
+        read = format_size(offset)
+        if self.size:
+            read += f" of {format_size(self.size)} ({offset * 100 // self.size}%)"
+        rate = (offset - (self.start_offset or 0)) / elapsed if elapsed > 0 else 0
+        return f"\\i {self.name}: {statements:,} statements, {read}, {format_size(rate)}/s"
+
+    def clear(self):
+        """Removes the progress line, if it was shown."""
+        if self.width:
+            self._write("")
+
+    def _write(self, text):
+        self.file.write("\r" + text.ljust(self.width) + "\r")
+        self.file.flush()
+        self.width = len(text)
@@ -0,0 +1,70 @@
+"""Memory used by auto-completion column metadata.
+
+Compares ColumnTable with the previous layout, an OrderedDict of
+ColumnMetadata tuples per relation. Run with:
+
+    python tests/benchmarks/bench_column_memory.py [columns] [columns per table]
+"""
+
+import sys
+import tracemalloc
+from collections import OrderedDict
+
+from pgcli.packages.parseutils.meta import ColumnMetadata, ColumnTable
+
+DATATYPES = ("integer", "text", "bigint", "timestamp with time zone", "boolean", "numeric")
+
+
+def column_data(columns, per_table):
+    """Yields (schema, table, column, datatype, has_default, default) rows, as
+    returned by PGExecute.table_columns."""
+    for i in range(columns):
+        table, column = divmod(i, per_table)
+        # Built with str.format so that, like rows read from the database,
+        # equal names are distinct objects.
+        yield (
+            "public",
+            "table_{}".format(table),
+            "column_{}".format(column),
+            "{}".format(DATATYPES[column % len(DATATYPES)]),
+            column == 0,
+            "nextval('seq')" if column == 0 else None,
+        )
+
+
+def build_dicts(rows):
+    metadata = {}
+    for schema, relname, colname, datatype, has_default, default in rows:
+        columns = metadata.setdefault(relname, OrderedDict())
+        columns[colname] = ColumnMetadata(colname, datatype, has_default=has_default, default=default)
+    return metadata
+
+
+def build_tables(rows):
+    metadata = {}
+    for schema, relname, colname, datatype, has_default, default in rows:
+        columns = metadata.get(relname)
+        if columns is None:
+            columns = metadata[relname] = ColumnTable()
+        columns.add_column(colname, datatype, has_default, default)
+    return metadata
+
+
+def measure(build, columns, per_table):
+    tracemalloc.start()
+    metadata = build(column_data(columns, per_table))
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del metadata
+    return size
+
+
+def main(columns=1000000, per_table=20):
+    print("{:,} columns, {} per table".format(columns, per_table))
+    for name, build in (("OrderedDict", build_dicts), ("ColumnTable", build_tables)):
+        size = measure(build, columns, per_table)
+        print("{:<12} {:>8.1f} MiB {:>6.1f} bytes/column".format(name, size / 2**20, size / columns))
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,220 @@
+"""Latency of auto-completion on synthetic catalogs.
+
+Generates catalogs with the given numbers of relations, plus a few very wide
+tables, thousands of overloaded functions and a dense foreign key graph,
+and reports latency percentiles for populating a PGCompleter, suggest_type,
+find_matches and get_completions. Run with:
+
+    python tests/benchmarks/bench_completion.py [--scales 1000,10000,100000] [--repeat 20]
+"""
+
+import argparse
+import random
+import statistics
+import time
+from collections import namedtuple
+
+from prompt_toolkit.document import Document
+
+from pgcli.packages.parseutils.meta import ForeignKey, FunctionMetadata
+from pgcli.packages.sqlcompletion import suggest_type
+from pgcli.pgcompleter import PGCompleter
+
+WORDS = (
+    "account",
+    "address",
+    "audit",
+    "customer",
+    "event",
+    "invoice",
+    "item",
+    "log",
+    "order",
+    "payment",
+    "product",
+    "session",
+    "shipment",
+    "user",
+)
+DATATYPES = ("integer", "text", "bigint", "timestamp with time zone", "boolean", "numeric")
+
+Catalog = namedtuple("Catalog", "schemata tables views columns view_columns functions datatypes foreignkeys")
+
+# Statements to complete, with the cursor at the end. {table} and {other}
+# are replaced with existing table names.
+STATEMENTS = (
+    "SELECT * FROM cu",
+    "SELECT * FROM public.ord",
+    "SELECT  FROM {table}",
+    "SELECT * FROM {table} t WHERE t.",
+    "SELECT * FROM {table} t JOIN ",
+    "SELECT * FROM {table} t JOIN {other} o ON ",
+    "SELECT fn_",
+    "INSERT INTO {table} (",
+    "CREATE TABLE t (x cust",
+)
+
+
+def relation_name(i):
+    return "{}_{}_{}".format(WORDS[i % len(WORDS)], WORDS[i // len(WORDS) % len(WORDS)], i)
+
+
+def synthetic_catalog(
+    relations,
+    columns=10,
+    wide_tables=10,
+    wide_columns=1000,
+    functions=2000,
+    overloads=5,
+    foreignkeys=3,
+    seed=0,
+):
+    """Returns a Catalog with `relations` tables and views spread over a few
+    schemas, in the form returned by the PGExecute methods."""
+    rng = random.Random(seed)
+    schemata = ["public", "sales", "audit", "staging"]
+    tables, views = [], []
+    for i in range(relations):
+        schema = schemata[i % len(schemata)]
+        (views if i % 10 == 9 else tables).append((schema, relation_name(i)))
+
+    def column_rows(relations):
+        for n, (schema, relname) in enumerate(relations):
+            width = wide_columns if n < wide_tables else columns
+            for c in range(width):
+                colname = "id" if c == 0 else "{}_{}".format(WORDS[c % len(WORDS)], c)
+                yield schema, relname, colname, DATATYPES[c % len(DATATYPES)], c == 0, "nextval('seq')" if c == 0 else None
+
+    fks = []
+    for schema, relname in tables:
+        for _ in range(foreignkeys):
+            parentschema, parenttable = rng.choice(tables)
+            fks.append(ForeignKey(parentschema, parenttable, "id", schema, relname, "{}_{}".format(WORDS[1], 1)))
+
+    funcs = [
+        FunctionMetadata(
+            schemata[i % len(schemata)],
+            "fn_{}_{}".format(WORDS[i % len(WORDS)], i // overloads),
+            ["arg{}".format(a) for a in range(i % overloads + 1)],
+            ["integer"] * (i % overloads + 1),
+            [],
+            "integer",
+            False,
+            False,
+            False,
+            False,
+            None,
+        )
+        for i in range(functions)
+    ]
+    datatypes = [(schemata[i % len(schemata)], "{}_type_{}".format(WORDS[i % len(WORDS)], i)) for i in range(relations // 100 + 1)]
+    return Catalog(schemata, tables, views, list(column_rows(tables)), list(column_rows(views)), funcs, datatypes, fks)
+
+
+def populate(completer, catalog, timings=None):
+    """Populates `completer` like the completion refresher does, adding the
+    time taken by each extend_* method to `timings`."""
+    steps = (
+        ("extend_schemata", lambda: completer.extend_schemata(catalog.schemata)),
+        ("extend_relations", lambda: completer.extend_relations(catalog.tables, kind="tables")),
+        ("extend_columns", lambda: completer.extend_columns(catalog.columns, kind="tables")),
+        ("extend_foreignkeys", lambda: completer.extend_foreignkeys(catalog.foreignkeys)),
+        ("extend_relations (views)", lambda: completer.extend_relations(catalog.views, kind="views")),
+        ("extend_columns (views)", lambda: completer.extend_columns(catalog.view_columns, kind="views")),
+        ("extend_datatypes", lambda: completer.extend_datatypes(catalog.datatypes)),
+        ("extend_functions", lambda: completer.extend_functions(catalog.functions)),
+    )
+    for name, step in steps:
+        start = time.perf_counter()
+        step()
+        if timings is not None:
+            timings.setdefault(name, []).append(time.perf_counter() - start)
+    completer.set_search_path(["public", "sales"])
+
+
+def measure(func, repeat, setup=None):
+    """Returns the durations of `repeat` calls of `func`."""
+    durations = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def report(name, durations):
+    durations = sorted(durations)
+    if len(durations) > 1:
+        p50, p90, p99 = (statistics.quantiles(durations, n=100, method="inclusive")[i] for i in (49, 89, 98))
+    else:
+        p50 = p90 = p99 = durations[0]
+    print("  {:<60.60} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f}".format(name, *(d * 1000 for d in (p50, p90, p99, durations[-1]))))
+
+
+def run(relations, repeat, populate_repeat=1):
+    catalog = synthetic_catalog(relations)
+    print(
+        "{:,} relations, {:,} columns, {:,} functions, {:,} foreign keys".format(
+            relations,
+            len(catalog.columns) + len(catalog.view_columns),
+            len(catalog.functions),
+            len(catalog.foreignkeys),
+        )
+    )
+    print("  {:<60} {:>9} {:>9} {:>9} {:>9}".format("ms", "p50", "p90", "p99", "max"))
+
+    timings = {}
+    for _ in range(populate_repeat):
+        completer = PGCompleter(smart_completion=True)
+        populate(completer, catalog, timings)
+    for name, durations in timings.items():
+        report(name, durations)
+
+    table = catalog.tables[len(catalog.tables) // 2][1]
+    other = catalog.tables[len(catalog.tables) // 3][1]
+    statements = [s.format(table=table, other=other) for s in STATEMENTS]
+
+    for text in statements:
+        report("suggest_type: " + text, measure(lambda: suggest_type(text, text), repeat))
+
+    candidates = [completer._make_cand(t, False, None) for t in completer.populate_schema_objects(None, "tables")]
+    for text in ("c", "cus", "custord"):
+        report("find_matches: " + text, measure(lambda: completer.find_matches(text, candidates, meta="table"), repeat))
+
+    def reset_session():
+        completer._session = None
+
+    for text in statements:
+        document = Document(text=text, cursor_position=len(text))
+        report(
+            "get_completions: " + text,
+            measure(lambda: completer.get_completions(document, None), repeat, setup=reset_session),
+        )
+
+    # Typing a table name one key at a time, as the completion menu does.
+    prefix = "SELECT * FROM "
+    word = WORDS[3] + "_" + WORDS[7]
+    durations = []
+    for _ in range(repeat):
+        reset_session()
+        for i in range(1, len(word) + 1):
+            text = prefix + word[:i]
+            durations.extend(measure(lambda: completer.get_completions(Document(text=text, cursor_position=len(text)), None), 1))
+    report("get_completions, typing: " + prefix + word, durations)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", default="1000,10000,100000", help="comma separated numbers of relations")
+    parser.add_argument("--repeat", type=int, default=20, help="runs of each completion benchmark")
+    parser.add_argument("--populate-repeat", type=int, default=1, help="runs of the population benchmarks")
+    args = parser.parse_args(argv)
+    for scale in args.scales.split(","):
+        run(int(scale), args.repeat, args.populate_repeat)
+        print()
+
+
+if __name__ == "__main__":
+    main()
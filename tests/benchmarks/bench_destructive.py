@@ -0,0 +1,63 @@
+"""Time taken to check a pasted batch of statements for destructive ones.
+
+Compares is_destructive() with the sqlparse based check it replaced, which
+split the batch and formatted each statement. Run with:
+
+    python tests/benchmarks/bench_destructive.py [statements] [repeat]
+"""
+
+import random
+import sys
+import time
+
+import sqlparse
+
+from pgcli.packages.parseutils import BASE_KEYWORDS, is_destructive, query_is_unconditional_update, query_starts_with
+
+STATEMENTS = (
+    "INSERT INTO events (id, kind, payload) VALUES ({0}, 'click', '{{\"x\": {0}; \"y\": 2}}');",
+    "UPDATE accounts SET balance = balance - {0}\n WHERE id = {0} AND note <> 'a;b';",
+    "-- comment {0};\nSELECT count(*) FROM sessions WHERE expires_at < now() - interval '{0} days';",
+    "CREATE FUNCTION f{0}() RETURNS int AS $$\nBEGIN\n  RETURN {0};\nEND;\n$$ LANGUAGE plpgsql;",
+    "SELECT a, b /* nested; */ FROM t{0} ORDER BY 1;",
+)
+
+
+def script(statements, seed=0):
+    rng = random.Random(seed)
+    return "\n".join(rng.choice(STATEMENTS).format(i) for i in range(statements)) + "\nDROP TABLE t;\n"
+
+
+def sqlparse_is_destructive(queries, keywords):
+    for query in sqlparse.split(queries):
+        if query:
+            formatted_sql = sqlparse.format(query.lower(), strip_comments=True).strip()
+            if "unconditional_update" in keywords and query_is_unconditional_update(formatted_sql):
+                return True
+            if query_starts_with(formatted_sql, keywords):
+                return True
+    return False
+
+
+def best(func, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+
+def main(statements=2000, repeat=3):
+    text = script(statements)
+    assert is_destructive(text, BASE_KEYWORDS) and sqlparse_is_destructive(text, BASE_KEYWORDS)
+
+    print("{:<40} {:>12}".format("batch of {:,} statements ({:,} chars)".format(statements, len(text)), "ms"))
+    before = best(lambda: sqlparse_is_destructive(text, BASE_KEYWORDS), repeat)
+    print("{:<40} {:>12.2f}".format("sqlparse split and format", before * 1000))
+    after = best(lambda: is_destructive(text, BASE_KEYWORDS), repeat)
+    print("{:<40} {:>12.2f}".format("is_destructive", after * 1000))
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,67 @@
+"""Time taken to count keywords in executed queries.
+
+Compares KeywordMatcher with running each keyword regex over the text, on
+a pasted script and on the 100 history entries loaded by a completion
+refresh. Run with:
+
+    python tests/benchmarks/bench_prioritization.py [statements] [repeat]
+"""
+
+import random
+import sys
+import time
+
+from pgcli.packages.prioritization import PrevalenceCounter, keyword_matcher, keyword_regexs
+
+STATEMENTS = (
+    "SELECT o.id, o.total FROM orders o JOIN customers c ON c.id = o.customer_id WHERE c.name LIKE 'a%' ORDER BY o.total DESC;",
+    "INSERT INTO audit_log (event, created_at) VALUES ('login', now());",
+    "UPDATE accounts SET balance = balance - 10 WHERE id = 42;",
+    "DELETE FROM sessions WHERE expires_at < now();",
+    "CREATE MATERIALIZED VIEW daily AS SELECT date_trunc('day', ts) d, count(*) FROM events GROUP BY 1;",
+    "REFRESH MATERIALIZED VIEW daily;",
+    "ALTER TABLE products ADD COLUMN sku text NOT NULL DEFAULT '';",
+)
+
+
+def script(statements, seed=0):
+    rng = random.Random(seed)
+    return "\n".join(rng.choice(STATEMENTS) for _ in range(statements))
+
+
+def count_each(text):
+    counts = {}
+    for keyword, regex in keyword_regexs.items():
+        for _ in regex.finditer(text):
+            counts[keyword] = counts.get(keyword, 0) + 1
+    return counts
+
+
+def best(func, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+
+def main(statements=10000, repeat=3):
+    text = script(statements)
+    history = [script(5, seed) for seed in range(100)]
+    assert count_each(text) == keyword_matcher.counts(text)
+
+    print("{:<40} {:>12} {:>12}".format("ms", "each regex", "one pass"))
+    for name, texts in (
+        ("script of {:,} statements ({:,} chars)".format(statements, len(text)), [text]),
+        ("100 history entries", history),
+    ):
+        each = best(lambda: [count_each(t) for t in texts], repeat)
+        one = best(lambda: [keyword_matcher.counts(t) for t in texts], repeat)
+        print("{:<40} {:>12.2f} {:>12.2f}".format(name, each * 1000, one * 1000))
+    update = best(lambda: PrevalenceCounter().update_keywords(text), repeat)
+    print("{:<40} {:>25.2f}".format("PrevalenceCounter.update_keywords", update * 1000))
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,54 @@
+"""Time taken to split a script run with \\i into statements.
+
+Compares split_script(), which reads the script line by line, with
+sqlparse.split() on the whole text. Run with:
+
+    python tests/benchmarks/bench_splitter.py [statements] [repeat]
+"""
+
+import io
+import random
+import sys
+import time
+
+import sqlparse
+
+from pgcli.packages.parseutils.splitter import split_script
+
+STATEMENTS = (
+    "INSERT INTO events (id, kind, payload) VALUES ({0}, 'click', '{{\"x\": {0}; \"y\": 2}}');",
+    "UPDATE accounts SET balance = balance - {0}\n WHERE id = {0} AND note <> 'a;b';",
+    "-- comment {0};\nDELETE FROM sessions WHERE expires_at < now() - interval '{0} days';",
+    "CREATE FUNCTION f{0}() RETURNS int AS $$\nBEGIN\n  RETURN {0};\nEND;\n$$ LANGUAGE plpgsql;",
+    "SELECT count(*) FROM (SELECT {0} AS a /* nested; */) s;",
+)
+
+
+def script(statements, seed=0):
+    rng = random.Random(seed)
+    return "\n".join(rng.choice(STATEMENTS).format(i) for i in range(statements)) + "\n"
+
+
+def best(func, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+
+def main(statements=10000, repeat=3):
+    text = script(statements)
+    split = [statement.sql for statement in split_script(io.StringIO(text))]
+    assert split == [sql.strip() for sql in sqlparse.split(text)]
+
+    print("{:<40} {:>12}".format("script of {:,} statements ({:,} chars)".format(statements, len(text)), "ms"))
+    parse = best(lambda: sqlparse.split(text), repeat)
+    print("{:<40} {:>12.2f}".format("sqlparse.split", parse * 1000))
+    stream = best(lambda: list(split_script(io.StringIO(text))), repeat)
+    print("{:<40} {:>12.2f}".format("split_script", stream * 1000))
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,52 @@
+from pgcli.packages.parseutils.meta import ColumnMetadata, ColumnTable, ForeignKey
+
+
+def test_column_table_lookups():
+    columns = ColumnTable()
+    columns.add_column("id", "integer", True, "nextval('seq')")
+    columns.add_column("name", "text")
+    assert list(columns) == ["id", "name"]
+    assert len(columns) == 2
+    assert "name" in columns
+    assert "other" not in columns
+    assert columns["id"] == ColumnMetadata("id", "integer", (), "nextval('seq')", True)
+    assert columns.get("other") is None
+    assert list(columns.values()) == [columns["id"], columns["name"]]
+    assert dict(columns.items()) == {"id": columns["id"], "name": columns["name"]}
+
+
+def test_column_table_add_column_after_lookup():
+    columns = ColumnTable()
+    columns.add_column("a", "text")
+    assert "b" not in columns
+    columns.add_column("b", "text")
+    assert columns["b"].name == "b"
+
+
+def test_column_table_interns_names():
+    columns = ColumnTable()
+    columns.add_column("".join(["col", "umn"]), "".join(["in", "teger"]))
+    (column,) = columns.values()
+    assert column.name is "column"  # noqa: F632
+    assert column.datatype is "integer"  # noqa: F632
+
+
+def test_column_table_foreignkeys():
+    fk = ForeignKey("public", "users", "id", "public", "orders", "user_id")
+    columns = ColumnTable()
+    columns.add_column("id", "integer")
+    columns.add_column("user_id", "integer")
+    columns.add_foreignkey("user_id", fk)
+    assert columns["user_id"].foreignkeys == (fk,)
+    assert columns["id"].foreignkeys == ()
+    # Lookups share the foreign keys of the table, which are immutable.
+    assert columns["user_id"].foreignkeys is columns["user_id"].foreignkeys
+    columns.add_foreignkey("user_id", fk)
+    assert columns["user_id"].foreignkeys == (fk, fk)
+
+
+def test_column_table_equals_dict():
+    columns = ColumnTable()
+    assert columns == {}
+    columns.add_column("id", "integer")
+    assert columns == {"id": ColumnMetadata("id", "integer")}
@@ -0,0 +1,119 @@
+"""Checks that is_destructive() takes the same decisions as the sqlparse
+based check it replaced, on a generated corpus of scripts."""
+
+import random
+
+import pytest
+import sqlparse
+
+from pgcli.packages.parseutils import ALL_KEYWORDS, BASE_KEYWORDS, find_destructive, is_destructive
+from pgcli.packages.parseutils.splitter import split_script
+
+STATEMENTS = (
+    "select 1",
+    "drop table t",
+    "DROP INDEX i",
+    "drop table t cascade",
+    "delete from t",
+    "Delete From t where a = 1",
+    "truncate t",
+    "alter table t add b int",
+    "update t set a = 1",
+    "UPDATE t SET a = 1 WHERE b = 2",
+    "update t set a = 1\nwhere b = 2",
+    "update t\nset a = 1",
+    "update t set a = (select 1 from u where u.b = 2)",
+    "update t set note = 'a b'",
+    'update t set "where" = 1',
+    "update t set a = 'where'",
+    "update t set a = E'it\\'s; where' where b = 1",
+    "insert into t values (1)",
+    "shutdown now",
+    "create table t (a int)",
+    "create function f() returns int begin atomic select 1; end",
+    "create procedure p() language sql begin atomic delete from t; end",
+    "grant select on t to u",
+    "with x as (select 1) select * from x",
+    "select 'drop table t'",
+    "select $$; drop table t; $$",
+    "select $f$ ; delete from t; $f$",
+    'select "a;b" from t',
+    "select (1;",
+    "set search_path = public",
+    "vacuum t",
+    "explain delete from t",
+    "copy t to stdout",
+    "\\x",
+    "\\dt",
+    "\\d foo",
+    "\\echo 'a;b'",
+)
+PREFIXES = ("", " ", "\n", "  \n\t", "-- note\n", "/* c */ ", "/* multi\nline */\n", "\\x; ", "\\dt;\n", "\\d foo;")
+SEPARATORS = (";", "; ", ";\n", ";\n\n", " ;\n-- done\n")
+KEYWORDS = (ALL_KEYWORDS, BASE_KEYWORDS, ["insert"], ["DROP", "Truncate"], ["unconditional_update"], [])
+
+
+def corpus(scripts, seed):
+    rng = random.Random(seed)
+    for _ in range(scripts):
+        count = rng.randint(1, 4)
+        yield "".join(
+            rng.choice(PREFIXES) + rng.choice(STATEMENTS) + (rng.choice(SEPARATORS) if i < count - 1 or rng.random() < 0.5 else "")
+            for i in range(count)
+        )
+
+
+def sqlparse_words(queries):
+    """The words of the queries in *queries*, as the check is_destructive()
+    did before split them, with sqlparse."""
+    return [sqlparse.format(query.lower(), strip_comments=True).split() for query in sqlparse.split(queries) if query]
+
+
+def sqlparse_is_destructive(queries, keywords, words=None):
+    prefixes = [keyword.lower() for keyword in keywords]
+    for tokens in sqlparse_words(queries) if words is None else words:
+        if "unconditional_update" in keywords and tokens and tokens[0] == "update" and "where" not in tokens:
+            return True
+        if tokens and tokens[0] in prefixes:
+            return True
+    return False
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_same_decisions_as_sqlparse(seed):
+    for script in corpus(250, seed):
+        words = sqlparse_words(script)
+        for keywords in KEYWORDS:
+            assert is_destructive(script, keywords) == sqlparse_is_destructive(script, keywords, words), (script, keywords)
+
+
+@pytest.mark.parametrize(
+    "sql",
+    [
+        # One word statements followed by a semicolon
+        "truncate;",
+        # Statements after a backslash command, which runs to the end of its
+        # line
+        "\\x\ndrop table t",
+        # Keywords in strings, and those not separated from what follows by a
+        # space
+        "update t set a = 'x where y'",
+        "update t set a = 1 where(b = 2)",
+    ],
+)
+def test_different_decisions(sql):
+    # The lines above are split into statements and words like psql does,
+    # rather than on spaces after sqlparse.split()
+    assert is_destructive(sql, BASE_KEYWORDS) != sqlparse_is_destructive(sql, BASE_KEYWORDS)
+
+
+@pytest.mark.parametrize("sql", ["\\x; drop table t", "\\dt; truncate t", "\\d foo; delete from t", "\\x\ndrop table t"])
+def test_statements_after_backslash_commands(sql):
+    assert is_destructive(sql, BASE_KEYWORDS)
+
+
+def test_find_destructive():
+    statements = split_script(["select 1; UPDATE t SET a = 1;\n", "drop table t;\n"])
+    statement = find_destructive(statements, BASE_KEYWORDS)
+    assert statement.sql == "UPDATE t SET a = 1;"
+    assert next(statements).sql == "drop table t;"
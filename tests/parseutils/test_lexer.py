@@ -0,0 +1,178 @@
+import random
+from unittest.mock import patch
+
+import pytest
+import sqlparse
+from sqlparse.lexer import Lexer
+from sqlparse.tokens import Whitespace
+
+from pgcli.packages import sqlcompletion
+from pgcli.packages.parseutils import lexer, tables
+from pgcli.packages.parseutils.utils import parse
+from pgcli.packages.sqlcompletion import suggest_type
+
+STATEMENTS = (
+    "SELECT * FROM foo",
+    "SELECT a, b, c FROM foo f WHERE f.a = 1 AND f.b > 2 OR f.c LIKE 'x' ORDER BY a",
+    "SELECT DISTINCT a FROM public.foo AS f LEFT OUTER JOIN bar b ON f.id = b.foo_id AND f.x = b.y WHERE b.z IS NOT NULL",
+    "SELECT f.a, b.c FROM foo f JOIN bar b ON f.id = b.id JOIN baz z ON z.id = b.id GROUP BY f.a HAVING count(*) > 1 LIMIT 10",
+    'SELECT "Foo".a FROM "Foo" JOIN "Bar" ON "Foo".id = "Bar".id',
+    'SELECT * FROM "Sch"."Tab" t, s.other o, Third',
+    "SELECT * FROM foo, bar, baz WHERE foo.a = bar.b",
+    "SELECT * FROM Foo F CROSS JOIN Bar NATURAL JOIN baz RIGHT JOIN qux q USING (id)",
+    "SELECT count(*), max(a), coalesce(b, 0) FROM t1 INNER JOIN t2 ON t1.x = t2.x WHERE t1.y IN (1, 2, 3) AND t2.z BETWEEN 1 AND 5",
+    "SELECT * FROM foo WHERE a = 'it''s' AND b::text = '1' ORDER BY a ASC NULLS FIRST, b",
+    "SELECT * FROM foo WHERE x IN (SELECT y FROM bar WHERE z = 1) AND w = 2",
+    "SELECT * FROM (SELECT a FROM foo) sub JOIN bar ON sub.a = bar.a",
+    "SELECT a AS x, b y FROM foo WHERE NOT a AND EXISTS (SELECT 1 FROM bar)",
+    "SELECT CASE WHEN a THEN b ELSE c END FROM foo WHERE a ILIKE '%x' AND b NOT LIKE 'y'",
+    "SELECT * FROM users u JOIN events e ON u.id = e.user_id WHERE u.name ~ 'a' AND e.ts > now() - interval '1 day'",
+    "select * from custom.products p full outer join custom.orders o on p.id = o.product_id where o.qty >= 10 order by p.name",
+    "SELECT * FROM foo f WHERE f.a = 1 UNION SELECT * FROM bar b WHERE b.a = 2",
+    "SELECT * FROM generate_series(1, 10) g JOIN foo ON foo.id = g",
+    'SELECT x FROM foo AS F JOIN bar AS "B" ON F.id = "B".id',
+    "SELECT * FROM tbl1 t1 LEFT JOIN tbl2 t2 ON t1.a = t2.a LEFT JOIN tbl3 t3 ON t2.b = t3.b OR t1.c = t3.c",
+    "SELECT * FROM foo -- comment\nWHERE a = $1",
+    "SELECT 1; SELECT * FROM foo WHERE ",
+    "SELECT * FROM foo f\n  JOIN bar b\n    ON f.id = b.id\n WHERE b.x = 1\n   AND f.y = 2",
+    "SELECT * FROM foo WHERE a IS NULL OR b IS NOT NULL AND c NOT IN (1)",
+    "SELECT DISTINCT ON (a) a, b FROM foo ORDER BY a, b DESC",
+    "SELECT * FROM Foo AS bar JOIN bar AS foo ON foo.a = bar.a WHERE Foo.Bar = 1",
+)
+
+# Tokens of statements that aren't valid SQL, to exercise sqlparse's quirks
+VOCABULARY = (
+    "SELECT DISTINCT FROM JOIN LEFT\tJOIN CROSS\tJOIN NATURAL\tJOIN ON AND OR NOT WHERE ORDER\tBY HAVING LIMIT AS IN IS NULL "
+    'BETWEEN USING UNION CASE WHEN END INTO SET foo Foo "Foo" b s.foo S.Foo "S".foo s."Foo" user text f.id '
+    ", , = <> LIKE NOT\tLIKE :: * ( ) ( ) 1 'a' count(*) -"
+).split(" ")
+
+
+def random_statements(count, seed=0):
+    rng = random.Random(seed)
+    for _ in range(count):
+        words = ["SELECT"] + [rng.choice(VOCABULARY).replace("\t", " ") for _ in range(rng.randint(1, 12))]
+        yield "".join(word + rng.choice(("", " ", " ", "\n")) for word in words)
+
+
+def suggest_type_parsed(full_text, text_before_cursor):
+    with patch.object(sqlcompletion, "_suggest_simple_select", return_value=None):
+        return suggest_type(full_text, text_before_cursor)
+
+
+def assert_same_suggestions(statements):
+    """Checks that the fast path and sqlparse give the same suggestions for
+    every cursor position in `statements`, returning how often the fast
+    path was taken."""
+    fast = 0
+    for statement in statements:
+        for i in range(len(statement) + 1):
+            for full_text in (statement, statement[:i]):
+                suggestions = sqlcompletion._suggest_simple_select(full_text, statement[:i])
+                if suggestions is not None:
+                    fast += 1
+                    assert suggestions == suggest_type_parsed(full_text, statement[:i]), (full_text, statement[:i])
+    return fast
+
+
+@pytest.mark.parametrize("sql", STATEMENTS)
+def test_tokenize(sql):
+    tokens = lexer.tokenize(sql)
+    if tokens is not None:
+        expected = [(ttype, value) for ttype, value in Lexer.get_default_instance().get_tokens(sql) if ttype not in Whitespace]
+        assert [(t.ttype, t.value) for t in tokens] == expected
+        assert all(sql[t.start : t.end] == t.value for t in tokens)
+
+
+@pytest.mark.parametrize("sql", ["SELECT 1 -- comment", "SELECT $1", "SELECT $$a$$", "SELECT 1;", "\\d foo", "SELECT 'open"])
+def test_tokenize_unsupported(sql):
+    assert lexer.tokenize(sql) is None
+
+
+@pytest.fixture
+def clear_lexer_cache():
+    lexer._lexer.cache_clear()
+    lexer.tokenize.cache_clear()
+    yield
+    lexer._lexer.cache_clear()
+    lexer.tokenize.cache_clear()
+
+
+@pytest.mark.parametrize(
+    "rules",
+    [
+        lambda rules: [(str, action) for match, action in rules],
+        lambda rules: [(lambda text, pos: None, action) for match, action in rules],
+        lambda rules: [(match.__self__.fullmatch, action) for match, action in rules],
+        lambda rules: [(match, action, None) for match, action in rules],
+    ],
+)
+def test_unexpected_sqlparse_rules_disable_fast_path(rules, clear_lexer_cache):
+    default = Lexer.get_default_instance()
+    fake = Lexer.__new__(Lexer)
+    fake.__dict__.update(default.__dict__, _SQL_REGEX=rules(default._SQL_REGEX))
+    with patch.object(Lexer, "get_default_instance", return_value=fake):
+        assert lexer._lexer() is None
+        assert lexer.tokenize("SELECT * FROM foo") is None
+    lexer._lexer.cache_clear()
+    assert lexer._lexer() is not None
+
+
+def test_different_sqlparse_tokens_disable_fast_path(clear_lexer_cache):
+    with patch.object(lexer, "sqlparse_tokenize", lambda sql: iter([(Whitespace, sql)])):
+        assert lexer._lexer() is None
+        assert lexer.tokenize("SELECT * FROM foo") is None
+        assert [t.value for t in lexer.get_tokens("SELECT 1")] == ["SELECT 1"]
+
+
+@pytest.mark.parametrize("sql", STATEMENTS)
+def test_extract_tables(sql):
+    tokens = lexer.tokenize(sql)
+    extracted = tokens and lexer.extract_tables(sql, tokens)
+    if extracted is not None:
+        assert extracted == tables.extract_tables(sql)
+
+
+def test_find_prev_keyword():
+    sql = "SELECT * FROM foo WHERE a = 1 AND b IN "
+    keyword, text, tokens = lexer.find_prev_keyword(sql, lexer.tokenize(sql))
+    assert (keyword.value, text) == ("IN", sql.rstrip())
+    keyword, text, tokens = lexer.find_prev_keyword(text, tokens, n_skip=1)
+    assert (keyword.value, text) == ("WHERE", "SELECT * FROM foo WHERE")
+
+
+def test_suggestions_same_as_parsed():
+    assert assert_same_suggestions(STATEMENTS) > 1000
+
+
+def test_suggestions_same_as_parsed_for_invalid_statements():
+    assert assert_same_suggestions(random_statements(150)) > 0
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "SELECT * FROM foo f JOIN bar b ON f.id = b.foo_id WHERE ",
+        "SELECT * FROM foo f JOIN ",
+        "SELECT a, ",
+    ],
+)
+def test_simple_select_is_not_parsed(text):
+    parse.cache_clear()
+    with patch("sqlparse.parse", side_effect=sqlparse.parse) as sqlparse_parse:
+        suggest_type(text, text)
+    assert sqlparse_parse.call_count == 0
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "INSERT INTO foo SELECT * FROM ",
+        "WITH x AS (SELECT 1) SELECT * FROM ",
+        "SELECT * FROM foo; SELECT * FROM ",
+        "SELECT * FROM (SELECT * FROM foo) f WHERE ",
+        "SELECT * FROM foo WHERE a = ANY(",
+    ],
+)
+def test_statement_is_parsed(text):
+    assert sqlcompletion._suggest_simple_select(text, text) is None
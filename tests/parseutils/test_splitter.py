@@ -0,0 +1,143 @@
+import io
+
+import pytest
+
+from pgcli.packages.parseutils.splitter import ScriptReader, split_script
+
+
+def split(text):
+    return [(s.sql, s.copy_data and list(s.copy_data)) for s in split_script(io.StringIO(text))]
+
+
+def split_sql(text):
+    return [sql for sql, _ in split(text)]
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("", []),
+        ("  \n-- only a comment\n", []),
+        ("SELECT 1", ["SELECT 1"]),
+        ("SELECT 1;SELECT 2;", ["SELECT 1;", "SELECT 2;"]),
+        ("SELECT 1;\n\nSELECT\n  2\n;\n", ["SELECT 1;", "SELECT\n  2\n;"]),
+        ("SELECT 'a;b'; SELECT \"c;d\";", ["SELECT 'a;b';", 'SELECT "c;d";']),
+        ("SELECT 'it''s;'; SELECT 2;", ["SELECT 'it''s;';", "SELECT 2;"]),
+        ("SELECT E'\\';'; SELECT 2;", ["SELECT E'\\';';", "SELECT 2;"]),
+        ("SELECT 'a\\'; SELECT 2;", ["SELECT 'a\\';", "SELECT 2;"]),
+        ("SELECT 'multi\nline;\nstring'; SELECT 2;", ["SELECT 'multi\nline;\nstring';", "SELECT 2;"]),
+        ("SELECT 1 -- one; two\n; SELECT 2;", ["SELECT 1 -- one; two\n;", "SELECT 2;"]),
+        ("SELECT 1 /* a /* nested; */ comment; */; SELECT 2;", ["SELECT 1 /* a /* nested; */ comment; */;", "SELECT 2;"]),
+        ("SELECT $$a;b$$; SELECT $f$ $$; $f$;", ["SELECT $$a;b$$;", "SELECT $f$ $$; $f$;"]),
+        ("SELECT $1; SELECT a$b$c;", ["SELECT $1;", "SELECT a$b$c;"]),
+        (
+            "CREATE RULE r AS ON INSERT TO t DO (INSERT INTO u VALUES (1); DELETE FROM v); SELECT 2;",
+            ["CREATE RULE r AS ON INSERT TO t DO (INSERT INTO u VALUES (1); DELETE FROM v);", "SELECT 2;"],
+        ),
+        ("SELECT 1; ) ; SELECT 2;", ["SELECT 1;", ") ;", "SELECT 2;"]),
+        ("SELECT 1; SELECT 'unclosed;\n", ["SELECT 1;", "SELECT 'unclosed;"]),
+    ],
+)
+def test_split_script(text, expected):
+    assert split_sql(text) == expected
+
+
+@pytest.mark.parametrize(
+    "head",
+    [
+        "CREATE FUNCTION f() RETURNS int LANGUAGE sql",
+        "create or replace function f() returns int language sql",
+        "CREATE PROCEDURE p() LANGUAGE sql",
+    ],
+)
+def test_split_script_begin_atomic(head):
+    body = head + "\nBEGIN ATOMIC\n  SELECT CASE WHEN true THEN 1 END;\n  SELECT 2;\nEND;"
+    assert split_sql(body + "\nSELECT 3;") == [body, "SELECT 3;"]
+
+
+def test_split_script_begin_transaction():
+    text = "BEGIN;\nCREATE TABLE t (a int);\nEND;\nSELECT 1;"
+    assert split_sql(text) == ["BEGIN;", "CREATE TABLE t (a int);", "END;", "SELECT 1;"]
+
+
+def test_split_script_backslash_commands():
+    text = "-- list tables\n\\dt\nSELECT 1; \\x on\nSELECT 2 \\g\nSELECT 3;"
+    assert split_sql(text) == ["\\dt", "SELECT 1;", "\\x on", "SELECT 2 \\g", "SELECT 3;"]
+
+
+def test_split_script_copy_from_stdin():
+    text = "COPY t (a, b) FROM stdin;\n1\tx\n2\ty\n\\.\nSELECT 1;\n"
+    assert split(text) == [("COPY t (a, b) FROM stdin;", ["1\tx\n", "2\ty\n"]), ("SELECT 1;", None)]
+
+
+def test_split_script_unread_copy_data_is_skipped():
+    text = "COPY t FROM STDIN;\n1\n2\n\\.\nSELECT 1;\n"
+    assert [statement.sql for statement in split_script(io.StringIO(text))] == ["COPY t FROM STDIN;", "SELECT 1;"]
+
+
+def test_split_script_copy_to_stdout_has_no_data():
+    assert split("COPY t TO STDOUT;\nSELECT 1;") == [("COPY t TO STDOUT;", None), ("SELECT 1;", None)]
+
+
+def test_split_script_reads_lazily():
+    read = []
+
+    def lines():
+        for line in ("SELECT 1;\n", "SELECT 2;\n", "SELECT 3;\n"):
+            read.append(line)
+            yield line
+
+    statements = split_script(lines())
+    assert next(statements).sql == "SELECT 1;"
+    assert read == ["SELECT 1;\n"]
+
+
+def test_split_script_starts():
+    lines = ["SELECT 1; SELECT\n", "  2;\n", "\n", "COPY t FROM stdin;\n", "1\n", "\\.\n", "-- done\n", "SELECT 3;\n"]
+    read = []
+
+    def numbered_lines():
+        for number, line in enumerate(lines):
+            read.append(number)
+            yield line
+
+    starts = [statement.start for statement in split_script(numbered_lines(), lambda: read[-1])]
+    assert starts == [(0, 0), (0, 9), (1, 4), (6, 0)]
+
+
+def test_split_script_without_tell_has_no_starts():
+    assert [statement.start for statement in split_script(["SELECT 1; SELECT 2;\n"])] == [None, None]
+
+
+def test_script_reader():
+    f = io.BytesIO("SELECT 'é';\r\nSELECT 2;\n".encode())
+    reader = ScriptReader(f)
+    lines = []
+    for line in reader:
+        lines.append((line, reader.tell(), reader.offset))
+    assert lines == [("SELECT 'é';\n", 0, 14), ("SELECT 2;\n", 14, 24)]
+
+
+def test_script_reader_resumes_at_statement_start():
+    f = io.BytesIO(b"SELECT 1; SELECT 'a;b'; SELECT\n  3;\nSELECT 4;\n")
+    statements = list(split_script(ScriptReader(f), lambda: None))
+    f.seek(0)
+    reader = ScriptReader(f, column=9)
+    resumed = list(split_script(reader, reader.tell))
+    assert [s.sql for s in resumed] == [s.sql for s in statements[1:]]
+    assert [s.start for s in resumed] == [(0, 0), (0, 23), (31, 4)]
+
+
+@pytest.mark.parametrize(
+    "text, verbs",
+    [
+        ("DROP TABLE t; -- x\n/* y */ Delete from t;", [("drop", False), ("delete", False)]),
+        ("(SELECT 1); 'a'; \"drop\" t;", [(None, False), (None, False), (None, False)]),
+        ("update t set a = 1; update t set a = 1 where b = 2;", [("update", False), ("update", True)]),
+        ("update t set a = 1, b = 2, c = 'where' /* where */;", [("update", False)]),
+        ("update t set a = (select 1 from u where u.b = 2);", [("update", True)]),
+        ("\\dt\nselect 1 \\g\n", [(None, False), ("select", False)]),
+    ],
+)
+def test_split_script_verbs(text, verbs):
+    assert [(s.verb, s.has_where) for s in split_script(io.StringIO(text))] == verbs
@@ -0,0 +1,190 @@
+import random
+from unittest.mock import patch
+
+import pytest
+from sqlparse.engine import FilterStack
+
+from pgcli.packages.parseutils import statements
+from pgcli.packages.parseutils.statements import StatementIndex, common_prefix_length, common_suffix_length
+from pgcli.packages.parseutils.utils import is_open_quote
+from pgcli.packages.sqlcompletion import Special, suggest_type
+
+PIECES = (
+    "SELECT 1;",
+    " ",
+    "\n",
+    "-- c;\n",
+    "/* x; */",
+    "/*",
+    "*/",
+    "'a;b'",
+    "'",
+    '"',
+    '"q;"',
+    "E'\\';'",
+    "$$ ; $$",
+    "$$",
+    "$f$ BEGIN; END; $f$",
+    "CREATE FUNCTION f() AS ",
+    "BEGIN",
+    "BEGIN;",
+    "END;",
+    "COMMIT;",
+    "DECLARE",
+    "CASE",
+    "GO",
+    "(",
+    ")",
+    "[",
+    "]",
+    ";",
+    "x",
+    "insert into t values (1);",
+)
+
+
+def split_starts(text):
+    """The statement starts of `text`, as sqlparse.split() splits it."""
+    starts, pos = [0], 0
+    for statement in FilterStack().run(text):
+        pos += len(str(statement))
+        if pos < len(text):
+            starts.append(pos)
+    return starts
+
+
+def random_edits(count, seed):
+    rng = random.Random(seed)
+    text = ""
+    for _ in range(count):
+        op = rng.random()
+        if op < 0.6 or not text:
+            p = rng.randint(0, len(text))
+            text = text[:p] + rng.choice(PIECES) + text[p:]
+        else:
+            p = rng.randint(0, len(text) - 1)
+            text = text[:p] + text[p + rng.randint(1, 8) :]
+        yield text
+
+
+@pytest.mark.parametrize(
+    "a, b, prefix, suffix",
+    [
+        ("", "", 0, 0),
+        ("abc", "abc", 3, 0),
+        ("abc", "abxc", 2, 1),
+        ("SELECT 1; SELECT 2", "SELECT 1; SELECT 22", 18, 0),
+        ("SELECT 1; SELECT 2", "SELECT 1; SELECT 32", 17, 1),
+        ("xyz", "abc", 0, 0),
+    ],
+)
+def test_common_lengths(a, b, prefix, suffix):
+    assert common_prefix_length(a, b) == prefix
+    assert common_suffix_length(a, b, min(len(a), len(b)) - prefix) == suffix
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "",
+        "SELECT 1; SELECT 2;",
+        "SELECT 1;\n\nSELECT 2 -- two\n;SELECT 3",
+        "SELECT ';'; SELECT \";\"",
+        "CREATE FUNCTION f() RETURNS int AS $$ SELECT 1; $$ LANGUAGE sql; SELECT 2",
+        "CREATE FUNCTION f() RETURNS int AS $body$ BEGIN; RETURN 1; END; $body$ LANGUAGE plpgsql; SELECT 2",
+        "SELECT 1 /* ; */; SELECT 'unclosed; SELECT 3",
+    ],
+)
+def test_update(text):
+    assert StatementIndex().update(text) == split_starts(text)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_incremental_update(seed):
+    index = StatementIndex()
+    for text in random_edits(200, seed):
+        assert index.update(text) == split_starts(text), text
+
+
+def test_closing_quote_updates_earlier_statements():
+    index = StatementIndex()
+    text = "SELECT 1; SELECT $$a; SELECT 2; SELECT 3;"
+    assert index.update(text) == split_starts(text)
+    text += "$$;"
+    assert index.update(text) == split_starts(text) == [0, 10]
+
+
+def test_edit_near_end_of_large_buffer_is_split_locally():
+    index = StatementIndex()
+    text = "SELECT * FROM foo WHERE a = 'x;y';\n" * 2000
+    index.update(text)
+    with patch.object(statements, "get_tokens", side_effect=statements.get_tokens) as get_tokens:
+        text = text + "SELECT * FROM "
+        starts = index.update(text)
+    assert starts == split_starts(text)
+    # Only the last statements are split again
+    assert get_tokens.call_args[0][1] >= len(text) - 200
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "",
+        "$$ foo $$",
+        "foo bar $$ baz $$",
+        "$a$ $$ $a$",
+        "$$",
+        "foo $$ bar $$; foo $$",
+        "$$ $a$ ",
+        "foo 'bar baz",
+        "SELECT 1 /* unclosed",
+        "SELECT [unclosed",
+    ],
+)
+def test_is_open_quote(text):
+    assert StatementIndex().is_open_quote(text) == is_open_quote(text)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_incremental_is_open_quote(seed):
+    index = StatementIndex()
+    for text in random_edits(200, seed):
+        assert index.is_open_quote(text) == is_open_quote(text), text
+
+
+def test_typing_in_function_body_is_open_quote():
+    index = StatementIndex()
+    text = "SELECT 1;\n" * 500 + "CREATE FUNCTION f() RETURNS int AS $$\nBEGIN\n"
+    assert index.is_open_quote(text)
+    with patch.object(statements, "get_tokens", side_effect=statements.get_tokens) as get_tokens:
+        assert index.is_open_quote(text + "  RETURN 1;")
+        assert not index.is_open_quote(text + "  RETURN 1;\nEND;\n$$ LANGUAGE plpgsql;")
+    assert all(call[0][1] >= len(text) - 100 for call in get_tokens.call_args_list)
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "SELECT * FROM foo; SELECT * FROM bar b WHERE b.",
+        "SELECT 1;\n\n  ",
+        "INSERT INTO foo VALUES (1); UPDATE bar SET ",
+        "SELECT * FROM foo;\nSELECT * FROM bar; SELECT * FROM baz",
+    ],
+)
+def test_statement_start_same_suggestions(text):
+    index = StatementIndex()
+    for position in range(len(text) + 1):
+        start = index.statement_start(text, position)
+        if start and text[start:position].strip().isalpha():
+            # The first word of a later statement, see below
+            continue
+        assert suggest_type(text[start:], text[start:position]) == suggest_type(text, text[:position]), position
+
+
+def test_statement_start_later_statement_first_word():
+    # Special commands are run as later statements too, and suggested in
+    # their first word, like in the first statement.
+    text = "SELECT * FROM foo; S"
+    start = StatementIndex().statement_start(text, len(text))
+    assert text[start:] == "S"
+    assert Special() in suggest_type(text[start:], text[start:])
@@ -0,0 +1,28 @@
+from benchmarks import bench_column_memory, bench_completion, bench_destructive, bench_prioritization, bench_splitter
+
+
+def test_bench_completion_runs(capsys):
+    bench_completion.main(["--scales", "100", "--repeat", "2"])
+    out = capsys.readouterr().out
+    assert "100 relations" in out
+    assert "get_completions: SELECT * FROM cu" in out
+
+
+def test_bench_column_memory_runs(capsys):
+    bench_column_memory.main(100, 10)
+    assert "bytes/column" in capsys.readouterr().out
+
+
+def test_bench_prioritization_runs(capsys):
+    bench_prioritization.main(50, 1)
+    assert "100 history entries" in capsys.readouterr().out
+
+
+def test_bench_splitter_runs(capsys):
+    bench_splitter.main(50, 1)
+    assert "split_script" in capsys.readouterr().out
+
+
+def test_bench_destructive_runs(capsys):
+    bench_destructive.main(50, 1)
+    assert "is_destructive" in capsys.readouterr().out
@@ -0,0 +1,149 @@
+import os
+import pickle
+import threading
+import time
+from unittest.mock import Mock, patch
+
+import pytest
+
+from pgcli.completion_cache import CompletionCache, CompletionStats, RecordingExecutor, ReplayExecutor, StreamingExecutor, dsn_key
+from pgcli.packages.parseutils.meta import ForeignKey
+
+
+@pytest.fixture
+def executor():
+    return Mock(user="user", host="host", port=5432, dbname="db")
+
+
+def test_dsn_key_depends_on_database(executor):
+    other = Mock(user="user", host="host", port=5432, dbname="other")
+    assert dsn_key(executor) == dsn_key(Mock(user="user", host="host", port=5432, dbname="db"))
+    assert dsn_key(executor) != dsn_key(other)
+
+
+def test_recording_executor(executor):
+    executor.tables.return_value = iter([("public", "users")])
+    recorder = RecordingExecutor(executor)
+
+    assert recorder.tables() == [("public", "users")]
+    assert recorder.results == {"tables": [("public", "users")]}
+
+    # Other methods are passed through untouched.
+    recorder.search_path()
+    assert "search_path" not in recorder.results
+    executor.search_path.assert_called_once_with()
+
+
+def test_replay_executor(executor):
+    replay = ReplayExecutor({"tables": [("public", "users")]}, executor)
+
+    assert list(replay.tables()) == [("public", "users")]
+    assert not executor.tables.called
+    replay.views()
+    executor.views.assert_called_once_with()
+
+
+def test_cache_round_trip(executor, tmpdir):
+    results = {
+        "tables": [("public", "users")],
+        "foreignkeys": [ForeignKey("public", "users", "id", "public", "orders", "user_id")],
+    }
+    cache = CompletionCache(str(tmpdir), executor)
+    assert cache.load() is None
+
+    cache.save("fingerprint", results)
+    assert CompletionCache(str(tmpdir), executor).load() == ("fingerprint", results)
+
+
+def test_cache_ignores_other_versions(executor, tmpdir):
+    cache = CompletionCache(str(tmpdir), executor)
+    with open(cache.path, "wb") as f:
+        pickle.dump({"version": "0.0", "fingerprint": "fingerprint", "results": {}}, f)
+    assert cache.load() is None
+
+
+def test_cache_ignores_corrupt_files(executor, tmpdir):
+    cache = CompletionCache(str(tmpdir), executor)
+    with open(cache.path, "wb") as f:
+        f.write(b"not a pickle")
+    assert cache.load() is None
+
+
+def test_cache_save_creates_directory(executor, tmpdir):
+    cache = CompletionCache(os.path.join(str(tmpdir), "cache"), executor)
+    cache.save("fingerprint", {})
+    assert os.listdir(os.path.join(str(tmpdir), "cache")) == [os.path.basename(cache.path)]
+
+
+def test_streaming_executor(executor):
+    read = []
+
+    def stream():
+        for name in ("schemata", "tables", "databases"):
+            read.append(name)
+            yield name, [name]
+
+    streaming = StreamingExecutor(stream(), executor)
+    assert streaming.tables() == ["tables"]
+    assert read == ["schemata", "tables"]
+    assert streaming.schemata() == ["schemata"]
+    assert read == ["schemata", "tables"]
+
+    streaming.close()
+    assert streaming.results == {"schemata": ["schemata"], "tables": ["tables"], "databases": ["databases"]}
+    streaming.search_path()
+    executor.search_path.assert_called_once_with()
+
+
+def test_stats_round_trip(executor, tmpdir):
+    stats = CompletionStats(str(tmpdir), executor, half_life=0)
+    assert stats.load() is None
+
+    stats.save({"SELECT": 2}, {"users": 1})
+    assert CompletionStats(str(tmpdir), executor, half_life=0).load() == ({"SELECT": 2}, {"users": 1})
+
+
+def test_stats_save_adds_counts(executor, tmpdir):
+    # e.g. from two pgcli sessions
+    CompletionStats(str(tmpdir), executor, half_life=0).save({"SELECT": 2}, {"users": 1})
+    CompletionStats(str(tmpdir), executor, half_life=0).save({"SELECT": 1, "FROM": 1}, {"orders": 3})
+    assert CompletionStats(str(tmpdir), executor, half_life=0).load() == ({"SELECT": 3, "FROM": 1}, {"users": 1, "orders": 3})
+
+
+def test_stats_concurrent_saves_add_up(executor, tmpdir):
+    stats = CompletionStats(str(tmpdir), executor, half_life=0)
+    load = stats.load
+
+    def slow_load():
+        counts = load()
+        # Let the other sessions read the file meanwhile.
+        time.sleep(0.01)
+        return counts
+
+    with patch.object(stats, "load", side_effect=slow_load):
+        sessions = [threading.Thread(target=stats.save, args=({"SELECT": 1}, {})) for _ in range(10)]
+        for session in sessions:
+            session.start()
+        for session in sessions:
+            session.join()
+    assert stats.load() == ({"SELECT": 10}, {})
+
+
+def test_stats_decay(executor, tmpdir):
+    stats = CompletionStats(str(tmpdir), executor, half_life=10)
+    with patch("time.time", return_value=1000000):
+        stats.save({"SELECT": 8}, {"users": 0.02})
+    with patch("time.time", return_value=1000000 + 20 * 24 * 3600):
+        assert stats.load() == ({"SELECT": 2}, {"users": 0.005})
+        stats.save({"SELECT": 1}, {})
+        # Counts that decayed to almost nothing are dropped
+        assert stats.load() == ({"SELECT": 3}, {})
+
+
+def test_stats_ignore_corrupt_files(executor, tmpdir):
+    stats = CompletionStats(str(tmpdir), executor, half_life=0)
+    with open(stats.path, "w") as f:
+        f.write("not json")
+    assert stats.load() is None
+    stats.save({"SELECT": 1}, {})
+    assert stats.load() == ({"SELECT": 1}, {})
@@ -0,0 +1,71 @@
+from prompt_toolkit.document import Document
+
+from pgcli.packages.completion_index import NameIndex, fold, lexical_priority
+from pgcli.pgcompleter import PGCompleter
+
+
+def test_fold():
+    assert fold('"Users"') == "users"
+    assert fold("Users") == "users"
+    assert fold('"') == ""
+
+
+def test_lexical_priority():
+    assert lexical_priority("aa") > lexical_priority("ab")
+    assert lexical_priority("user") > lexical_priority("users")
+    assert lexical_priority('"user"')[:5] == lexical_priority("user")[:5]
+
+
+def test_name_index_candidates():
+    index = NameIndex()
+    for name in ("users", "orders", '"Entries"', "users"):
+        index.add(name)
+    assert len(index) == 3
+    assert index.candidates("") == {"users", "orders", '"Entries"'}
+    assert index.candidates("rs") == {"users", "orders", '"Entries"'}
+    assert index.candidates("ORD") == {"orders"}
+    assert index.candidates("En") == {'"Entries"'}
+    assert index.candidates("xyz") == set()
+
+
+def test_name_index_copy():
+    index = NameIndex()
+    index.add("users")
+    copy = index.copy()
+    copy.add("orders")
+    assert "orders" in copy
+    assert "orders" not in index
+    assert index.candidates("o") == set()
+
+
+def completions(completer, text):
+    document = Document(text=text, cursor_position=len(text))
+    return [c.text for c in completer.get_completions(document, None)]
+
+
+def test_prefilter_does_not_change_completions():
+    completer = PGCompleter(smart_completion=True)
+    completer.extend_schemata(["public", "other"])
+    completer.set_search_path(["public"])
+    tables = ["users", "user_emails", "orders", "Entries", "EndUsers", "select", "order_items"]
+    completer.extend_relations([("public", t) for t in tables] + [("other", "users")], kind="tables")
+    completer.extend_relations([("public", "user_view")], kind="views")
+    completer.extend_datatypes([("public", "user_type")])
+    completer.extend_functions([])
+
+    unfiltered = PGCompleter(smart_completion=True)
+    unfiltered.copy_metadata(completer)
+    unfiltered.search_path = completer.search_path
+    unfiltered._candidate_names = lambda word_before_cursor: None
+
+    texts = (
+        "SELECT * FROM u",
+        "SELECT * FROM us",
+        "SELECT * FROM EU",
+        "SELECT * FROM other.u",
+        "SELECT * FROM oi",
+        "CREATE TABLE t (x uty",
+    )
+    for text in texts:
+        assert completions(completer, text) == completions(unfiltered, text)
+    assert "user_emails" in completions(completer, "SELECT * FROM ue")
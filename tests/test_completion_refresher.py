@@ -2,6 +2,11 @@ import time
 import pytest
 from unittest.mock import Mock, patch
 
+from utils import dbtest, run
+from pgcli.completion_cache import CATALOG_METHODS
+from pgcli.pgexecute import CatalogQuery
+from pgcli.packages.parseutils.tables import TableReference
+
 
 @pytest.fixture
 def refresher():
@@ -46,7 +51,7 @@ def test_refresh_called_once(refresher):
         assert len(actual) == 1
         assert len(actual[0]) == 4
         assert actual[0][3] == "Auto-completion refresh started in the background."
-        bg_refresh.assert_called_with(pgexecute, special, callbacks, None, None)
+        bg_refresh.assert_called_with(pgexecute, special, callbacks, None, None, False)
 
 
 def test_refresh_called_twice(refresher):
@@ -93,3 +98,304 @@ def test_refresh_with_callbacks(refresher):
     refresher.refresh(pgexecute, special, callbacks)
     time.sleep(1)  # Wait for the thread to work.
     assert callbacks[0].call_count == 1
+
+
+def test_refresh_from_completion_cache(refresher, tmpdir):
+    """
+    A fresh cache must be used without running the catalog queries again
+    :param refresher:
+    """
+    pgexecute = Mock(user="user", host="host", port=5432, dbname="db")
+    pgexecute.copy.return_value = pgexecute
+    pgexecute.catalog_fingerprint.return_value = "fingerprint"
+    pgexecute.databases.return_value = ["db"]
+    special = Mock()
+    settings = {"completion_cache_dir": str(tmpdir)}
+
+    refresher.refreshers = {"databases": lambda completer, executor: completer.extend_database_names(executor.databases())}
+
+    callbacks = [Mock()]
+    refresher._bg_refresh(pgexecute, special, callbacks, settings=settings, use_cache=True)
+    assert callbacks[0].call_count == 1
+    assert pgexecute.databases.call_count == 1
+
+    callbacks = [Mock()]
+    refresher._bg_refresh(pgexecute, special, callbacks, settings=settings, use_cache=True)
+    assert callbacks[0].call_count == 1
+    assert pgexecute.databases.call_count == 1
+    assert callbacks[0].call_args[0][0].databases == ["db"]
+
+
+def test_refresh_from_stale_completion_cache(refresher, tmpdir):
+    """
+    A stale cache must be used at first, then replaced by a full refresh
+    :param refresher:
+    """
+    pgexecute = Mock(user="user", host="host", port=5432, dbname="db")
+    pgexecute.copy.return_value = pgexecute
+    pgexecute.catalog_fingerprint.return_value = "old"
+    pgexecute.databases.return_value = ["old_db"]
+    special = Mock()
+    settings = {"completion_cache_dir": str(tmpdir)}
+
+    refresher.refreshers = {"databases": lambda completer, executor: completer.extend_database_names(executor.databases())}
+    refresher._bg_refresh(pgexecute, special, [Mock()], settings=settings, use_cache=True)
+
+    pgexecute.catalog_fingerprint.return_value = "new"
+    pgexecute.databases.return_value = ["new_db"]
+    callbacks = [Mock()]
+    refresher._bg_refresh(pgexecute, special, callbacks, settings=settings, use_cache=True)
+    assert callbacks[0].call_count == 2
+    assert callbacks[0].call_args_list[0][0][0].databases == ["old_db"]
+    assert callbacks[0].call_args_list[1][0][0].databases == ["new_db"]
+
+
+def test_refresh_without_completion_cache_updates_it(refresher, tmpdir):
+    """
+    A refresh that doesn't use the cache must run the catalog queries even if
+    the fingerprint didn't change, and save their results
+    :param refresher:
+    """
+    pgexecute = Mock(user="user", host="host", port=5432, dbname="db")
+    pgexecute.copy.return_value = pgexecute
+    pgexecute.catalog_fingerprint.return_value = "fingerprint"
+    pgexecute.databases.return_value = ["old_db"]
+    special = Mock()
+    settings = {"completion_cache_dir": str(tmpdir)}
+
+    refresher.refreshers = {"databases": lambda completer, executor: completer.extend_database_names(executor.databases())}
+    refresher._bg_refresh(pgexecute, special, [Mock()], settings=settings, use_cache=True)
+
+    pgexecute.databases.return_value = ["new_db"]
+    callbacks = [Mock()]
+    refresher._bg_refresh(pgexecute, special, callbacks, settings=settings)
+    assert callbacks[0].call_count == 1
+    assert callbacks[0].call_args[0][0].databases == ["new_db"]
+
+    callbacks = [Mock()]
+    refresher._bg_refresh(pgexecute, special, callbacks, settings=settings, use_cache=True)
+    assert callbacks[0].call_count == 1
+    assert callbacks[0].call_args[0][0].databases == ["new_db"]
+
+
+@dbtest
+def test_refresh_after_change_with_completion_cache(refresher, executor, tmpdir):
+    settings = {"completion_cache_dir": str(tmpdir), "single_connection": True}
+    completers = []
+    refresher._bg_refresh(executor, Mock(), completers.append, settings=settings, use_cache=True)
+    run(executor, "create table rv_a(x int)")
+    refresher._bg_refresh(executor, Mock(), completers.append, settings=settings)
+    # Right after the change, the statistics counters of the catalog may not
+    # show it yet.
+    run(executor, "create table rv_b(x int)")
+    refresher._bg_refresh(executor, Mock(), completers.append, settings=settings)
+    assert {"rv_a", "rv_b"} <= completers[-1].dbmetadata["tables"]["public"].keys()
+
+    completers = []
+    refresher._bg_refresh(executor, Mock(), completers.append, settings=settings, use_cache=True)
+    assert {"rv_a", "rv_b"} <= completers[0].dbmetadata["tables"]["public"].keys()
+
+
+def test_refresh_loads_completion_stats(refresher, tmpdir):
+    """
+    Saved completion stats must be used instead of the history
+    :param refresher:
+    """
+    from pgcli.completion_cache import CompletionStats
+
+    pgexecute = Mock(user="user", host="host", port=5432, dbname="db")
+    pgexecute.copy.return_value = pgexecute
+    history = Mock(**{"get_strings.return_value": ["SELECT * FROM foo"]})
+    settings = {"completion_stats_dir": str(tmpdir), "completion_stats_half_life": 0}
+    refresher.refreshers = {}
+
+    callbacks = [Mock()]
+    refresher._bg_refresh(pgexecute, Mock(), callbacks, history, settings)
+    prioritizer = callbacks[0].call_args[0][0].prioritizer
+    assert prioritizer.keyword_count("SELECT") == 1
+    # Keywords from the history are saved the first time
+    stats = CompletionStats(str(tmpdir), pgexecute, half_life=0)
+    stats.save(*prioritizer.take_updates())
+
+    stats.save({"SELECT": 4}, {"foo": 2})
+    callbacks = [Mock()]
+    refresher._bg_refresh(pgexecute, Mock(), callbacks, history, settings)
+    prioritizer = callbacks[0].call_args[0][0].prioritizer
+    assert (prioritizer.keyword_count("SELECT"), prioritizer.name_count("foo")) == (5, 2)
+    assert history.get_strings.call_count == 1
+
+
+def _metadata(completer):
+    """Returns the completer's metadata with foreign keys in a stable order"""
+    return {
+        kind: {
+            schema: {
+                name: {col: meta._replace(foreignkeys=sorted(meta.foreignkeys)) for col, meta in obj.items()}
+                if kind != "functions"
+                else sorted(obj, key=repr)
+                for name, obj in objects.items()
+            }
+            if kind != "datatypes"
+            else objects
+            for schema, objects in metadata.items()
+        }
+        for kind, metadata in completer.dbmetadata.items()
+    }
+
+
+@dbtest
+def test_incremental_refresh_matches_full_refresh(refresher, executor):
+    settings = {"incremental_completion_refresh": True, "single_connection": True}
+    run(
+        executor,
+        """
+        create table users(id serial primary key, name text);
+        create table orders(id serial primary key, user_id int references users(id), total numeric);
+        create table items(id int, label text);
+        create view big_orders as select * from orders where total > 100;
+        create function f(x int) returns int language sql as 'select x';
+        """,
+    )
+    completers = []
+    refresher._bg_refresh(executor, Mock(), completers.append, settings=settings)
+    completer = completers[-1]
+    assert completer.catalog_snapshot is not None
+
+    run(
+        executor,
+        """
+        alter table users rename column name to full_name;
+        alter table items add column price numeric default 0;
+        drop view big_orders;
+        create view user_orders as select u.full_name, o.total from users u join orders o on o.user_id = u.id;
+        create table payments(id int, order_id int references orders(id));
+        create function f(x text) returns text language sql as 'select x';
+        create type mood as enum ('happy', 'sad');
+        """,
+    )
+    with patch.object(refresher, "_bg_refresh", side_effect=AssertionError("full refresh")):
+        refresher._bg_refresh_incremental(executor, completer, completers.append, settings=settings)
+    incremental = completers[-1]
+    refresher._bg_refresh(executor, Mock(), completers.append, settings=settings)
+    full = completers[-1]
+
+    assert incremental is not completer
+    assert _metadata(incremental) == _metadata(full)
+    assert incremental.all_completions == full.all_completions
+    assert "big_orders" not in incremental.all_completions
+    # The original completer is left untouched.
+    assert "full_name" not in completer.dbmetadata["tables"]["public"]["users"]
+    assert "payments" not in completer.dbmetadata["tables"]["public"]
+
+
+@dbtest
+@pytest.mark.parametrize("settings", [{"pipeline_completion_refresh": True}, {"completion_refresh_workers": 2}])
+def test_refresh_strategies_match(refresher, executor, settings):
+    run(executor, "create table parent(id int primary key); create table child(parent_id int references parent(id))")
+    completers = []
+    refresher._bg_refresh(executor, Mock(), completers.append, settings=settings)
+    refresher._bg_refresh(executor, Mock(), completers.append)
+
+    assert completers[0].dbmetadata == completers[1].dbmetadata
+    assert completers[0].databases == completers[1].databases
+    assert completers[0].search_path == completers[1].search_path
+
+
+@dbtest
+def test_lazy_column_loading(refresher, executor):
+    run(executor, "create table parent(id int primary key); create table child(parent_id int references parent(id))")
+    completers = []
+    refresher._bg_refresh(executor, Mock(), completers.append, settings={"lazy_column_loading": True})
+    refresher._bg_refresh(executor, Mock(), completers.append)
+    lazy, eager = completers
+
+    assert lazy.dbmetadata["tables"]["public"] == {"parent": {}, "child": {}}
+    tables = [TableReference("public", name, None, False) for name in ("parent", "child")]
+    assert lazy.populate_scoped_cols(tables) == eager.populate_scoped_cols(tables)
+    lazy.column_loader.close()
+
+
+@dbtest
+def test_column_loader_does_not_wait(executor):
+    from pgcli.completion_refresher import ColumnLoader
+
+    run(executor, "create table parent(id int primary key)")
+    loader = ColumnLoader(executor)
+    try:
+        with loader._lock:
+            # Another load is running.
+            assert loader("public", "parent") is None
+        assert [row[2] for row in loader("public", "parent")] == ["id"]
+
+        slow_query = CatalogQuery("Columns", "SELECT pg_catalog.pg_sleep(1)", None, None)
+        with patch.object(loader._loader, "_columns_query", return_value=slow_query):
+            loader.timeout = 10
+            assert loader("public", "parent") is None
+        del loader.timeout
+        assert [row[2] for row in loader("public", "parent")] == ["id"]
+    finally:
+        loader.close()
+
+
+@dbtest
+def test_column_loader_single_connection_skips_open_transaction(executor):
+    from pgcli.completion_refresher import ColumnLoader
+
+    run(executor, "create table parent(id int primary key)")
+    loader = ColumnLoader(executor, single_connection=True)
+    run(executor, "begin")
+    try:
+        assert loader("public", "parent") is None
+    finally:
+        run(executor, "rollback")
+    assert [row[2] for row in loader("public", "parent")] == ["id"]
+
+
+def test_incremental_refresh_without_snapshot(refresher):
+    """
+    A completer that was populated without a catalog snapshot must be
+    refreshed in full
+    """
+    pgexecute = Mock()
+    completer = Mock(catalog_snapshot=None)
+    callbacks = Mock()
+
+    with patch.object(refresher, "_bg_refresh") as bg_refresh:
+        refresher._bg_refresh_incremental(pgexecute, completer, callbacks)
+        bg_refresh.assert_called_once_with(pgexecute, completer.pgspecial, [callbacks], settings={})
+    assert not callbacks.called
+
+
+def test_refresh_with_workers(refresher):
+    """
+    Catalog queries must be spread over several connections, which are
+    closed afterwards
+    """
+    pgexecute = Mock(**{"is_virtual_database.return_value": False})
+    copies = []
+
+    def slow_query(*args):
+        time.sleep(0.1)
+        return []
+
+    def copy():
+        executor = Mock()
+        for name in CATALOG_METHODS:
+            getattr(executor, name).side_effect = slow_query
+        executor.databases.side_effect = lambda: ["db"]
+        executor.copy.side_effect = copy
+        copies.append(executor)
+        return executor
+
+    pgexecute.copy.side_effect = copy
+    callbacks = [Mock()]
+    settings = {"completion_refresh_workers": 3}
+
+    refresher.refreshers = {"databases": lambda completer, executor: completer.extend_database_names(executor.databases())}
+    refresher._bg_refresh(pgexecute, Mock(), callbacks, settings=settings)
+
+    assert callbacks[0].call_args[0][0].databases == ["db"]
+    # The refresh connection plus at most two more.
+    assert 1 < len(copies) <= 3
+    for executor in copies:
+        executor.conn.close.assert_called_once_with()
@@ -2,10 +2,20 @@ import os
 import platform
 import re
 import tempfile
+import time
 import datetime
+import io
+import signal
+import sys
+import threading
 from unittest import mock
 
+import psycopg
 import pytest
+from click.testing import CliRunner
+from prompt_toolkit.application import create_app_session
+from prompt_toolkit.input import create_pipe_input
+from prompt_toolkit.output import DummyOutput
 
 try:
     import setproctitle
@@ -13,6 +23,7 @@ except ImportError:
     setproctitle = None
 
 from pgcli.main import (
+    cli,
     obfuscate_process_password,
     duration_in_words,
     format_output,
@@ -20,8 +31,10 @@ from pgcli.main import (
     PGCli,
     OutputSettings,
     COLOR_CODE_REGEX,
+    ScriptPosition,
 )
 from pgcli.pgexecute import PGExecute
+from pgcli.pgtoolbar import create_toolbar_tokens_func
 from pgspecial.main import PAGER_OFF, PAGER_LONG_OUTPUT, PAGER_ALWAYS
 from utils import dbtest, run
 from collections import namedtuple
@@ -335,6 +348,294 @@ def test_i_works(tmpdir, executor):
     run(executor, statement, pgspecial=cli.pgspecial)
 
 
+@dbtest
+def test_i_resume(tmpdir, executor):
+    sqlfile = tmpdir.join("test.sql")
+    sqlfile.write(
+        "".join([
+            "CREATE TEMP TABLE i_resume (a int);\n",
+            "INSERT INTO i_resume VALUES (1); INSERT INTO i_resume VALUES ('x');\n",
+            "INSERT INTO i_resume VALUES (3);\n",
+        ])
+    )
+    cli = PGCli(pgexecute=executor, pgclirc_file=str(tmpdir.join("rcfile")))
+    with pytest.raises(psycopg.errors.InvalidTextRepresentation):
+        run(executor, r"\i {0}".format(sqlfile), pgspecial=cli.pgspecial)
+    assert cli.failed_script == ScriptPosition(str(sqlfile), 36, 32, 3)
+
+    sqlfile.write(sqlfile.read().replace("'x'", "2"))
+    result = run(executor, r"\i --resume", pgspecial=cli.pgspecial)
+    assert result == ["INSERT 0 1", "INSERT 0 1"]
+    assert cli.failed_script is None
+    assert run(executor, "SELECT array_agg(a ORDER BY a) FROM i_resume", join=True).count("{1,2,3}") == 1
+
+
+@dbtest
+def test_i_resume_without_failed_script(tmpdir, executor):
+    cli = PGCli(pgexecute=executor, pgclirc_file=str(tmpdir.join("rcfile")))
+    assert run(executor, r"\i --resume", pgspecial=cli.pgspecial) == [r"\i: no script to resume"]
+
+
+@pytest.fixture
+def batch_cli(tmpdir, executor):
+    cli = PGCli(pgexecute=executor, pgclirc_file=str(tmpdir.join("rcfile")))
+    cli.table_format = "tsv"
+    return cli
+
+
+@dbtest
+def test_run_batch_commands(batch_cli, capsys):
+    assert batch_cli.run_batch(["SELECT 1 AS a", "SELECT 2 AS b; SELECT 3 AS c"]) == 0
+    assert capsys.readouterr().out.split() == ["a", "1", "SELECT", "1", "b", "2", "SELECT", "1", "c", "3", "SELECT", "1"]
+
+
+@dbtest
+def test_run_batch_stops_on_error(batch_cli, capsys):
+    assert batch_cli.run_batch(["SELECT 1 AS a", "SELECT 1/0", "SELECT 3 AS c"]) == 1
+    out, err = capsys.readouterr()
+    assert out.split() == ["a", "1", "SELECT", "1"]
+    assert "division by zero" in err
+
+
+@dbtest
+def test_run_batch_resumes_on_error(batch_cli, capsys):
+    batch_cli.on_error = "RESUME"
+    assert batch_cli.run_batch(["SELECT 1/0", "SELECT 3 AS c"]) == 1
+    out, err = capsys.readouterr()
+    assert out.split() == ["c", "3", "SELECT", "1"]
+    assert "division by zero" in err
+
+
+@dbtest
+def test_run_batch_files(batch_cli, tmpdir, monkeypatch, capsys):
+    sqlfile = tmpdir.join("test.sql")
+    sqlfile.write("SELECT 1 AS a;\n")
+    monkeypatch.setattr(sys, "stdin", io.StringIO("SELECT 2 AS b;\n"))
+    assert batch_cli.run_batch(files=[str(sqlfile), "-"]) == 0
+    assert capsys.readouterr().out.split() == ["a", "1", "SELECT", "1", "b", "2", "SELECT", "1"]
+
+
+@dbtest
+def test_run_batch_missing_file(batch_cli, tmpdir, capsys):
+    assert batch_cli.run_batch(files=[str(tmpdir.join("missing.sql"))]) == 1
+    assert "No such file or directory" in capsys.readouterr().err
+
+
+@dbtest
+@pytest.mark.parametrize("confirmed, status", [(False, 1), (True, 0), (None, 0)])
+def test_run_batch_destructive(batch_cli, tmpdir, capsys, confirmed, status):
+    batch_cli.destructive_warning = ["drop"]
+    batch_cli.destructive_statements_require_transaction = False
+    sqlfile = tmpdir.join("drop.sql")
+    sqlfile.write("CREATE TABLE t2 (a int);\nDROP TABLE t2;\n")
+    with mock.patch("pgcli.main.confirm_destructive", return_value=confirmed) as confirm_destructive:
+        exit_status = batch_cli.run_batch(["CREATE TABLE t1 (a int)", "\\x; DROP TABLE t1"], [str(sqlfile)])
+    assert exit_status == status
+    assert confirm_destructive.call_count == (1 if confirmed is False else 2)
+    if confirmed is False:
+        assert "Command execution stopped" in capsys.readouterr().err
+        assert run(batch_cli.pgexecute, "select count(*) from t1") is not None
+    else:
+        with pytest.raises(psycopg.errors.UndefinedTable):
+            run(batch_cli.pgexecute, "select * from t2")
+
+
+@dbtest
+def test_run_batch_streamed(batch_cli, capsys):
+    batch_cli.fetch_count = 2
+    assert batch_cli.run_batch(["SELECT generate_series(1, 5) AS n"]) == 0
+    # Only the first batch has the header
+    assert capsys.readouterr().out.split() == ["n", "1", "2", "3", "4", "5", "SELECT", "5"]
+
+
+@dbtest
+def test_run_batch_streamed_error(batch_cli, capsys):
+    batch_cli.fetch_count = 1
+    assert batch_cli.run_batch(["SELECT 1 / (2 - n) AS a FROM generate_series(1, 3) n", "SELECT 3 AS c"]) == 1
+    out, err = capsys.readouterr()
+    assert out.split() == ["a", "1"]
+    assert "division by zero" in err
+    assert not batch_cli.pgexecute.valid_transaction()
+
+
+@dbtest
+def test_cancel_query(executor, tmpdir, capsys):
+    cli = PGCli(pgexecute=executor, pgclirc_file=str(tmpdir.join("rcfile")))
+    cli.destructive_warning_restarts_connection = True
+    backend_pid = executor.conn.info.backend_pid
+    threading.Timer(0.2, os.kill, (os.getpid(), signal.SIGINT)).start()
+    with mock.patch.object(cli.pgexecute, "connect") as connect:
+        query = cli.execute_command("select pg_sleep(10); select 'second'")
+    connect.assert_not_called()
+    assert not query.successful
+    out = capsys.readouterr().out
+    assert "canceling statement due to user request" in out
+    assert re.search(r"Query cancelled after \d+\.\d{3}s", out)
+    assert "second" not in out
+    assert executor.conn.info.backend_pid == backend_pid
+
+
+@pytest.mark.parametrize(
+    "text, fetch_count, expected",
+    [
+        ("select 1", 0, True),
+        ("select '\\dt'; select 1 \\G", 0, True),
+        ("select 1; \\dt", 0, False),
+        ("select 1", 1000, True),
+    ],
+)
+def test_show_query_progress(text, fetch_count, expected):
+    cli = PGCli()
+    cli.prompt_app = mock.Mock()
+    cli.fetch_count = fetch_count
+    assert cli._show_query_progress(text) == expected
+    cli.prompt_app = None
+    assert not cli._show_query_progress(text)
+
+
+@pytest.fixture
+def progress_cli(executor, tmpdir):
+    cli = PGCli(pgexecute=executor, pgclirc_file=str(tmpdir.join("rcfile")))
+    cli.prompt_app = mock.Mock(style=None, output=DummyOutput())
+    with create_pipe_input() as pipe_input:
+        with create_app_session(input=pipe_input, output=DummyOutput()):
+            cli.pipe_input = pipe_input
+            yield cli
+
+
+@dbtest
+@pytest.mark.parametrize("fetch_count", [0, 2])
+def test_evaluate_command_with_progress(progress_cli, fetch_count, capsys):
+    progress_cli.fetch_count = fetch_count
+    tokens = []
+    threading.Timer(0.3, lambda: tokens.extend(create_toolbar_tokens_func(progress_cli)())).start()
+    output, query = progress_cli._evaluate_command_with_progress("select 1 as a; select pg_sleep(0.6), generate_series(1, 3) as n")
+    assert query.successful
+    # Streamed rows are written rather than returned
+    assert "| 3 " in "\n".join(output) + capsys.readouterr().out
+    assert re.match(r" Running: 0\.\d+s", tokens[0][1])
+    # Only counting the rows of the running statement
+    assert tokens[1][1] == "  Rows: 0"
+    assert tokens[-1][1] == "  [Ctrl-C] Cancel"
+    assert progress_cli.query_started is None
+
+
+def test_query_progress_tokens():
+    cli = mock.Mock(query_started=time.time() - 2)
+    cli.pgexecute.rows_received.return_value = 12345
+    tokens = create_toolbar_tokens_func(cli)()
+    assert [text for _, text in tokens] == [" Running: 2.0s", "  Rows: 12,345", "  [Ctrl-C] Cancel"]
+    cli.pgexecute.rows_received.return_value = None
+    assert [text for _, text in create_toolbar_tokens_func(cli)()] == [" Running: 2.0s", "  [Ctrl-C] Cancel"]
+
+
+@dbtest
+def test_cancel_query_with_progress(progress_cli):
+    threading.Timer(0.2, progress_cli.pipe_input.send_text, ("\x03",)).start()
+    output, query = progress_cli._evaluate_command_with_progress("select pg_sleep(10); select 'second'")
+    assert not query.successful
+    assert "canceling statement due to user request" in output[0]
+    assert output[-1].startswith("Query cancelled after")
+
+
+@dbtest
+def test_format_output_streamed_vertical(executor):
+    rows = list(executor.run("SELECT generate_series(1, 3) AS n", fetch_count=2))[0][1]
+    settings = OutputSettings(table_format="psql", expanded=True)
+    results = format_output(None, rows, ["n"], "SELECT", settings)
+    assert list(results) == [
+        "-[ RECORD 1 ]-------------------------\nn | 1",
+        "-[ RECORD 2 ]-------------------------\nn | 2",
+        "-[ RECORD 3 ]-------------------------\nn | 3",
+        "SELECT 3",
+    ]
+
+
+@dbtest
+def test_streamed_output_file(executor, tmpdir):
+    cli = PGCli(pgexecute=executor, pgclirc_file=str(tmpdir.join("rcfile")))
+    cli.table_format = "tsv"
+    cli.fetch_count = 2
+    cli.output_file = str(tmpdir.join("output"))
+    query = cli.execute_command("SELECT generate_series(1, 3) AS n; SELECT 'last' AS s")
+    assert query.successful and query.streamed
+    assert tmpdir.join("output").read().split("\n") == [
+        "SELECT generate_series(1, 3) AS n; SELECT 'last' AS s",
+        "n",
+        "1",
+        "2",
+        "3",
+        "SELECT 3",
+        "",
+        "SELECT generate_series(1, 3) AS n; SELECT 'last' AS s",
+        "s",
+        "last",
+        "SELECT 1",
+        "",
+        "",
+    ]
+
+
+@dbtest
+def test_row_limit_fetches_limited_rows(executor, tmpdir):
+    cli = PGCli(pgexecute=executor, row_limit=3, pgclirc_file=str(tmpdir.join("rcfile")))
+    cli.table_format = "tsv"
+    with mock.patch("pgcli.main.click.secho") as mock_secho:
+        output, query = cli._evaluate_command("SELECT generate_series(1, 10000000) AS n")
+    assert output == ["n", "1", "2", "3", "SELECT 3"]
+    assert not query.streamed
+    assert mock_secho.call_args[0][0] == "The result was limited to 3 rows, more rows are available"
+
+
+@pytest.mark.parametrize(
+    "commands, expected",
+    [
+        (["on"], 1000),
+        (["on", ""], 0),
+        (["", "off"], 0),
+        (["50", "off", "on"], 50),
+        (["0"], 0),
+    ],
+)
+def test_toggle_stream(tmpdir, commands, expected):
+    cli = PGCli(pgclirc_file=str(tmpdir.join("rcfile")))
+    for command in commands:
+        cli.toggle_stream(command)
+    assert cli.fetch_count == expected
+
+
+def test_toggle_stream_usage(tmpdir):
+    cli = PGCli(pgclirc_file=str(tmpdir.join("rcfile")))
+    assert cli.toggle_stream("bogus") == [(None, None, None, "Usage: \\stream [on|off|rows]")]
+    assert cli.fetch_count == 0
+
+
+@pytest.mark.parametrize(
+    "args, stdin, expected",
+    [
+        (["-c", "SELECT 1", "-c", "SELECT 2"], None, (("SELECT 1", "SELECT 2"), ())),
+        (["-f", "a.sql", "--file", "-"], None, ((), ("a.sql", "-"))),
+    ],
+)
+def test_cli_batch_mode(monkeypatch, tmp_path, args, stdin, expected):
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path))
+    monkeypatch.setattr(PGCli, "connect", lambda self, *args, **kwargs: setattr(self, "pgexecute", mock.MagicMock()))
+    with mock.patch.object(PGCli, "run_batch", return_value=1) as run_batch, mock.patch.object(PGCli, "run_cli") as run_cli:
+        result = CliRunner().invoke(cli, args + ["db"], input=stdin)
+    assert result.exit_code == 1
+    run_batch.assert_called_once_with(*expected)
+    run_cli.assert_not_called()
+
+
+def test_cli_piped_stdin_not_batch_mode(monkeypatch, tmp_path):
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path))
+    monkeypatch.setattr(PGCli, "connect", lambda self, *args, **kwargs: setattr(self, "pgexecute", mock.MagicMock()))
+    with mock.patch.object(PGCli, "run_batch") as run_batch, mock.patch.object(PGCli, "run_cli") as run_cli:
+        CliRunner().invoke(cli, ["db"], input="SELECT 1;")
+    run_batch.assert_not_called()
+    run_cli.assert_called_once()
+
+
 @dbtest
 def test_toggle_verbose_errors(executor):
     cli = PGCli(pgexecute=executor)
@@ -636,3 +937,21 @@ def test_notifications(executor):
     with mock.patch("pgcli.main.click.secho") as mock_secho:
         run(executor, "notify chan1, 'testing2'")
         mock_secho.assert_not_called()
+
+
+def test_save_completion_stats(tmpdir):
+    from pgcli.completion_cache import CompletionStats
+
+    cli = PGCli()
+    cli.pgexecute = mock.Mock(user="user", host="host", port=5432, dbname="db")
+    cli.completer.extend_query_history("SELECT * FROM foo")
+    cli.save_completion_stats()
+    assert not tmpdir.listdir()
+
+    cli.settings["completion_stats_dir"] = str(tmpdir)
+    cli.settings["completion_stats_half_life"] = 0
+    cli.save_completion_stats()
+    cli.completer.extend_query_history("SELECT 1")
+    cli.save_completion_stats()
+    keywords, names = CompletionStats(str(tmpdir), cli.pgexecute, half_life=0).load()
+    assert (keywords["SELECT"], names) == (2, {"foo": 1})
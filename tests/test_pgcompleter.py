@@ -1,6 +1,10 @@
 import json
 import pytest
+from unittest.mock import Mock
+from prompt_toolkit.document import Document
 from pgcli import pgcompleter
+from pgcli.packages.parseutils.meta import ForeignKey
+from pgcli.packages.parseutils.tables import TableReference
 import tempfile
 
 
@@ -92,3 +96,180 @@ def test_generate_alias_prefers_alias_over_upper_case_name(table_name, alias_map
 )
 def test_generate_alias_prefers_upper_case_name_over_underscore_name(table_name, alias):
     assert pgcompleter.generate_alias(table_name) == alias
+
+
+@pytest.fixture
+def lazy_completer():
+    completer = pgcompleter.PGCompleter(settings={"lazy_column_loading": True, "lazy_column_cache_size": 2})
+    completer.extend_schemata(["public"])
+    completer.set_search_path(["public"])
+    completer.extend_relations([("public", "users"), ("public", "orders"), ("public", "items")], kind="tables")
+    completer.extend_foreignkeys([ForeignKey("public", "users", "id", "public", "orders", "user_id")])
+    columns = {
+        "users": [("id", "integer"), ("name", "text")],
+        "orders": [("id", "integer"), ("user_id", "integer")],
+        "items": [("label", "text")],
+    }
+    completer.column_loader = Mock(
+        side_effect=lambda schema, relname: [(schema, relname, col, typ, False, None) for col, typ in columns[relname]]
+    )
+    return completer
+
+
+def scoped_columns(completer, *names):
+    tables = [TableReference("public", name, None, False) for name in names]
+    return {tbl.name: {col.name: col for col in cols} for tbl, cols in completer.populate_scoped_cols(tables).items()}
+
+
+def test_lazy_columns_are_loaded_on_first_use(lazy_completer):
+    assert lazy_completer.dbmetadata["tables"]["public"]["users"] == {}
+    assert not lazy_completer.column_loader.called
+
+    cols = scoped_columns(lazy_completer, "users")
+    assert list(cols["users"]) == ["id", "name"]
+    lazy_completer.column_loader.assert_called_once_with("public", "users")
+
+    scoped_columns(lazy_completer, "users")
+    assert lazy_completer.column_loader.call_count == 1
+
+
+def test_lazy_columns_get_foreign_keys(lazy_completer):
+    fk = ForeignKey("public", "users", "id", "public", "orders", "user_id")
+    cols = scoped_columns(lazy_completer, "users", "orders")
+    assert cols["users"]["id"].foreignkeys == (fk,)
+    assert cols["orders"]["user_id"].foreignkeys == (fk,)
+    assert cols["orders"]["id"].foreignkeys == ()
+
+
+def test_lazy_columns_least_recently_used_are_unloaded(lazy_completer):
+    scoped_columns(lazy_completer, "users", "orders")
+    scoped_columns(lazy_completer, "users")
+    scoped_columns(lazy_completer, "items")
+
+    tables = lazy_completer.dbmetadata["tables"]["public"]
+    assert list(tables["users"]) == ["id", "name"]
+    assert list(tables["items"]) == ["label"]
+    assert tables["orders"] == {}
+
+    scoped_columns(lazy_completer, "orders")
+    assert lazy_completer.column_loader.call_count == 4
+
+
+def test_lazy_columns_failed_load_is_retried(lazy_completer):
+    lazy_completer.column_loader.side_effect = lambda schema, relname: None
+    assert scoped_columns(lazy_completer, "users") == {}
+    assert scoped_columns(lazy_completer, "users") == {}
+    assert lazy_completer.column_loader.call_count == 2
+
+
+def test_lazy_columns_replace_all_completions(lazy_completer):
+    """Completions iterate all_completions unlocked, it mustn't change under them"""
+    before = lazy_completer.all_completions
+    names = set(before)
+    scoped_columns(lazy_completer, "users")
+    assert before == names
+    assert {"id", "name"} <= lazy_completer.all_completions
+
+
+@pytest.fixture
+def session_completer():
+    completer = pgcompleter.PGCompleter(smart_completion=True)
+    completer.extend_schemata(["public"])
+    completer.set_search_path(["public"])
+    completer.extend_relations([("public", "users"), ("public", "user_emails"), ("public", "orders")], kind="tables")
+    completer.extend_functions([])
+    return completer
+
+
+def completion_texts(completer, text):
+    document = Document(text=text, cursor_position=len(text))
+    return [c.text for c in completer.get_completions(document, None)]
+
+
+def test_completions_are_narrowed_while_typing(session_completer):
+    assert "user_emails" in completion_texts(session_completer, "SELECT * FROM u")
+    session_completer.populate_schema_objects = Mock(side_effect=AssertionError("not narrowed"))
+    assert completion_texts(session_completer, "SELECT * FROM use") == ["user_emails", "users"]
+    assert completion_texts(session_completer, "SELECT * FROM usere") == ["user_emails"]
+
+
+@pytest.mark.parametrize("count", [2, 50])
+def test_schema_names_are_in_a_stable_order(count):
+    completer = pgcompleter.PGCompleter()
+    objects = {"t{}".format(i): None for i in range(count, 0, -1)}
+    names = {"t{}".format(i) for i in range(0, 20)}
+    # Whichever of names and objects is iterated over
+    assert completer._schema_names(objects, names) == sorted(objects.keys() & names)
+
+
+@pytest.mark.parametrize("text", ["SELECT * FROM pg_", "SELECT * FROM u.", "SELECT * FROM u WHERE"])
+def test_completions_are_not_narrowed_on_context_change(session_completer, text, monkeypatch):
+    completion_texts(session_completer, "SELECT * FROM u")
+    suggest_type = Mock(wraps=pgcompleter.suggest_type)
+    monkeypatch.setattr(pgcompleter, "suggest_type", suggest_type)
+    completion_texts(session_completer, text)
+    assert suggest_type.called
+
+
+def test_completion_session_is_reset_with_search_path(session_completer):
+    completion_texts(session_completer, "SELECT * FROM u")
+    assert session_completer._session is not None
+    session_completer.set_search_path(["public"])
+    assert session_completer._session is None
+
+
+@pytest.mark.parametrize("smart_completion", [True, False])
+def test_max_completions_keeps_the_best(smart_completion):
+    completer = pgcompleter.PGCompleter(smart_completion=smart_completion)
+    completer.extend_schemata(["public"])
+    completer.set_search_path(["public"])
+    completer.extend_relations([("public", "t{}".format(i)) for i in range(50)], kind="tables")
+    completer.extend_functions([])
+    text = "SELECT * FROM t1"
+    document = Document(text=text, cursor_position=len(text))
+    completer.max_completions = 0
+    all_completions = completer.get_completions(document, None)
+    assert len(all_completions) > 5
+
+    completer.max_completions = 5
+    assert completer.get_completions(document, None) == all_completions[:5]
+    assert list(completer.iter_completions(document, None)) == all_completions[:5]
+
+
+def test_newer_completion_request_cancels_matching():
+    completer = pgcompleter.PGCompleter(smart_completion=False)
+    words = ["word{}".format(i) for i in range(1000)]
+
+    class Words(list):
+        def __iter__(self):
+            for i, word in enumerate(list.__iter__(self)):
+                if i == 1:
+                    # Another key is pressed
+                    completer._latest_request += 1
+                yield word
+
+    completer.all_completions = Words(words)
+    document = Document(text="word", cursor_position=4)
+    assert completer.get_completions(document, None) == []
+
+    completer.all_completions = words
+    assert len(completer.get_completions(document, None)) == completer.max_completions
+
+
+def test_dropped_names_are_removed_from_all_completions():
+    completer = pgcompleter.PGCompleter(smart_completion=False)
+    completer.extend_schemata(["public"])
+    completer.extend_relations([("public", "users"), ("public", "orders"), ("public", "id")], kind="tables")
+    completer.extend_columns(
+        [("public", "users", "id", "int", False, None), ("public", "users", "email", "text", False, None)],
+        kind="tables",
+    )
+    completer.extend_columns([("public", "orders", "id", "int", False, None)], kind="tables")
+
+    completer.drop_relations([("public", "users"), ("public", "id")], kind="tables")
+
+    assert "users" not in completer.all_completions
+    assert "email" not in completer.all_completions
+    # Still the name of a column of orders.
+    assert "id" in completer.all_completions
+    assert "orders" in completer.all_completions
@@ -1,4 +1,8 @@
+import io
+import os
 import re
+import signal
+import threading
 from textwrap import dedent
 
 import psycopg
@@ -9,6 +13,7 @@ from utils import run, dbtest, requires_json, requires_jsonb
 
 from pgcli.main import PGCli, exception_formatter as main_exception_formatter
 from pgcli.packages.parseutils.meta import FunctionMetadata
+from pgcli.pgexecute import StreamedRows
 
 
 def function_meta_data(
@@ -644,6 +649,192 @@ def test_on_error_stop(executor, exception_formatter):
     assert len(result) == 2
 
 
+@dbtest
+def test_run_file(executor, exception_formatter):
+    script = io.StringIO("select 1;\n-- a comment\nselect 'a;b' as x\n;\nerror;\nselect 2;\n")
+    result = list(executor.run_file(script, on_error_resume=True, exception_formatter=exception_formatter))
+    assert [r[4] for r in result] == ["select 1", "-- a comment\nselect 'a;b' as x", "error", "select 2"]
+    assert [r[5] for r in result] == [True, True, False, True]
+    assert list(result[1][1]) == [("a;b",)]
+
+
+@dbtest
+def test_run_file_stops_reading_on_error(executor, exception_formatter):
+    script = io.StringIO("select 1;\nerror;\nselect 2;\n")
+    result = list(executor.run_file(script, on_error_resume=False, exception_formatter=exception_formatter))
+    assert len(result) == 2
+    assert script.readline() == "select 2;\n"
+
+
+@dbtest
+def test_run_file_copy_from_stdin(executor):
+    script = io.StringIO(
+        "create temp table copy_test (a int, b text);\ncopy copy_test from stdin;\n1\tx\n2\ty\n\\.\nselect * from copy_test order by a;\n"
+    )
+    result = list(executor.run_file(script))
+    assert result[1][3] == "COPY 2"
+    assert list(result[2][1]) == [(1, "x"), (2, "y")]
+
+
+@dbtest
+def test_streamed_rows(executor):
+    result = list(executor.run("select generate_series(1, 5) as n", fetch_count=2))
+    title, rows, headers, status = result[0][:4]
+    assert headers == ["n"] and status == "SELECT"
+    assert executor.conn.info.transaction_status == psycopg.pq.TransactionStatus.INTRANS
+    assert list(rows.batches()) == [[(1,), (2,)], [(3,), (4,)], [(5,)]]
+    assert rows.rowcount == 5
+    # The transaction started for the cursor ends with it
+    assert executor.conn.info.transaction_status == psycopg.pq.TransactionStatus.IDLE
+
+
+@dbtest
+@pytest.mark.parametrize(
+    "sql, streamed",
+    [
+        ("select 1", True),
+        ("-- comment\n(values (1))", True),
+        ("select 1 into temp streamed_into", False),
+        ("show server_version", False),
+        ("explain select 1", False),
+    ],
+)
+def test_streamed_queries(executor, sql, streamed):
+    rows = list(executor.run(sql, fetch_count=10))[-1][1]
+    assert isinstance(rows, StreamedRows) == streamed
+
+
+@dbtest
+def test_streamed_rows_closed_by_next_statement(executor):
+    run(executor, "begin")
+    rows = list(executor.run("select generate_series(1, 5)", fetch_count=2))[0][1]
+    it = iter(rows)
+    assert next(it) == (1,)
+    assert not rows.closed
+    assert list(list(executor.run("select 2"))[0][1]) == [(2,)]
+    assert rows.closed
+    # The user's transaction is left open
+    assert executor.conn.info.transaction_status == psycopg.pq.TransactionStatus.INTRANS
+    run(executor, "rollback")
+
+
+@dbtest
+def test_streamed_rows_received(executor):
+    rows = list(executor.run("select generate_series(1, 1000)", fetch_count=1000))[0][1]
+    assert executor.rows_received() == 0
+    fetchmany = psycopg.ServerCursor.fetchmany
+    with patch.object(psycopg.ServerCursor, "fetchmany", autospec=True, side_effect=fetchmany) as mock_fetchmany:
+        assert len(list(rows)) == 1000
+    # Counted as they come
+    assert [call.args[1] for call in mock_fetchmany.call_args_list][:3] == [100, 200, 400]
+    assert executor.rows_received() == rows.received == 1000
+    list(executor.run("select 1"))
+    assert executor.rows_received() == 1
+    list(executor.run("set search_path = public"))
+    assert executor.rows_received() is None
+
+
+@dbtest
+def test_streamed_rows_error(executor):
+    rows = list(executor.run("select 1 / (3 - n) from generate_series(1, 5) n", fetch_count=1))[0][1]
+    with pytest.raises(psycopg.errors.DivisionByZero):
+        list(rows)
+    assert rows.rowcount == 2
+    assert executor.conn.info.transaction_status == psycopg.pq.TransactionStatus.IDLE
+
+
+@dbtest
+@pytest.mark.parametrize("fetch_count", [0, 2])
+@pytest.mark.parametrize("count, more_rows", [(2, False), (3, False), (4, True), (100000, True)])
+def test_limited_rows(executor, fetch_count, count, more_rows):
+    sql = f"select generate_series(1, {count})"
+    rows = list(executor.run(sql, fetch_count=fetch_count, row_limit=lambda sql: 3))[0][1]
+    fetchmany = psycopg.ServerCursor.fetchmany
+    with patch.object(psycopg.ServerCursor, "fetchmany", autospec=True, side_effect=fetchmany) as mock_fetchmany:
+        assert [row[0] for row in rows] == list(range(1, min(count, 3) + 1))
+    assert rows.more_rows == more_rows
+    # At most one more row than shown is fetched
+    assert sum(call.args[1] for call in mock_fetchmany.call_args_list) <= 4
+
+
+@dbtest
+@pytest.mark.parametrize(
+    "sql",
+    [
+        "select g, 'log into' from generate_series(1, 10) g",
+        "select g /* into */ from generate_series(1, 10) g",
+        "select g as \"into\" from generate_series(1, 10) g",
+        # Not through a server-side cursor
+        "with t as (select generate_series(1, 10) g) select g from t",
+    ],
+)
+def test_limited_rows_of_other_queries(executor, sql):
+    rows = list(executor.run(sql, row_limit=lambda sql: 3))[0][1]
+    assert len(list(rows)) == 3
+    assert rows.more_rows
+
+
+@dbtest
+def test_limited_rows_stop_query(executor):
+    run(executor, "create temp sequence s")
+    rows = list(executor.run("select nextval('s') from generate_series(1, 5000)", row_limit=lambda sql: 1000))[0][1]
+    assert len(list(rows)) == 1000
+    # The query stopped once the rows, and one more, were fetched
+    assert run(executor, "select last_value from s")[3] == "| 1001       |"
+
+
+@dbtest
+@pytest.mark.parametrize(
+    "sql",
+    [
+        "select nocol from generate_series(1, 10) g",
+        "select g,\n\tnocol\nfrom generate_series(1, 10) g",
+        "select g from generate_series(1, 10) g where g = 'nan'::int",
+        "select 1 +",
+    ],
+)
+@pytest.mark.parametrize("verbose_errors", [False, True])
+def test_limited_rows_error(executor, sql, verbose_errors):
+    def formatter(e):
+        return main_exception_formatter(e, verbose_errors=verbose_errors)
+
+    limited = list(executor.run(sql, exception_formatter=formatter, row_limit=lambda sql: 3))
+    assert executor.conn.info.transaction_status == psycopg.pq.TransactionStatus.IDLE
+    # The same as without the server-side cursor
+    assert limited == list(executor.run(sql, exception_formatter=formatter))
+    assert "DECLARE" not in limited[0][3]
+
+
+def interrupt_after(seconds):
+    timer = threading.Timer(seconds, os.kill, (os.getpid(), signal.SIGINT))
+    timer.start()
+    return timer
+
+
+@dbtest
+def test_cancel_on_interrupt(executor):
+    run(executor, "create temp table kept(x int)")
+    backend_pid = executor.conn.info.backend_pid
+    with executor.cancel_on_interrupt():
+        interrupt_after(0.2)
+        result = list(executor.run("select pg_sleep(10)", exception_formatter=main_exception_formatter))
+    assert "canceling statement due to user request" in result[0][3]
+    assert executor.cancelled_at is not None
+    # The session is kept
+    assert executor.conn.info.backend_pid == backend_pid
+    assert run(executor, "select count(*) from kept")[-1] == "SELECT 1"
+
+
+@dbtest
+def test_cancel_on_interrupt_without_query(executor):
+    with pytest.raises(KeyboardInterrupt):
+        with executor.cancel_on_interrupt():
+            interrupt_after(0).join()
+            threading.Event().wait(1)
+    assert executor.cancelled_at is None
+    assert signal.getsignal(signal.SIGINT) is signal.default_int_handler
+
+
 # @dbtest
 # def test_unicode_notices(executor):
 #     sql = "DO language plpgsql $$ BEGIN RAISE NOTICE '有人更改'; END $$;"
@@ -786,3 +977,79 @@ def test_virtual_database(executor):
     with patch.object(executor, "conn", virtual_connection):
         result = run(executor, "select 1")
         assert "Command not supported" in result
+
+
+@dbtest
+@pytest.mark.parametrize("track_counts", [True, False])
+def test_catalog_fingerprint(executor, track_counts):
+    if track_counts and executor.conn.info.server_version < 150000:
+        pytest.skip("pg_stat_force_next_flush() requires PostgreSQL 15")
+
+    def change(sql):
+        run(executor, sql)
+        if track_counts:
+            # Don't wait for the statistics counters to be reported.
+            run(executor, "select pg_stat_force_next_flush()")
+
+    run(executor, "set track_counts = {}".format("on" if track_counts else "off"))
+    before = executor.catalog_fingerprint()
+    assert before
+    assert executor.catalog_fingerprint() == before
+
+    change("create table fingerprinted(x int)")
+    after_create = executor.catalog_fingerprint()
+    assert after_create != before
+
+    change("alter table fingerprinted rename column x to y")
+    assert executor.catalog_fingerprint() != after_create
+
+
+@dbtest
+def test_catalog_fingerprint_from_statistics(executor):
+    # The catalog tables aren't scanned when the counters are collected.
+    with patch.object(executor, "catalog_fingerprint_query", "select 1/0"):
+        assert executor.catalog_fingerprint()
+
+
+@dbtest
+def test_catalog_snapshot_since_previous(executor):
+    run(executor, "create table parent(id int primary key)")
+    run(executor, "create table child(parent_id int references parent(id))")
+    run(executor, "create table dropped(x int)")
+    run(executor, "create function func1() returns int language sql as $$select 1$$")
+    previous = executor.catalog_snapshot()
+
+    run(executor, "alter table child add column x int default 0")
+    run(executor, "drop table dropped")
+    run(executor, "create function func2() returns int language sql as $$select 2$$")
+    with patch.object(executor, "_drop_snapshot_objects", wraps=executor._drop_snapshot_objects) as drop:
+        snapshot = executor.catalog_snapshot(previous)
+
+    full = executor.catalog_snapshot()
+    assert snapshot._replace(xmin=None) == full._replace(xmin=None)
+    assert snapshot.relations != previous.relations
+    drop.assert_called_once()
+    # Only the changed objects were queried.
+    since = previous.xmin & 0xFFFFFFFF
+    with executor.conn.cursor() as cur:
+        cur.execute(executor.snapshot_relations_query, {"since": since})
+        assert {row[4] for row in cur} == {"child"}
+        cur.execute(executor.snapshot_functions_query, {"since": since})
+        assert {row[3] for row in cur} == {"func2"}
+    assert executor.catalog_snapshot(full) == executor.catalog_snapshot()
+
+
+@dbtest
+def test_pipeline_catalog(executor):
+    run(executor, "create table parent(id int primary key)")
+    run(executor, "create table child(parent_id int references parent(id))")
+    run(executor, "create function func1() returns int language sql as $$select 1$$")
+    names = list(executor.catalog_queries())
+
+    pipelined = list(executor.pipeline_catalog(names))
+
+    assert [name for name, results in pipelined] == names
+    for name, results in pipelined:
+        assert results == list(getattr(executor, name)())
+    # The connection is usable again afterwards.
+    assert run(executor, "select 1") == ["+----------+", "| ?column? |", "|----------|", "| 1        |", "+----------+", "SELECT 1"]
@@ -1,4 +1,6 @@
-from pgcli.packages.prioritization import PrevalenceCounter
+import pytest
+
+from pgcli.packages.prioritization import PrevalenceCounter, keyword_regexs
 
 
 def test_prevalence_counter():
@@ -18,3 +20,32 @@ def test_prevalence_counter():
     names = ["foo", "bar", "baz"]
     name_counts = [counter.name_count(x) for x in names]
     assert name_counts == [3, 2, 2]
+
+
+@pytest.mark.parametrize(
+    "sql",
+    [
+        "REFRESH MATERIALIZED VIEW foo; CREATE MATERIALIZED\n\tVIEW bar",
+        "select * from foo order  by a, b group by",
+        "DELETE FROM foo; delete_from; DELETE, FROM; DELETE\nFROM",
+        "SELECTED selects _select select_ SELECT1 (select)",
+        "insert insert into INTO into",
+        "ſelect çselect",
+    ],
+)
+def test_keyword_counts_same_as_regexes(sql):
+    expected = {kw: len(regex.findall(sql)) for kw, regex in keyword_regexs.items()}
+    counter = PrevalenceCounter()
+    counter.update_keywords(sql)
+    assert {kw: counter.keyword_count(kw) for kw in keyword_regexs} == expected
+
+
+def test_prevalence_counter_updates():
+    counter = PrevalenceCounter()
+    counter.load({"SELECT": 2.5}, {"foo": 1})
+    counter.update("SELECT * FROM foo")
+    assert (counter.keyword_count("SELECT"), counter.name_count("foo")) == (3.5, 2)
+
+    keywords, names = counter.take_updates()
+    assert (keywords["SELECT"], keywords["FROM"], dict(names)) == (1, 1, {"foo": 1})
+    assert counter.take_updates() == ({}, {})
@@ -0,0 +1,72 @@
+import io
+
+import pytest
+
+from pgcli.script_progress import ScriptProgress, format_size
+
+
+class Terminal(io.StringIO):
+    def isatty(self):
+        return True
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.parametrize(
+    "size, expected",
+    [
+        (0, "0 bytes"),
+        (1023, "1023 bytes"),
+        (1024, "1.0 kB"),
+        (1536 * 1024, "1.5 MB"),
+        (3 * 1024**4, "3072.0 GB"),
+    ],
+)
+def test_format_size(size, expected):
+    assert format_size(size) == expected
+
+
+def test_progress_is_throttled():
+    out, clock = Terminal(), Clock()
+    progress = ScriptProgress("dump.sql", 4 * 1024**2, file=out, interval=1, clock=clock)
+    progress.update(0, 0)
+    clock.now = 0.5
+    progress.update(10, 1024**2)
+    assert out.getvalue() == ""
+    clock.now = 2
+    progress.update(100, 2 * 1024**2)
+    assert out.getvalue() == "\r\\i dump.sql: 100 statements, 2.0 MB of 4.0 MB (50%), 1.0 MB/s\r"
+
+
+def test_progress_rate_counts_from_resumed_offset():
+    progress = ScriptProgress("dump.sql", file=Terminal(), clock=Clock())
+    progress.update(5000, 1024**3)
+    assert progress.format(6000, 1024**3 + 2 * 1024**2, 2) == "\\i dump.sql: 6,000 statements, 1.0 GB, 1.0 MB/s"
+
+
+def test_clear():
+    out, clock = Terminal(), Clock()
+    progress = ScriptProgress("a.sql", file=out, interval=1, clock=clock)
+    progress.clear()
+    assert out.getvalue() == ""
+    clock.now = 1
+    progress.update(1, 10)
+    progress.clear()
+    _, shown, _, cleared, _ = out.getvalue().split("\r")
+    assert shown.startswith("\\i a.sql: 1 statements")
+    assert cleared == " " * len(shown)
+
+
+def test_nothing_shown_unless_terminal():
+    out, clock = io.StringIO(), Clock()
+    progress = ScriptProgress("a.sql", file=out, interval=0, clock=clock)
+    clock.now = 1
+    progress.update(1, 10)
+    progress.clear()
+    assert out.getvalue() == ""
@@ -15,6 +15,9 @@ from pgcli.packages.sqlcompletion import (
     Join,
 )
 from pgcli.packages.parseutils.tables import TableReference
+from pgcli.packages.parseutils.utils import parse
+from unittest.mock import patch
+import sqlparse
 import pytest
 
 
@@ -928,3 +931,15 @@ def test_suggestion_when_setting_search_path():
     sql_set_search_path_to = "SET search_path TO "
     suggestion_set_search_path_to = suggest_type(sql_set_search_path_to, sql_set_search_path_to)
     assert set(suggestion_set_search_path_to) == {Schema()}
+
+
+def test_statement_is_parsed_once():
+    parse.cache_clear()
+    text = "UPDATE foo f SET a = 1 WHERE "
+    with patch("sqlparse.parse", side_effect=sqlparse.parse) as sqlparse_parse:
+        suggestions = suggest_type(text, text)
+        assert sqlparse_parse.call_count == 1
+        # Only the full text has changed, the statement before the word is
+        # still cached
+        assert suggest_type(text + "ab", text + "ab") == suggestions
+    assert sorted(c.args[0] for c in sqlparse_parse.call_args_list) == sorted([text, text + "ab", "ab"])